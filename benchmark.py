@@ -1,12 +1,12 @@
 import argparse
 from timeit import timeit
-from collections import deque, defaultdict
-import math
+from collections import defaultdict
 
 from matplotlib import pyplot as plt
 
-from graphy.graph import random_graph, Graph
-from graphy.displaygraph import DisplayGraph
+from graphy.graph import random_graph
+from graphy.displaygraph import DisplayGraph, np
+from graphy.headless_viewer import HeadlessViewer
 
 try:
     from graphy.displaygraph import config
@@ -18,48 +18,19 @@ else:
 
 
 class BenchmarkDisplayGraph(DisplayGraph):
-    """Subclass of DisplayGraph for benchmarking. Doesn't create a window
-    to display output and copies the graph it is initialized with, but
-    otherwise is identical."""
+    """Subclass of DisplayGraph for benchmarking. Draws with a HeadlessViewer
+    instead of creating a window and copies the graph it is initialized
+    with, but otherwise is identical."""
 
     def __init__(self, graph, threaded=False, num_threads=4, update_algo=None):
-
-        if not isinstance(graph, Graph):
-            raise Exception("DisplayGraph must be initialized with a Graph")
-
-        self.graph = graph.copy()
-
-        # Layout and display related setup
-        self.size = int(math.sqrt(len(self.graph.vertices)))
-
-        self.xscale = (1500 // 2) // self.size
-        self.yscale = (1028 // 2) // self.size
-        self.xoffset = -1500 // 4
-        self.yoffset = -1028 // 4
-
-        self.view = None
-
-        # Graph setup
-        self.vertices = []
-        self.edges = []
-        self.populate()
-
-        # Initialize queue for selected vertices
-        self.selected_queue = deque(maxlen=2)
-
-        self.threaded = threaded
-        self.num_threads = num_threads
-
-        # Selected update method
-        if update_algo == 'c_update' and fdag_imported is True:
-            self.update = self.c_update
-            config(self.c1, self.c2, self.c3, self.c4, self.threaded, self.num_threads)
-        else:
-            self.update = self.python_update
+        super(BenchmarkDisplayGraph, self).__init__(
+            graph.copy(), width=1500, height=1028, threaded=threaded,
+            num_threads=num_threads, update_algo=update_algo,
+            viewer=HeadlessViewer)
 
     def run_benchmark(self):
-        for x in range(DisplayGraph.M):
-            self.update()
+        # Always run all M iterations so the timings are comparable
+        self.layout(DisplayGraph.M, tol=0)
 
 
 def time_it(update_algo, threaded=False, num_threads=0, number=10):
@@ -80,6 +51,18 @@ def benchmark(graph, number=10):
 
         print("Python results: {}".format(p_results))
 
+        if args.barnes_hut:
+            p_results = time_it('python_bh_update', number=number)
+            results.append(('python barnes-hut', p_results))
+
+            print("Python results(barnes-hut): {}".format(p_results))
+
+    if np is not None:
+        n_results = time_it('numpy_update', number=number)
+        results.append(('numpy', n_results))
+
+        print("NumPy results: {}".format(n_results))
+
     if fdag_imported:
 
         # Single Threaded
@@ -88,6 +71,12 @@ def benchmark(graph, number=10):
 
         print("C results(single thread): {}".format(c_results))
 
+        if args.barnes_hut:
+            c_results = time_it('c_bh_update', number=number, threaded=False)
+            results.append(('C barnes-hut', c_results))
+
+            print("C results(barnes-hut): {}".format(c_results))
+
         # Threaded
         num_threads = 1
 
@@ -107,6 +96,8 @@ def parse_args():
 
     parser.add_argument("-np", "--no-python", action="store_true",
                         help="Don't run python benchmark")
+    parser.add_argument("-bh", "--barnes-hut", action="store_true",
+                        help="Also run the Barnes-Hut benchmarks")
     parser.add_argument("-v", "--vertices", type=int, help="Number of vertices in graph")
     parser.add_argument("-e", "--edges", type=int, help="Number of edges in graph")
     parser.add_argument("-pl", "--plot", action="store_true", help="Plot results")
@@ -1,8 +1,10 @@
 from graphy.graph import random_graph
 from graphy.displaygraph import DisplayGraph
 from graphy.components import Dragger, Pathfinder
+from graphy.layoutcache import LayoutCache
 
 import argparse
+import random
 
 
 def parse_args():
@@ -11,10 +13,14 @@ def parse_args():
     group = parser.add_mutually_exclusive_group()
     group.add_argument("-c", "--c-update", action="store_true")
     group.add_argument("-p", "--python-update", action="store_true")
+    group.add_argument("-n", "--numpy-update", action="store_true")
 
+    parser.add_argument("-bh", "--barnes-hut", action="store_true", help="Approximate repulsion with a Barnes-Hut quadtree")
     parser.add_argument("-v", "--vertices", type=int, help="Number of vertices in graph")
     parser.add_argument("-e", "--edges", type=int, help="Number of edges in graph")
     parser.add_argument("-nc", "--not-connected", action="store_true", help="Don't automatically connect all components")
+    parser.add_argument("-ml", "--multilevel", action="store_true", help="Start the layout from a multilevel placement")
+    parser.add_argument("-lc", "--layout-cache", help="Directory to cache finished layouts in")
     parser.add_argument("-nt", "--num-threads", type=int, help="Number of threads to use during layout if using C-extension")
 
     return parser.parse_args()
@@ -36,14 +42,32 @@ def get_settings(args):
 
     if args.python_update:
         dgraph_args['update_algo'] = 'python_update'
+    elif args.numpy_update:
+        dgraph_args['update_algo'] = 'numpy_update'
     else:
         dgraph_args['update_algo'] = 'c_update'
         if args.num_threads:
             dgraph_args['num_threads'] = args.num_threads
 
+    if args.barnes_hut:
+        dgraph_args['update_algo'] = dgraph_args['update_algo'].replace('_update', '_bh_update')
+
+    if args.multilevel:
+        dgraph_args['multilevel'] = True
+
+    if args.layout_cache:
+        dgraph_args['cache'] = LayoutCache(args.layout_cache)
+
     return graph_args, dgraph_args
 
 
+def add_vertex(dg, pf):
+    """Add a vertex joined to the selected vertices, or to a random one"""
+    neighbors = list(pf.selected_queue) or [random.randrange(len(dg.vertices))]
+    dg.add_vertex(neighbors)
+    dg.redraw()
+
+
 if __name__ == '__main__':
 
     args = parse_args()
@@ -61,6 +85,10 @@ if __name__ == '__main__':
     # Interface setup
     btn_x = -dg.width//2 + 20
     btn_y = dg.height//2 - 34
+    dg.view.add_button(dg.view.Button(btn_x, btn_y - 180, "add vertex", lambda: add_vertex(dg, pf)))
+    dg.view.add_button(dg.view.Button(btn_x, btn_y - 150, "layout", dg.start_layout))
+    dg.view.add_button(dg.view.Button(btn_x, btn_y - 120, "bi a_star", pf.draw_bidirectional_a_star))
+    dg.view.add_button(dg.view.Button(btn_x, btn_y - 90, "bi dijkstra", pf.draw_bidirectional_dijkstra))
     dg.view.add_button(dg.view.Button(btn_x, btn_y - 60, "a_star", pf.draw_a_star))
     dg.view.add_button(dg.view.Button(btn_x, btn_y - 30, "dijkstra", pf.draw_dijkstra))
     dg.view.add_button(dg.view.Button(btn_x, btn_y, "new graph", dg.new_graph))
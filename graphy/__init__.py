@@ -5,10 +5,18 @@ except ImportError:
     print("Install Pygame for much better performance!")
 
 try:
-    from fdag import fdag, config
+    from fdag import fdag, step, run, config, relax
 except ImportError:
     fdag = None
+    step = None
+    run = None
     config = None
+    relax = None
     print("Failed to import fdag. C-extensions are disabled")
 else:
     fdag_imported = True
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
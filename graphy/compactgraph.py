@@ -0,0 +1,365 @@
+from array import array
+from collections import deque
+import math
+import mmap
+import os
+import struct
+
+from graphy.graph import Graph, Vertex
+from graphy.search import shortest_path, bidirectional_shortest_path
+from graphy.distances import distances
+
+
+MAGIC = b'GCSR'
+VERSION = 1
+HEADER = struct.Struct('=4sIQQII')  # magic, version, V, len(targets), flags, 0
+
+# Optional sections of a saved graph
+COORDINATES = 1
+WEIGHTS = 2
+
+
+def _sections(V, n, flags):
+    """Returns the (start, end, typecode) of every section of a saved graph
+    with V vertices, n entries in targets and the given flags, keyed by
+    name. Each one starts on an 8 byte boundary so it can be read in
+    place."""
+    sections = {}
+    pos = HEADER.size
+    layout = [('offsets', 'q', V + 1), ('targets', 'i', n)]
+    if flags & COORDINATES:
+        layout += [('xs', 'd', V), ('ys', 'd', V)]
+    if flags & WEIGHTS:
+        layout.append(('weights', 'd', n))
+
+    for name, typecode, count in layout:
+        end = pos + count * array(typecode).itemsize
+        sections[name] = (pos, end, typecode)
+        pos = (end + 7) & ~7
+    return sections
+
+
+class CompactVertex(object):
+    """Lightweight view of one vertex of a CompactGraph. Supports the same
+    operations as Vertex but holds nothing except the graph and index."""
+
+    __slots__ = ('graph', 'i')
+
+    def __init__(self, graph, i):
+        self.graph = graph
+        self.i = i
+
+    def __contains__(self, v_index):
+        return v_index in self.neighbors()
+
+    def __iter__(self):
+        return iter(self.neighbors())
+
+    def __len__(self):
+        return self.graph.offsets[self.i + 1] - self.graph.offsets[self.i]
+
+    def __repr__(self):
+        return "x: {0}, y: {1}\nneighbors: {2}".format(self.x, self.y,
+                                                       set(self.neighbors()))
+
+    def neighbors(self):
+        """Returns a memoryview of the indices of the neighbors"""
+        g = self.graph
+        return memoryview(g.targets)[g.offsets[self.i]:g.offsets[self.i + 1]]
+
+    @property
+    def x(self):
+        return self.graph.xs[self.i]
+
+    @x.setter
+    def x(self, value):
+        self.graph.xs[self.i] = value
+        self.graph.weights = None
+
+    @property
+    def y(self):
+        return self.graph.ys[self.i]
+
+    @y.setter
+    def y(self, value):
+        self.graph.ys[self.i] = value
+        self.graph.weights = None
+
+    @property
+    def marked(self):
+        return bool(self.graph.marked[self.i])
+
+    @marked.setter
+    def marked(self, value):
+        self.graph.marked[self.i] = bool(value)
+
+    def distance_to(self, w):
+        """Returns the distance from self to vertex w"""
+        return math.sqrt((self.x - w.x)**2 + (self.y - w.y)**2)
+
+    def cost_to(self, w):
+        return self.distance_to(w)
+
+
+class VertexList(object):
+    """Sequence of CompactVertex views, created on demand"""
+
+    __slots__ = ('graph',)
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __len__(self):
+        return len(self.graph.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("vertex index out of range")
+        return CompactVertex(self.graph, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield CompactVertex(self.graph, i)
+
+
+class CompactGraph(object):
+    """Undirected graph stored in compressed sparse row form. The neighbors
+    of vertex v are targets[offsets[v]:offsets[v + 1]]. Coordinates and
+    marks live in flat arrays rather than per-vertex objects."""
+
+    def __init__(self, offsets, targets, xs=None, ys=None):
+        V = len(offsets) - 1
+
+        self.offsets = offsets
+        self.targets = targets
+        self.xs = xs if xs is not None else array('d', [0.0]) * V
+        self.ys = ys if ys is not None else array('d', [0.0]) * V
+        self.marked = bytearray(V)
+        self.weights = None
+        self.vertices = VertexList(self)
+
+    def __repr__(self):
+        return '\n'.join([str(v) for v in self.vertices])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @classmethod
+    def from_edges(cls, V, edges, xs=None, ys=None):
+        """Build a CompactGraph with V vertices from an iterable of (v, w)
+        pairs. Self loops and duplicate edges are dropped."""
+        neighbors = [set() for _ in range(V)]
+        for v, w in edges:
+            if v != w:
+                neighbors[v].add(w)
+                neighbors[w].add(v)
+
+        offsets = array('q', [0])
+        targets = array('i')
+        for adjacent in neighbors:
+            targets.extend(sorted(adjacent))
+            offsets.append(len(targets))
+
+        return cls(offsets, targets, xs, ys)
+
+    @classmethod
+    def from_graph(cls, graph):
+        """Build a CompactGraph with the same edges and coordinates as a
+        Graph. Coordinates of None are stored as nan."""
+        offsets = array('q', [0])
+        targets = array('i')
+        xs = array('d')
+        ys = array('d')
+
+        for v in graph.vertices:
+            targets.extend(sorted(v))
+            offsets.append(len(targets))
+            xs.append(float('nan') if v.x is None else v.x)
+            ys.append(float('nan') if v.y is None else v.y)
+
+        compact = cls(offsets, targets, xs, ys)
+        for i, v in enumerate(graph.vertices):
+            compact.marked[i] = v.marked
+
+        return compact
+
+    def to_graph(self):
+        """Returns a Graph with the same edges, coordinates and marks"""
+        graph = Graph(V=0)
+
+        for i in range(len(self)):
+            x, y = self.xs[i], self.ys[i]
+            vertex = Vertex(None if math.isnan(x) else x,
+                            None if math.isnan(y) else y)
+            vertex._neighbors = set(self.targets[self.offsets[i]:self.offsets[i + 1]])
+            vertex.marked = bool(self.marked[i])
+            graph.vertices.append(vertex)
+
+        return graph
+
+    def neighbors(self, v):
+        return self.targets[self.offsets[v]:self.offsets[v + 1]]
+
+    def cost(self, v, w):
+        return math.sqrt((self.xs[v] - self.xs[w])**2 +
+                         (self.ys[v] - self.ys[w])**2)
+
+    def edges(self, v):
+        """Returns (w, cost) pairs for every neighbor w of v. The costs are
+        cached in an array parallel to targets until clear_weights()."""
+        if self.weights is None:
+            xs, ys = self.xs, self.ys
+            self.weights = array('d', [0.0]) * len(self.targets)
+            for u in range(len(self)):
+                for i in range(self.offsets[u], self.offsets[u + 1]):
+                    w = self.targets[i]
+                    self.weights[i] = math.sqrt((xs[u] - xs[w])**2 +
+                                                (ys[u] - ys[w])**2)
+
+        begin, end = self.offsets[v], self.offsets[v + 1]
+        return zip(self.targets[begin:end], self.weights[begin:end])
+
+    def clear_weights(self):
+        """Forget the cached edge costs. Call this after moving vertices."""
+        self.weights = None
+
+    def connected_component(self, v):
+        """Returns the set of vertices reachable by v"""
+        offsets, targets = self.offsets, self.targets
+        marked = set()
+        q = deque([v])
+        while q:
+            v = q.popleft()
+            for w in targets[offsets[v]:offsets[v + 1]]:
+                if w not in marked:
+                    marked.add(w)
+                    q.append(w)
+        return marked
+
+    def _mark(self, v):
+        self.marked[v] = True
+
+    def dijkstra(self, start, finish, mark=True):
+        """Returns the shortest path from start to finish as a list of indices.
+        Also sets marked = True on every vertex it looks at unless mark is
+        False."""
+        result = shortest_path(start, finish, self.edges,
+                               mark=self._mark if mark else None)
+        if result is None:
+            return None
+
+        total_cost, path = result
+        print("{0:10} -> path cost: {1:10}".format("Dijkstra", total_cost))
+        return iter(path)
+
+    def a_star(self, start, finish, mark=True):
+        """Like dijkstra but orders the search by the straight line distance
+        to finish as well."""
+        heuristic = lambda v: self.cost(v, finish)
+
+        result = shortest_path(start, finish, self.edges, heuristic,
+                               mark=self._mark if mark else None)
+        if result is None:
+            return None
+
+        total_cost, path = result
+        print("{0:10} -> path cost: {1}".format("A*", total_cost))
+        return iter(path)
+
+    def bidirectional_dijkstra(self, start, finish, mark=True):
+        """Like dijkstra but searches from both ends at once, which usually
+        looks at fewer vertices on long paths."""
+        result = bidirectional_shortest_path(start, finish, self.edges,
+                                             mark=self._mark if mark else None)
+        if result is None:
+            return None
+
+        total_cost, path = result
+        print("{0:10} -> path cost: {1:10}".format("Bi-Dijkstra", total_cost))
+        return iter(path)
+
+    def bidirectional_a_star(self, start, finish, mark=True):
+        """Like a_star but searches from both ends at once"""
+        heuristic = lambda v, target: self.cost(v, target)
+
+        result = bidirectional_shortest_path(start, finish, self.edges, heuristic,
+                                             mark=self._mark if mark else None)
+        if result is None:
+            return None
+
+        total_cost, path = result
+        print("{0:10} -> path cost: {1}".format("Bi-A*", total_cost))
+        return iter(path)
+
+    def distances(self, sources, targets=None, workers=None, predecessors=False):
+        """Returns a DistanceMatrix of shortest path costs from every vertex
+        in sources to every vertex in targets (default all of them), run
+        over a pool of processes. See graphy.distances.distances."""
+        return distances(self, sources, targets, workers, predecessors)
+
+    def save(self, path, coordinates=True, weights=False):
+        """Write the graph to path: a header, then offsets, targets and
+        optionally the coordinates and the edge costs, each as raw arrays.
+        load() maps the file instead of reading it. The file is written next
+        to path and then moved over it, so a graph loaded from path can be
+        saved back to it."""
+        flags = (COORDINATES if coordinates else 0) | (WEIGHTS if weights else 0)
+        if weights and len(self):
+            self.edges(0)   # Fill in the costs
+
+        sections = _sections(len(self), len(self.targets), flags)
+        tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, len(self),
+                                    len(self.targets), flags, 0))
+                for name, (start, _, _) in sorted(sections.items(),
+                                                  key=lambda item: item[1]):
+                    f.write(b'\0' * (start - f.tell()))
+                    f.write(getattr(self, name))
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path, copy=False):
+        """Open a graph written by save(). The file is memory mapped and the
+        graph's arrays are views of it, so it opens at once whatever its
+        size, only the pages the searches touch are read, and processes
+        opening the same file share them. The mapping is read only unless
+        copy is True, in which case changes like moving vertices stay
+        private to this process."""
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY if copy
+                             else mmap.ACCESS_READ)
+
+        if len(data) < HEADER.size:
+            raise ValueError("{0} is not a saved graph".format(path))
+        magic, version, V, n, flags, _ = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{0} is not a saved graph".format(path))
+
+        sections = _sections(V, n, flags)
+        if max(end for _, end, _ in sections.values()) > len(data):
+            raise ValueError("{0} is truncated".format(path))
+
+        view = memoryview(data)
+        arrays = {name: view[start:end].cast(typecode)
+                  for name, (start, end, typecode) in sections.items()}
+
+        graph = cls(arrays['offsets'], arrays['targets'],
+                    arrays.get('xs'), arrays.get('ys'))
+        graph.weights = arrays.get('weights')
+        return graph
+
+    def copy(self):
+        new_graph = CompactGraph(array('q', self.offsets),
+                                 array('i', self.targets),
+                                 array('d', self.xs), array('d', self.ys))
+        new_graph.marked[:] = self.marked
+
+        return new_graph
@@ -1,6 +1,9 @@
 from graphy.displaygraph import DisplayGraph
+from graphy import relax as relax_edges
 
+from array import array
 from collections import deque
+import math
 
 
 class Component(object):
@@ -39,17 +42,18 @@ class Pathfinder(Component):
 
         self.selected_queue.append(i)
 
-        self.dg.draw()
+        self.dg.redraw()
 
     def display_path(self, path):
         # Highlight path vertices
         for i in path:
             self.dg.vertices[i].highlighted = True
-            self.dg.vertices[i].draw()
 
-        self.dg.draw()
+        self.dg.redraw()
 
-    def draw_dijkstra(self):
+    def draw_search(self, search):
+        """Run search(start, finish), one of the Graph path finding methods,
+        between the two selected vertices and highlight the path"""
         # Clear any previous highlighted vertices
         for v in self.dg.vertices:
             v.v.marked = False
@@ -58,62 +62,118 @@ class Pathfinder(Component):
 
         if len(self.selected_queue) == 2:
             a, b = iter(self.selected_queue)
-            path = self.dg.graph.dijkstra(a, b)
+            path = search(a, b)
 
             self.display_path(path)
 
+    def draw_dijkstra(self):
+        self.draw_search(self.dg.graph.dijkstra)
+
     def draw_a_star(self):
-        # Clear any previous highlighted vertices
-        for v in self.dg.vertices:
-            v.v.marked = False
-            v.highlighted = False
-            v.selected = False
+        self.draw_search(self.dg.graph.a_star)
 
-        if len(self.selected_queue) == 2:
-            a, b = iter(self.selected_queue)
-            path = self.dg.graph.a_star(a, b)
+    def draw_bidirectional_dijkstra(self):
+        self.draw_search(self.dg.graph.bidirectional_dijkstra)
 
-            self.display_path(path)
+    def draw_bidirectional_a_star(self):
+        self.draw_search(self.dg.graph.bidirectional_a_star)
 
     def reset(self):
         self.selected_queue.clear()
 
 
 class Dragger(Component):
-
-    def __init__(self, display_graph):
+    """Drags the vertex under the mouse, pulling the vertices within hops
+    edges of it along like a net. Edges try to keep the length they had
+    when the drag started, relaxed passes times per frame. Only the edges
+    touching those vertices are looked at, and vertices further away stay
+    put, so a drag costs the same on small and huge graphs. The edges are
+    kept in flat arrays so the C extension can relax them when it's
+    built."""
+
+    def __init__(self, display_graph, hops=3, passes=1):
         self.held_vertex = None
         self.dg = display_graph
-        self.tick = 0
-        self.tick_max = 4
+        self.hops = hops
+        self.passes = passes
 
     def on_mouse_down(self, x, y):
         vertex_index = self.dg.get_vertex(x, y)
         if vertex_index is not None:
-            self.lengths = [e.v.distance_to(e.w) for e in self.dg.edges]
             self.held_vertex = vertex_index
+            self.grab(vertex_index)
+
+    def grab(self, v):
+        """Collect the vertices near v and the edges touching them"""
+        dg = self.dg
+        region = {v}
+        frontier = [v]
+        for _ in range(self.hops):
+            frontier = [w for u in frontier for w in dg.graph.vertices[u]
+                        if w not in region]
+            region.update(frontier)
+
+        edges = sorted({k for u in region for k in dg.incident[u]})
+        pos, buf = dg.positions, dg.edge_buffer
+
+        self.region = region
+        self.ends = array('i')
+        self.lengths = array('d')
+        self.weights = array('d')  # 1 for ends that move, 0 for pinned ones
+        for k in edges:
+            a, b = buf[2*k], buf[2*k + 1]
+            self.ends.extend((a, b))
+            self.lengths.append(math.sqrt((pos[2*b] - pos[2*a])**2 +
+                                          (pos[2*b + 1] - pos[2*a + 1])**2))
+            self.weights.extend((float(a in region), float(b in region)))
 
     def on_mouse_up(self, x, y):
         if self.held_vertex is not None:
+            # Finish any drag still waiting for a frame
+            self.dg.scheduler.flush(force=True)
             self.held_vertex = None
 
+            # relax() only moved the layout buffer
+            pos, vertices = self.dg.positions, self.dg.graph.vertices
+            for i in self.region:
+                vertices[i].x, vertices[i].y = pos[2*i], pos[2*i + 1]
+
+            # Edge costs changed with the vertices that moved
+            self.dg.graph.clear_weights()
+
     def on_mouse_drag(self, x, y):
-        self.tick += 1
-        if self.held_vertex is not None and self.tick > self.tick_max:
+        # Motion events come faster than frames, so only the latest one
+        # before each frame is used
+        if self.held_vertex is not None:
+            self.dg.request_frame(self.drag, x, y)
+
+    def drag(self, x, y):
+        if self.held_vertex is not None:
+            self.dg.forget_cached()
             self.relax(self.dg.vertices[self.held_vertex], (x, y))
-            self.dg.draw()
-            self.tick = 0
+            self.dg.redraw()
 
     def relax(self, vertex, newpos):
 
         vertex.x, vertex.y = newpos
 
-        for i, e in enumerate(self.dg.edges):
-            rest_len = self.lengths[i]
-            delta = (e.w.x - e.v.x, e.w.y - e.v.y)
-            delta_len = e.w.distance_to(e.v)
-            diff = (delta_len - rest_len)/delta_len
-            e.w.x -= delta[0]*0.5*diff
-            e.w.y -= delta[1]*0.5*diff
-            e.v.x += delta[0]*0.5*diff
-            e.v.y += delta[1]*0.5*diff
+        pos = self.dg.positions
+        if relax_edges is not None:
+            relax_edges(pos, self.ends, self.lengths, self.weights, self.passes)
+        else:
+            ends, lengths, weights = self.ends, self.lengths, self.weights
+            for _ in range(self.passes):
+                for k in range(len(lengths)):
+                    a, b = 2 * ends[2*k], 2 * ends[2*k + 1]
+                    wa, wb = weights[2*k], weights[2*k + 1]
+                    dx, dy = pos[b] - pos[a], pos[b + 1] - pos[a + 1]
+                    d = math.sqrt(dx*dx + dy*dy)
+                    if d == 0 or wa + wb == 0:
+                        continue
+                    diff = (d - lengths[k]) / (d * (wa + wb))
+                    pos[a] += dx * wa * diff
+                    pos[a + 1] += dy * wa * diff
+                    pos[b] -= dx * wb * diff
+                    pos[b + 1] -= dy * wb * diff
+
+        self.dg.positions_changed(self.region)
@@ -1,7 +1,16 @@
 from graphy.graph import Graph, Vertex, random_graph
-from graphy import Viewer, fdag, config
-
+from graphy import Viewer, step, run, config, np
+from graphy.quadtree import QuadTree
+from graphy.spatial import SpatialGrid, merge_rects
+from graphy.layoutrunner import LayoutRunner
+from graphy.scheduler import RenderScheduler
+from graphy.multilevel import multilevel_positions
+from graphy.layoutcache import layout_key
+
+from array import array
 import math
+import random
+import threading
 
 
 class DisplayEdge(object):
@@ -43,26 +52,33 @@ class DisplayVertex(object):
         self.selected = False
 
     def draw(self):
-        stroke_color = 'orange' if self.selected else'black'
         self.parent.view.circle(self.x, self.y, self.size, color=self.color,
-                                stroke_color=stroke_color)
+                                stroke_color=self.stroke_color)
 
+    # Positions live in the parent's layout buffer. Writes are passed on to
+    # the Vertex so the Graph sees them without waiting for sync_graph()
     @property
     def x(self):
-        return self.v.x
+        return self.parent.positions[2 * self.i]
 
     @x.setter
     def x(self, value):
+        self.parent.positions[2 * self.i] = value
         self.v.x = value
 
     @property
     def y(self):
-        return self.v.y
+        return self.parent.positions[2 * self.i + 1]
 
     @y.setter
     def y(self, value):
+        self.parent.positions[2 * self.i + 1] = value
         self.v.y = value
 
+    @property
+    def stroke_color(self):
+        return 'orange' if self.selected else 'black'
+
     @property
     def color(self):
         if self.highlighted:
@@ -72,10 +88,13 @@ class DisplayVertex(object):
         return self._color
 
     def distance_to(self, w):
-        return self.v.distance_to(w)
+        return math.sqrt((self.x - w.x)**2 + (self.y - w.y)**2)
 
     def unit_to(self, w):
-        return self.v.unit_to(w)
+        x3 = w.x - self.x
+        y3 = w.y - self.y
+        mag = math.sqrt(x3**2 + y3**2)
+        return (x3/mag, y3/mag)
 
 
 class DisplayGraph(object):
@@ -85,9 +104,22 @@ class DisplayGraph(object):
     c3 = 700.0  # Higher increases repulsion
     c4 = 7      # Repulsion multiplier
     M = 300     # Number of iterations
+    tol = 1.0   # layout() stops once no vertex moves further than this
+    theta = 0.5 # Barnes-Hut opening angle, lower is more accurate
+    block = 2**20  # Max vertex pairs held in memory at once by numpy_update
+    redraw_fraction = 0.3  # redraw() draws everything past this much change
+    fps = 30    # Max frames drawn per second while the layout runs
+    refine = 30 # Iterations per level of the multilevel layout
+    settle = 20 # Iterations of relax_region() after each edit
+    hops = 2    # How far from an edit relax_region() moves vertices
+
+    # What fdag was last configured with. Its settings are global to the
+    # process, so each DisplayGraph sets its own again before running
+    _fdag_settings = None
 
     def __init__(self, graph, width=1000, height=1000,
-                 threaded=False, num_threads=4, update_algo=None):
+                 threaded=False, num_threads=4, update_algo=None, viewer=None,
+                 multilevel=False, cache=None):
 
         if not isinstance(graph, Graph):
             raise Exception("DisplayGraph must be initialized with a Graph")
@@ -99,13 +131,25 @@ class DisplayGraph(object):
         self.width = width
         self.height = height
 
+        # Held by the layout thread for each iteration and by the UI thread
+        # whenever it reads or moves vertices
+        self.lock = threading.RLock()
+        self.runner = None
+        self._settled = True
+        self._ticking = False
+
+        # Decides when frames are drawn during layout and dragging
+        self.scheduler = RenderScheduler(self.fps)
+
         # Layout and display related setup
         self.size = int(math.sqrt(len(graph.vertices)))
 
-        self.view = Viewer(width=width, height=height,
-                           on_mouse_down=self.on_mouse_down,
-                           on_mouse_up=self.on_mouse_up,
-                           on_mouse_drag=self.on_mouse_drag)
+        # viewer is the Viewer class to draw with, such as HeadlessViewer
+        # for laying out graphs without a window
+        self.view = (viewer or Viewer)(width=width, height=height,
+                                       on_mouse_down=self.on_mouse_down,
+                                       on_mouse_up=self.on_mouse_up,
+                                       on_mouse_drag=self.on_mouse_drag)
 
         self.xscale = (width // 2) // self.size
         self.yscale = (height // 2) // self.size
@@ -120,34 +164,57 @@ class DisplayGraph(object):
         self.threaded = threaded
         self.num_threads = num_threads
 
-        # Selected update method
-        if update_algo == 'c_update' and fdag is not None:
+        # Start layouts from multilevel_positions() instead of the grid, and
+        # only run refine iterations of update() from there
+        self.multilevel = multilevel
+
+        # LayoutCache consulted before laying out a new graph
+        self.cache = cache
+
+        self.set_update_algo(update_algo)
+
+    def set_update_algo(self, update_algo):
+        """Select the method used by update(). The *_bh_update variants
+        approximate repulsion with a Barnes-Hut quadtree."""
+        self.update_algo = update_algo
+        if update_algo in ('c_update', 'c_bh_update') and step is not None:
             self.update = self.c_update
-            config(self.c1, self.c2, self.c3, self.c4,
-                   self.threaded, self.num_threads)
+            self._configure()
+        elif update_algo == 'numpy_update' and np is not None:
+            self.update = self.numpy_update
+        elif update_algo == 'python_bh_update':
+            self.update = self.python_bh_update
         else:
             self.update = self.python_update
 
     def on_mouse_down(self, x, y):
-        for component in self.components:
-            component.on_mouse_down(x, y)
+        with self.lock:
+            for component in self.components:
+                component.on_mouse_down(x, y)
 
     def on_mouse_up(self, x, y):
-        for component in self.components:
-            component.on_mouse_up(x, y)
+        with self.lock:
+            for component in self.components:
+                component.on_mouse_up(x, y)
 
     def on_mouse_drag(self, x, y):
-        for component in self.components:
-            component.on_mouse_drag(x, y)
+        with self.lock:
+            for component in self.components:
+                component.on_mouse_drag(x, y)
 
     def populate(self):
 
         x, y = 0, 0
 
+        # Layout state shared with the C extension and numpy. Holds the
+        # x, y of every vertex one after the other
+        self.positions = array('d')
+
         # Create DisplayVertices
         for i, v in enumerate(self.graph.vertices):
             v.x = (x * self.xscale) + self.xoffset
             v.y = (y * self.yscale) + self.yoffset
+            self.positions.extend((v.x, v.y))
             self.vertices.append(DisplayVertex(v, i, self))
 
             x += 1
@@ -162,90 +229,730 @@ class DisplayGraph(object):
                     self.edges.append(DisplayEdge(self.vertices[i],
                                                   self.vertices[w], self))
 
-    def c_update(self):
-        verts = [(float(self.vertices[x].x), float(self.vertices[x].y))
-                 for x in range(len(self.vertices))]
+        self.edge_buffer = array('i')
+        self.incident = [[] for _ in self.vertices]
+        for k, e in enumerate(self.edges):
+            self.edge_buffer.extend((e.v.i, e.w.i))
+            self.incident[e.v.i].append(k)
+            self.incident[e.w.i].append(k)
+
+        # What the screen showed after the last full draw(), for redraw()
+        self._drawn_positions = None
+        self._drawn_styles = None
+
+        # Rebuilt from positions the next time it's needed
+        self.spatial = SpatialGrid()
+        self._spatial_stale = True
+
+        # Whether place_multilevel() has replaced the grid positions
+        self._placed = False
+
+        # Whether the positions are still the ones above, so a finished
+        # layout can be looked up in the cache, and the key to store it under
+        self._fresh = True
+        self._cache_key = None
+
+        self._make_views()
+
+    def _make_views(self):
+        """(V, 2) and (E, 2) views of the same memory for numpy_update. They
+        have to be dropped before the arrays can grow."""
+        if np is not None:
+            self.position_array = np.frombuffer(self.positions,
+                                                dtype=np.float64).reshape(-1, 2)
+            self.edge_array = np.frombuffer(self.edge_buffer,
+                                            dtype=np.intc).reshape(-1, 2)
+
+    def sync_graph(self):
+        """Copy the layout buffer into the Graph's vertices. Updates that
+        work on the buffer directly don't touch the Vertex objects."""
+        for i, v in enumerate(self.graph.vertices):
+            v.x = self.positions[2 * i]
+            v.y = self.positions[2 * i + 1]
 
-        edges = [(int(self.edges[x].v.i), int(self.edges[x].w.i))
-                 for x in range(len(self.edges))]
+        self.graph.clear_weights()
 
-        new_vertices = fdag(verts, len(verts), edges, len(edges))
+    def positions_changed(self, indices=None):
+        """Call after moving vertices so the spatial index used by get_vertex
+        and the selection queries stays current. indices are the vertices
+        that moved, or None when all of them may have."""
+        if indices is None or self._spatial_stale:
+            self._spatial_stale = True
+        else:
+            for i in indices:
+                self.spatial.move(i)
+
+    def spatial_index(self):
+        """Returns the SpatialGrid over the vertex positions"""
+        if self._spatial_stale:
+            self.spatial.rebuild(self.positions)
+            self._hit_radius = max([v.size for v in self.vertices] or [0])
+            self._spatial_stale = False
+        return self.spatial
+
+    def _configure(self):
+        """Pass this graph's settings to fdag unless they're the ones it
+        already has"""
+        theta = self.theta if self.update_algo == 'c_bh_update' else 0.0
+        settings = (self.c1, self.c2, self.c3, self.c4,
+                    self.threaded, self.num_threads, theta)
+        if DisplayGraph._fdag_settings != settings:
+            config(*settings)
+            DisplayGraph._fdag_settings = settings
+
+    def c_update(self):
+        self.c_step(self.positions, self.edge_buffer)
+        self.positions_changed()
 
-        for i, new_vert in enumerate(new_vertices):
-            self.vertices[i].x, self.vertices[i].y = new_vert
+    def c_step(self, positions, edges):
+        """One iteration of c_update on flat arrays of the positions and
+        edges of any graph"""
+        self._configure()
+        step(positions, edges)
 
     def python_update(self):
+        """Repulsion is worked out from the positions at the start of the
+        iteration and attraction from those after repulsion, then each is
+        applied to every vertex at once, as in c_update and numpy_update"""
+        forces = []
         for v in self.vertices:
+            fx = fy = 0.0
             for w in self.vertices:
                 if w is not v:
                     d = v.distance_to(w)
                     f = self.repulsion(d) * DisplayGraph.c4
-                    x, y = [f*x for x in w.unit_to(v)]
-                    v.x += x
-                    v.y += y
-
+                    x, y = w.unit_to(v)
+                    fx += f * x
+                    fy += f * y
+            forces.append((fx, fy))
+
+        for v, (x, y) in zip(self.vertices, forces):
+            v.x += x
+            v.y += y
+
+        self.apply_attraction()
+        self.positions_changed()
+
+    def python_bh_update(self):
+        tree = QuadTree([(v.x, v.y) for v in self.vertices])
+        repulsion = lambda d: self.repulsion(d) * DisplayGraph.c4
+
+        forces = [tree.force_on(i, self.theta, repulsion)
+                  for i in range(len(self.vertices))]
+
+        for v, (x, y) in zip(self.vertices, forces):
+            v.x += x
+            v.y += y
+
+        self.apply_attraction()
+        self.positions_changed()
+
+    def numpy_update(self):
+        """Vectorized equivalent of python_update and c_update, which it
+        matches to rounding"""
+        self.numpy_step(self.position_array, self.edge_array)
+        self.positions_changed()
+
+    def numpy_step(self, pos, edges):
+        """One iteration of numpy_update on a (V, 2) array of positions and
+        an (E, 2) array of edges"""
+        delta = np.zeros_like(pos)
+        n = len(pos)
+
+        # Repulsion between every pair, a block of rows at a time
+        rows = max(1, self.block // max(n, 1))
+        for start in range(0, n, rows):
+            diff = pos[start:start + rows, None, :] - pos[None, :, :]
+            d = np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+            f = self.c3 / np.maximum(d, self.c2)**2 * DisplayGraph.c4
+            f = np.divide(f, d, out=np.zeros_like(d), where=d > 0)
+            delta[start:start + rows] += np.einsum('ij,ijk->ik', f, diff)
+
+        pos += delta
+        delta[:] = 0
+
+        # Attraction along every edge
+        v, w = edges[:, 0], edges[:, 1]
+        diff = pos[w] - pos[v]
+        d = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+        nonzero = d > 0
+        f = np.zeros_like(d)
+        f[nonzero] = self.c1 * np.log10(d[nonzero] / self.c2) * \
+            DisplayGraph.c4 / d[nonzero]
+        diff *= f[:, None]
+        np.add.at(delta, v, diff)
+        np.add.at(delta, w, -diff)
+
+        pos += delta
+
+    def python_bh_step(self, positions, edges):
+        """One iteration of python_bh_update on flat arrays of the positions
+        and edges of any graph"""
+        n = len(positions) // 2
+        tree = QuadTree([(positions[2*i], positions[2*i + 1]) for i in range(n)])
+        repulsion = lambda d: self.repulsion(d) * DisplayGraph.c4
+
+        for i in range(n):
+            x, y = tree.force_on(i, self.theta, repulsion)
+            positions[2*i] += x
+            positions[2*i + 1] += y
+
+        moves = array('d', [0.0]) * len(positions)
+        for k in range(0, len(edges), 2):
+            v, w = edges[k], edges[k + 1]
+            dx = positions[2*w] - positions[2*v]
+            dy = positions[2*w + 1] - positions[2*v + 1]
+            d = math.sqrt(dx*dx + dy*dy)
+            if d > 0:
+                f = self.attraction(d) * DisplayGraph.c4 / d
+                moves[2*v] += dx * f
+                moves[2*v + 1] += dy * f
+                moves[2*w] -= dx * f
+                moves[2*w + 1] -= dy * f
+
+        for i in range(len(positions)):
+            positions[i] += moves[i]
+
+    def level_step(self):
+        """Returns a function doing one iteration of the selected update on
+        flat arrays of positions and edges, for the coarse graphs of the
+        multilevel layout. The Python updates use Barnes-Hut there."""
+        if self.update == self.c_update:
+            return self.c_step
+        if self.update == self.numpy_update:
+            return lambda pos, edges: self.numpy_step(
+                np.frombuffer(pos).reshape(-1, 2),
+                np.frombuffer(edges, dtype=np.intc).reshape(-1, 2))
+        return self.python_bh_step
+
+    def place_multilevel(self):
+        """Move every vertex to its multilevel_positions() starting point.
+        The work is done on a copy outside the lock, so if vertices or edges
+        are added meanwhile the result no longer fits and is dropped.
+        Returns whether the vertices were moved."""
+        with self.lock:
+            positions = self.positions[:]
+            edges = self.edge_buffer[:]
+
+        positions = multilevel_positions(positions, edges, self.level_step(),
+                                         DisplayGraph.M, self.refine)
+        with self.lock:
+            if len(positions) != len(self.positions) or \
+               len(edges) != len(self.edge_buffer):
+                return False
+            self.positions[:] = positions
+            self.positions_changed()
+            self._placed = True
+            return True
+
+    def _start_multilevel(self):
+        """Whether a layout starting now should begin with place_multilevel()"""
+        return self.multilevel and not self._placed
+
+    def apply_attraction(self):
+        """Pull the ends of every edge together, all from the same
+        positions"""
+        forces = [[0.0, 0.0] for _ in self.vertices]
         for e in self.edges:
             d = e.v.distance_to(e.w)
             f = self.attraction(d) * DisplayGraph.c4
-            x, y = [f*x for x in e.v.unit_to(e.w)]
-            e.v.x += x
-            e.v.y += y
-            e.w.x -= x
-            e.w.y -= y
+            x, y = e.v.unit_to(e.w)
+            forces[e.v.i][0] += f * x
+            forces[e.v.i][1] += f * y
+            forces[e.w.i][0] -= f * x
+            forces[e.w.i][1] -= f * y
 
-    def draw(self, buttons=True):
+        for v, (x, y) in zip(self.vertices, forces):
+            v.x += x
+            v.y += y
 
-        self.view.clear()
+    def draw(self, buttons=True):
 
-        for e in self.edges:
-            e.draw()
+        with self.lock:
+            self.view.clear()
+            self.draw_elements()
+            self.view.update(draw_buttons=buttons)
+
+            self._drawn_positions = self.positions[:]
+            self._drawn_styles = [self._style(v) for v in self.vertices]
+
+    def draw_elements(self, edges=None, vertices=None):
+        """Draw the edges and then the vertices with the given indices (by
+        default all of them) using the Viewer's batch primitives"""
+        if edges is None:
+            edges = range(len(self.edges))
+        if vertices is None:
+            vertices = range(len(self.vertices))
+
+        if np is not None:
+            segments = self.position_array[self.edge_array[edges]].ravel()
+            centers = self.position_array[vertices].ravel()
+        else:
+            pos, ends = self.positions, self.edge_buffer
+            segments = array('d')
+            for k in edges:
+                v, w = ends[2*k], ends[2*k+1]
+                segments.extend((pos[2*v], pos[2*v+1], pos[2*w], pos[2*w+1]))
+            centers = array('d')
+            for i in vertices:
+                centers.extend((pos[2*i], pos[2*i+1]))
+
+        self.view.lines(segments, [self.edges[k].color for k in edges])
+
+        vertices = [self.vertices[i] for i in vertices]
+        self.view.circles(centers, [v.size for v in vertices],
+                          [v.color for v in vertices],
+                          [v.stroke_color for v in vertices])
+
+    @staticmethod
+    def _style(v):
+        return v.color, v.selected, v.size
+
+    def redraw(self, buttons=True):
+        """Like draw() but only redraws the parts of the window around the
+        vertices that moved or changed color since the last draw(), and
+        their edges. Falls back to draw() when the viewer can't update
+        regions or more than redraw_fraction of the graph changed."""
+        with self.lock:
+            self._redraw(buttons)
+
+    def _redraw(self, buttons):
+        old, pos = self._drawn_positions, self.positions
+        if not self.view.regions or old is None or len(old) != len(pos):
+            return self.draw(buttons)
+
+        styles = [self._style(v) for v in self.vertices]
+        dirty = {i for i, (a, b) in enumerate(zip(styles, self._drawn_styles))
+                 if a != b}
+        if old != pos:
+            if np is not None:
+                moved = np.frombuffer(old) != np.frombuffer(pos)
+                dirty.update(np.flatnonzero(moved.reshape(-1, 2).any(axis=1))
+                             .tolist())
+            else:
+                dirty.update(i for i in range(len(self.vertices))
+                             if pos[2*i] != old[2*i] or pos[2*i+1] != old[2*i+1])
+        if not dirty:
+            return
+        if len(dirty) > self.redraw_fraction * len(self.vertices):
+            return self.draw(buttons)
+
+        # Where every changed vertex and its edges were and are now
+        grid = self.spatial_index()
+        pad = self._hit_radius + 3
+        edges = self.edge_buffer
+        rects = []
+        for i in dirty:
+            for p in (old, pos):
+                x, y = p[2*i], p[2*i+1]
+                rects.append((x - pad, y - pad, x + pad, y + pad))
+                for k in self.incident[i]:
+                    v, w = edges[2*k], edges[2*k+1]
+                    ax, ay, bx, by = p[2*v], p[2*v+1], p[2*w], p[2*w+1]
+                    rects.append((min(ax, bx) - 3, min(ay, by) - 3,
+                                  max(ax, bx) + 3, max(ay, by) + 3))
+        rects = merge_rects(rects)
+
+        area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in rects)
+        if area > self.redraw_fraction * self.width * self.height:
+            return self.draw(buttons)
+
+        regions = []
+        for x0, y0, x1, y1 in rects:
+            region = (x0, y0, x1 - x0, y1 - y0)
+            regions.append(region)
+            self.view.begin_region(*region)
+            self.draw_elements(self._edges_in(x0, y0, x1, y1),
+                               grid.in_rect(x0 - pad, y0 - pad,
+                                            x1 + pad, y1 + pad))
+            self.view.end_region()
+
+        self.view.update(draw_buttons=buttons, rects=regions)
+
+        for i in dirty:
+            old[2*i], old[2*i+1] = pos[2*i], pos[2*i+1]
+        self._drawn_styles = styles
+
+    def _edges_in(self, x0, y0, x1, y1):
+        """Indices of the edges whose bounding box overlaps the rectangle"""
+        if np is not None:
+            pos = self.position_array
+            a = pos[self.edge_array[:, 0]]
+            b = pos[self.edge_array[:, 1]]
+            inside = (np.minimum(a[:, 0], b[:, 0]) <= x1) & \
+                     (np.maximum(a[:, 0], b[:, 0]) >= x0) & \
+                     (np.minimum(a[:, 1], b[:, 1]) <= y1) & \
+                     (np.maximum(a[:, 1], b[:, 1]) >= y0)
+            return np.flatnonzero(inside).tolist()
+
+        pos, edges = self.positions, self.edge_buffer
+        found = []
+        for k in range(len(self.edges)):
+            v, w = edges[2*k], edges[2*k+1]
+            ax, ay, bx, by = pos[2*v], pos[2*v+1], pos[2*w], pos[2*w+1]
+            if min(ax, bx) <= x1 and max(ax, bx) >= x0 and \
+               min(ay, by) <= y1 and max(ay, by) >= y0:
+                found.append(k)
+        return found
+
+    def layout(self, iterations=None, tol=None):
+        """Run the layout without drawing it. Stops after iterations
+        (default M) or once no vertex moves further than tol in an iteration.
+        Returns the number of iterations run and the energy of the last one,
+        the sum of the squared distances moved by every vertex. In multilevel
+        mode a new graph is placed first and iterations defaults to refine.
+        Layouts found in the cache return (0, 0.0) without running."""
+        iterations, tol = self._stopping(iterations, tol)
+        if self.load_cached(iterations, tol):
+            return 0, 0.0
+
+        if self._start_multilevel():
+            self.place_multilevel()
+
+        if self.update == self.c_update:
+            # Every iteration runs inside the C extension without the GIL
+            self._configure()
+            result = run(self.positions, self.edge_buffer, iterations, tol)
+            self.positions_changed()
+            self.sync_graph()
+            self._store_cached()
+            return result
+
+        count, energy = 0, 0.0
+        while count < iterations:
+            largest, energy = self.step_layout()
+            count += 1
+
+            if math.sqrt(largest) < tol:
+                break
+
+        self.sync_graph()
+        self._store_cached()
+        return count, energy
+
+    def _stopping(self, iterations, tol):
+        """The iterations and tol a layout started now runs with"""
+        if iterations is None:
+            multilevel = self._start_multilevel()
+            iterations = self.refine if multilevel else DisplayGraph.M
+        return iterations, self.tol if tol is None else tol
+
+    def load_cached(self, iterations, tol):
+        """Use the cached result of the layout about to run, if this graph
+        hasn't been laid out yet and the cache has it. Returns True if it
+        did. iterations and tol are those the layout will run with, tol None
+        for one that runs every iteration. Called at the start of every
+        layout, so a result is only stored for the first one."""
+        self._cache_key = None
+        if self.cache is None or not self._fresh:
+            return False
+
+        self._fresh = False
+        self._cache_key = layout_key(self, iterations, tol)
+        positions = self.cache.get(self._cache_key, len(self.vertices))
+        if positions is None:
+            return False
+
+        with self.lock:
+            self.positions[:] = positions
+            self.positions_changed()
+            self.sync_graph()
+            self._placed = True
+            self._cache_key = None
+        return True
+
+    def forget_cached(self):
+        """Don't store the layout in progress. Call when moving vertices or
+        changing the graph, since the result no longer belongs to the key
+        load_cached() made."""
+        self._cache_key = None
+
+    def _store_cached(self):
+        """Store the layout that load_cached() didn't find"""
+        if self._cache_key is not None:
+            self.cache.put(self._cache_key, self.positions)
+            self._cache_key = None
+
+    def step_layout(self):
+        """Run one update(). Returns the largest squared distance moved by a
+        vertex and the energy, the sum of them."""
+        previous = self.positions[:]
+        self.update()
+
+        if np is not None:
+            moves = self.position_array - np.frombuffer(previous).reshape(-1, 2)
+            moves = np.einsum('ij,ij->i', moves, moves)
+            return (float(moves.max()) if len(moves) else 0.0), float(moves.sum())
+
+        pos = self.positions
+        moves = [(pos[i] - previous[i])**2 + (pos[i+1] - previous[i+1])**2
+                 for i in range(0, len(pos), 2)]
+        return max(moves or [0.0]), sum(moves)
+
+    def start_layout(self, iterations=None, tol=None):
+        """Lay out the graph on a background thread, from the current
+        positions. on_timer() draws its progress. A new graph found in the
+        cache is drawn right away instead."""
+        iterations, tol = self._stopping(iterations, tol)
+        if self.load_cached(iterations, tol):
+            self.stop_layout()
+            self._settled = True
+            self.draw()
+            return
+
+        if self.runner is None:
+            self.runner = LayoutRunner(self)
+        self._frame_version = None
+        self._counted = self.runner.version
+        self._settled = False
+        self.scheduler.reset()
+        self.runner.start(iterations, tol, self._start_multilevel())
+        self._start_timer()
+
+    def stop_layout(self):
+        """Stop the background layout where it is"""
+        if self.runner is not None:
+            self.runner.cancel()
+
+    def request_frame(self, draw, *args):
+        """Call draw(*args) as soon as the scheduler allows a frame. It
+        replaces any earlier request still waiting."""
+        self.scheduler.request(draw, *args)
+        if self.scheduler.pending:
+            self._start_timer()
+
+    def _start_timer(self):
+        if not self._ticking:
+            self._ticking = True
+            self.view.set_timer(1.0 / self.scheduler.fps, self.on_timer)
+
+    def on_timer(self):
+        """Called by the viewer while the background layout runs or a frame
+        request is waiting. Draws the request, then the latest iteration if
+        there is a new one and the scheduler allows it, and the final
+        result once the layout stops. Returns False when there is nothing
+        left to draw."""
+        with self.lock:
+            scheduler, runner = self.scheduler, self.runner
+            scheduler.flush()
+
+            if not self._settled:
+                scheduler.computed(runner.version - self._counted)
+                self._counted = runner.version
+
+                if runner.version != self._frame_version:
+                    scheduler.frame(self._draw_layout)
+                elif not runner.running:
+                    self._settled = True
+                    self.sync_graph()
+                    if runner.completed:
+                        self._store_cached()
+                    self.draw()
+                    print("{0:10} -> {1}".format("Layout", scheduler.report()))
+
+            self._ticking = scheduler.pending or not self._settled
+            return self._ticking
+
+    def _draw_layout(self):
+        self._frame_version = self.runner.version
+        self.draw(buttons=False)
 
-        for v in self.vertices:
-            v.draw()
+    def display(self, run=True):
+        """Lay out and draw the graph. With run, the layout continues on a
+        background thread while the viewer's event loop runs. Otherwise it
+        runs here, drawing the frames the viewer doesn't skip as often as
+        the scheduler allows."""
+        if run:
+            self.start_layout()
+            self.view.run()
+            return
 
-        self.view.update(draw_buttons=buttons)
+        iterations, _ = self._stopping(None, None)
+        if self.load_cached(iterations, None):
+            self.draw()
+            return
 
-    def display(self, run=True):
+        if self._start_multilevel():
+            self.place_multilevel()
 
-        for x in range(DisplayGraph.M):
+        self.scheduler.reset()
+        for x in range(iterations):
             self.update()
-            self.draw(buttons=False)
+            self.scheduler.computed()
+
+            if self.view.skip_frame():
+                continue
+            if self.view.throttle:
+                self.scheduler.frame(self.draw, False)
+            else:
+                self.draw(buttons=False)
 
+        self.sync_graph()
+        self._store_cached()
         self.draw()
+        print("{0:10} -> {1}".format("Layout", self.scheduler.report()))
 
-        # Run the mainloop to prevent window from closing
-        if run:
-            self.view.run()
+    def save_image(self, path):
+        """Draw the graph and write it to path. Only works with viewers that
+        have a save() method, like HeadlessViewer."""
+        self.draw(buttons=False)
+        self.view.save(path)
 
     def new_graph(self):
 
-        V = len(self.vertices)
-        E = len(self.edges)
+        self.stop_layout()
 
-        self.vertices = []
-        self.edges = []
+        with self.lock:
+            V = len(self.vertices)
+            E = len(self.edges)
 
-        self.graph = random_graph(V=V, E=E, connected=True)
+            self.vertices = []
+            self.edges = []
 
-        self.populate()
+            self.graph = random_graph(V=V, E=E, connected=True)
+
+            self.populate()
 
-        for component in self.components:
-            component.reset()
+            for component in self.components:
+                component.reset()
 
-        self.display(run=False)
+        if self.runner is not None:
+            self.start_layout()
+        else:
+            self.display(run=False)
+
+    def add_vertex(self, neighbors=()):
+        """Add a vertex joined to the vertices in neighbors, keeping the
+        layout of the rest of the graph. It starts at the middle of its
+        neighbors and only the vertices near it are relaxed, so the cost
+        depends on the size of the edit rather than of the graph. Returns
+        the index of the new vertex."""
+        with self.lock:
+            pos = self.positions
+            if neighbors:
+                x = sum(pos[2 * w] for w in neighbors) / len(neighbors)
+                y = sum(pos[2 * w + 1] for w in neighbors) / len(neighbors)
+            elif self.vertices:
+                x, y = pos[0], pos[1]
+            else:
+                x, y = self.xoffset, self.yoffset
+
+            # Nudge it off the middle so it doesn't sit on top of anything
+            x += self.c2 * (random.random() - 0.5)
+            y += self.c2 * (random.random() - 0.5)
+
+            self.forget_cached()
+            i = self.graph.add_vertex(x, y)
+            self.position_array = self.edge_array = None
+            self.positions.extend((x, y))
+            self.vertices.append(DisplayVertex(self.graph.vertices[i], i, self))
+            self.incident.append([])
+            if not self._spatial_stale:
+                self.spatial.add()
+                self._hit_radius = max(self._hit_radius, self.vertices[i].size)
+            self._make_views()
+
+            for w in neighbors:
+                self._add_edge(i, w)
+
+            self.relax_region([i])
+            return i
+
+    def add_edge(self, v, w):
+        """Add edge v-w to the graph and relax the layout around it"""
+        with self.lock:
+            if self._add_edge(v, w):
+                self.forget_cached()
+                self.relax_region([v, w])
+
+    def _add_edge(self, v, w):
+        if v == w or w in self.graph.vertices[v]:
+            return False
+
+        self.graph.add_edge(v, w)
+        self.position_array = self.edge_array = None
+        k = len(self.edges)
+        self.edges.append(DisplayEdge(self.vertices[v], self.vertices[w], self))
+        self.edge_buffer.extend((v, w))
+        self.incident[v].append(k)
+        self.incident[w].append(k)
+        self._make_views()
+        return True
+
+    def relax_region(self, seeds, hops=None, iterations=None):
+        """Run iterations (default settle) of the layout forces on the
+        vertices at most hops edges from seeds, leaving the rest in place.
+        Repulsion only comes from vertices within a few edge lengths, found
+        with the spatial index."""
+        hops = self.hops if hops is None else hops
+        iterations = self.settle if iterations is None else iterations
+
+        region = set(seeds)
+        frontier = list(region)
+        for _ in range(hops):
+            frontier = [w for v in frontier for w in self.graph.vertices[v]
+                        if w not in region]
+            region.update(frontier)
+
+        cutoff = 5 * self.c2
+        c4 = DisplayGraph.c4
+
+        with self.lock:
+            pos, ends = self.positions, self.edge_buffer
+            for _ in range(iterations):
+                grid = self.spatial_index()
+                moves = []
+                for i in region:
+                    x, y = pos[2 * i], pos[2 * i + 1]
+                    fx = fy = 0.0
+
+                    for j in grid.within(x, y, cutoff):
+                        dx, dy = x - pos[2 * j], y - pos[2 * j + 1]
+                        d = math.sqrt(dx*dx + dy*dy)
+                        if d > 0:
+                            f = self.repulsion(d) * c4 / d
+                            fx += dx * f
+                            fy += dy * f
+
+                    for k in self.incident[i]:
+                        j = ends[2 * k] if ends[2 * k] != i else ends[2 * k + 1]
+                        dx, dy = pos[2 * j] - x, pos[2 * j + 1] - y
+                        d = math.sqrt(dx*dx + dy*dy)
+                        if d > 0:
+                            f = self.attraction(d) * c4 / d
+                            fx += dx * f
+                            fy += dy * f
+
+                    moves.append((i, fx, fy))
+
+                for i, fx, fy in moves:
+                    self.vertices[i].x += fx
+                    self.vertices[i].y += fy
+                self.positions_changed(region)
+
+            self.graph.clear_weights()
 
     def get_vertex(self, x, y):
         """Returns the index of the first vertex that collides with the
         coordinates (x,y). If no collision return None"""
+        grid = self.spatial_index()
+        pos = self.positions
 
-        # Create a temporary Vertex for Vertex.distance_to
-        click_location = Vertex(x, y)
-
-        for i, v in enumerate(self.vertices):
-            if v.distance_to(click_location) <= v.size:
+        for i in grid.within(x, y, self._hit_radius):
+            size = self.vertices[i].size
+            if (pos[2 * i] - x)**2 + (pos[2 * i + 1] - y)**2 <= size * size:
                 return i
         return None
 
+    def select_rect(self, x0, y0, x1, y1):
+        """Returns the indices of the vertices inside a rectangle"""
+        return self.spatial_index().in_rect(x0, y0, x1, y1)
+
+    def select_lasso(self, points):
+        """Returns the indices of the vertices inside the polygon traced by
+        points, a list of (x, y)"""
+        return self.spatial_index().in_polygon(points)
+
     @classmethod
     def attraction(cls, d):
         return cls.c1 * math.log10(d/cls.c2)
@@ -0,0 +1,222 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import heapq
+import os
+
+
+INF = float('inf')
+
+# State of a worker process, set once by _init_worker
+_worker = None
+
+
+def _csr(graph):
+    """Returns the offsets, targets and costs arrays of graph's edges in
+    compressed sparse row form"""
+    if getattr(graph, 'offsets', None) is not None and len(graph):
+        # A CompactGraph already stores them like this
+        graph.edges(0)
+        return graph.offsets, graph.targets, graph.weights
+
+    offsets = array('q', [0])
+    targets = array('i')
+    costs = array('d')
+    for v in range(len(graph.vertices)):
+        for w, cost in graph.edges(v):
+            targets.append(w)
+            costs.append(cost)
+        offsets.append(len(targets))
+    return offsets, targets, costs
+
+
+def _search(csr, source, wanted, out, pred):
+    """Dijkstra from source over csr. Writes the cost to each vertex in
+    wanted (None for all of them) into out, and the previous vertex on the
+    path to every vertex into pred if it isn't None. Stops early once all
+    of wanted is settled."""
+    offsets, targets, costs = csr
+    dist = {source: 0.0}
+    prev = {source: source}
+    done = set()
+    pq = [(0.0, source)]
+    wanted_set = set(wanted) if wanted is not None else ()
+    remaining = len(wanted_set) if wanted is not None else -1
+
+    heappush, heappop = heapq.heappush, heapq.heappop
+
+    while pq:
+        d, v = heappop(pq)
+        if v in done:
+            continue
+        done.add(v)
+
+        if remaining > 0 and v in wanted_set:
+            remaining -= 1
+            if not remaining:
+                break
+
+        for i in range(offsets[v], offsets[v + 1]):
+            w = targets[i]
+            w_cost = d + costs[i]
+            if w_cost < dist.get(w, INF):
+                dist[w] = w_cost
+                prev[w] = v
+                heappush(pq, (w_cost, w))
+
+    if wanted is None:
+        for v in done:
+            out[v] = dist[v]
+    else:
+        for j, t in enumerate(wanted):
+            if t in done:
+                out[j] = dist[t]
+
+    if pred is not None:
+        for v in done:
+            pred[v] = prev[v]
+
+
+def _views(buffers, V, E, S, T, predecessors):
+    """Split the shared graph and result buffers into typed views"""
+    graph, result = buffers
+    a, b = 8 * (V + 1), 8 * (V + 1) + 8 * E
+    csr = (graph[:a].cast('q'), graph[b:b + 4 * E].cast('i'),
+           graph[a:b].cast('d'))
+    out = result[:8 * S * T].cast('d')
+    pred = result[8 * S * T:8 * S * T + 4 * S * V].cast('i') \
+        if predecessors else None
+    return csr, out, pred
+
+
+def _init_worker(names, V, E, S, T, wanted, predecessors):
+    global _worker
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    csr, out, pred = _views([block.buf for block in blocks], V, E, S, T,
+                            predecessors)
+    _worker = (blocks, csr, out, pred, V, T, wanted)
+
+
+def _run_rows(rows):
+    _, csr, out, pred, V, T, wanted = _worker
+    for row, source in rows:
+        _search(csr, source, wanted, out[row * T:(row + 1) * T],
+                None if pred is None else pred[row * V:(row + 1) * V])
+
+
+class DistanceMatrix(object):
+    """Costs of the shortest paths from each of sources to each of targets,
+    stored row by row in one flat array('d'), inf where there's no path.
+    With predecessors, predecessors[i * V + v] is the vertex before v on the
+    shortest path from sources[i], -1 if v wasn't reached."""
+
+    def __init__(self, sources, targets, data, predecessors=None):
+        self.sources = sources
+        self.targets = targets
+        self.data = data
+        self.predecessors = predecessors
+        self._rows = {s: i for i, s in enumerate(sources)}
+        self._columns = {t: j for j, t in enumerate(targets)}
+
+    def __getitem__(self, key):
+        source, target = key
+        return self.data[self._rows[source] * len(self.targets) +
+                         self._columns[target]]
+
+    def row(self, source):
+        """Returns the costs from source to every target as an array"""
+        T = len(self.targets)
+        i = self._rows[source]
+        return self.data[i * T:(i + 1) * T]
+
+    def path(self, source, target):
+        """Returns the shortest path from source to target as a list of
+        indices, or None if there isn't one. Needs predecessors."""
+        if self.predecessors is None:
+            raise ValueError("distances() was called without predecessors")
+
+        pred = self.predecessors
+        offset = self._rows[source] * (len(pred) // len(self.sources))
+
+        if pred[offset + target] == -1:
+            return None
+
+        path = [target]
+        while path[-1] != source:
+            path.append(pred[offset + path[-1]])
+        path.reverse()
+        return path
+
+
+def distances(graph, sources, targets=None, workers=None, predecessors=False):
+    """One to all Dijkstra from every vertex in sources. Returns a
+    DistanceMatrix of the costs to targets (default every vertex), and the
+    shortest path trees if predecessors is True.
+
+    The sources are split over a pool of worker processes (default one per
+    CPU). The graph is copied once into shared memory in compressed sparse
+    row form, and workers write their rows straight into a shared result
+    buffer, so nothing large is pickled."""
+    sources = list(sources)
+    wanted = None if targets is None else list(targets)
+    columns = wanted if wanted is not None else list(range(len(graph.vertices)))
+
+    V, S, T = len(graph.vertices), len(sources), len(columns)
+    data = array('d', [INF]) * (S * T)
+    pred = array('i', [-1]) * (S * V) if predecessors else None
+
+    workers = min(workers or os.cpu_count() or 1, S)
+    offsets, edge_targets, costs = _csr(graph)
+
+    if workers <= 1:
+        csr = (offsets, edge_targets, costs)
+        out = memoryview(data)
+        for row, source in enumerate(sources):
+            _search(csr, source, wanted, out[row * T:(row + 1) * T],
+                    None if pred is None else
+                    memoryview(pred)[row * V:(row + 1) * V])
+        return DistanceMatrix(sources, columns, data, pred)
+
+    E = len(edge_targets)
+    graph_size = 8 * (V + 1) + 12 * E
+    result_size = 8 * S * T + (4 * S * V if predecessors else 0)
+
+    blocks = [shared_memory.SharedMemory(create=True, size=max(graph_size, 1)),
+              shared_memory.SharedMemory(create=True, size=max(result_size, 1))]
+    csr, out, shared_pred = _views([block.buf for block in blocks],
+                                   V, E, S, T, predecessors)
+    try:
+        csr[0][:] = offsets
+        csr[1][:] = edge_targets
+        csr[2][:] = costs
+        out[:] = data
+        if shared_pred is not None:
+            shared_pred[:] = pred
+
+        # A few chunks per worker so uneven searches balance out
+        rows = list(enumerate(sources))
+        size = max(1, len(rows) // (workers * 4))
+        chunks = [rows[i:i + size] for i in range(0, len(rows), size)]
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=([block.name for block in blocks],
+                                           V, E, S, T, wanted,
+                                           predecessors)) as pool:
+            for _ in pool.map(_run_rows, chunks):
+                pass
+
+        data = array('d')
+        data.frombytes(out.tobytes())
+        if shared_pred is not None:
+            pred = array('i')
+            pred.frombytes(shared_pred.tobytes())
+    finally:
+        # The views have to go before the blocks can be closed
+        for view in csr + (out, shared_pred):
+            if view is not None:
+                view.release()
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    return DistanceMatrix(sources, columns, data, pred)
@@ -4,9 +4,21 @@
 #include <stdbool.h>
 #include <math.h>
 #include <pthread.h>
+#include <limits.h>
+#include <string.h>
+#include <stdint.h>
 
 #define V 50
 
+/*
+ * The settings below are shared by every caller in the process, so two
+ * layouts with different constants have to config() before each run.
+ * Runs and config() hold RUN_LOCK, so the settings and the pool never
+ * change under a run in progress. Runs on different threads take turns,
+ * as they would for the pool anyway.
+ */
+pthread_mutex_t RUN_LOCK = PTHREAD_MUTEX_INITIALIZER;
+
 double C1 = 2.0;
 double C2 = 1.0;
 double C3 = 1.0;
@@ -15,6 +27,12 @@ double C4 = 0.1;
 bool THREADED = false;
 unsigned NUM_THREADS = 4;
 
+/* Barnes-Hut opening angle. 0 computes repulsion between every pair */
+double THETA = 0.0;
+
+/* Points closer together than the smallest cell at this depth share a leaf */
+#define QT_MAX_DEPTH 32
+
 struct vec2 {
 	double x;
 	double y;
@@ -25,17 +43,35 @@ struct edge {
 	int w;
 };
 
-double
-distance(struct vec2 *from, struct vec2 *to)
-{
-	return sqrt( pow(from->x - to->x, 2) + pow(from->y - to->y, 2) );
-}
+/*
+ * A quadtree node. point is the vertex stored in a leaf, QT_INTERNAL for
+ * nodes with children and QT_BUCKET for a leaf holding coincident vertices.
+ */
+#define QT_INTERNAL -1
+#define QT_BUCKET -2
+
+struct qnode {
+	double x0;
+	double y0;
+	double size;
+	double cx;
+	double cy;
+	int mass;
+	int point;
+	int child[4];
+};
+
+struct quadtree {
+	struct qnode *nodes;
+	int len;
+	int cap;
+};
 
 double
 repulsion(double distance)
 {
 	double denom = distance > C2 ? distance : C2;
-	return (C3 / pow(denom, 2));
+	return (C3 / (denom * denom));
 }
 
 double
@@ -44,173 +80,634 @@ attraction(double distance)
 	return C1 * log10(distance / C2);
 }
 
-struct vec2
-unit_vec(struct vec2 *from, struct vec2 *to)
-{
-	struct vec2 vec;
+/*
+ * Scratch space for the layout. There is one, SCRATCH, kept between calls
+ * under RUN_LOCK and only grown when a larger graph comes along, so step()
+ * doesn't allocate anything once the first iteration has run. Positions
+ * and forces are stored as separate x and y arrays so the compiler can
+ * vectorize the loops over them.
+ */
+struct layout {
+	int n;
+	int cap;     // Vertices there is room for
+	double *x;
+	double *y;
+	double *fx;  // Distance moved by repulsion in the current iteration
+	double *fy;
+	double *ax;  // Distance moved by attraction in the current iteration
+	double *ay;
+	struct quadtree tree;
+};
+
+struct layout SCRATCH;
 
-	double x3 = to->x - from->x;
-	double y3 = to->y - from->y;
+/*
+ * Make room for n vertices, keeping the buffers if they are already big
+ * enough. Returns -1, leaving the layout as it was, if memory runs out.
+ */
+int
+layout_reserve(struct layout *layout, int n)
+{
+	if (n <= layout->cap && layout->x) {
+		layout->n = n;
+		return 0;
+	}
 
-	double magnitude = sqrt( pow(x3, 2) + pow(y3, 2) );
+	// Round each array up to a whole number of cache lines
+	size_t stride = ((size_t)n + 7) & ~(size_t)7;
+	void *block;
 
-	if (isnormal(magnitude)) {
-		vec.x = x3 / magnitude;
-		vec.y = y3 / magnitude;
+	if (posix_memalign(&block, 64, sizeof(double) * (6 * stride + 8))) {
+		return -1;
 	}
-	else {
-		vec.x = 0.0;
-		vec.y = 0.0;
+
+	int tree_cap = 2 * n + 1 > layout->tree.cap ? 2 * n + 1 : layout->tree.cap;
+	struct qnode *nodes = realloc(layout->tree.nodes, sizeof(struct qnode) * tree_cap);
+	if (!nodes) {
+		free(block);
+		return -1;
 	}
 
-	return vec;
+	free(layout->x);
+	layout->n = n;
+	layout->cap = n;
+	layout->x = (double *)block;
+	layout->y = layout->x + stride;
+	layout->fx = layout->y + stride;
+	layout->fy = layout->fx + stride;
+	layout->ax = layout->fy + stride;
+	layout->ay = layout->ax + stride;
+
+	layout->tree.nodes = nodes;
+	layout->tree.cap = tree_cap;
+	layout->tree.len = 0;
+
+	return 0;
 }
 
 void
-apply_vforce(struct vec2 *p1, struct vec2 *p2)
+layout_free(struct layout *layout)
 {
-	double d = distance(p1, p2);
-	double f = repulsion(d) * C4;
-	struct vec2 unit = unit_vec(p2, p1);
+	free(layout->x);
+	free(layout->tree.nodes);
+	memset(layout, 0, sizeof(struct layout));
+}
 
-	p1->x += unit.x * f;
-	p1->y += unit.y * f;
+void
+layout_load(struct layout *layout, struct vec2 *vertices)
+{
+	for (int i = 0; i < layout->n; i++) {
+		layout->x[i] = vertices[i].x;
+		layout->y[i] = vertices[i].y;
+	}
 }
 
 void
-apply_vertforces(struct vec2 *vertices, int n)
+layout_store(struct layout *layout, struct vec2 *vertices)
 {
-	struct vec2 new_vertices[n];
+	for (int i = 0; i < layout->n; i++) {
+		vertices[i].x = layout->x[i];
+		vertices[i].y = layout->y[i];
+	}
+}
 
-	for (int i = 0; i < n; i++) {
+/* Returns the index of the new node, or -1 if memory runs out */
+static int
+qt_new_node(struct quadtree *tree, double x0, double y0, double size)
+{
+	if (tree->len == tree->cap) {
+		struct qnode *nodes = realloc(tree->nodes, sizeof(struct qnode) * 2 * tree->cap);
+		if (!nodes) {
+			return -1;
+		}
+		tree->nodes = nodes;
+		tree->cap *= 2;
+	}
 
-		new_vertices[i] = vertices[i];
+	struct qnode *node = &tree->nodes[tree->len];
+	node->x0 = x0;
+	node->y0 = y0;
+	node->size = size;
+	node->cx = 0.0;
+	node->cy = 0.0;
+	node->mass = 0;
+	node->point = QT_INTERNAL;
+	for (int q = 0; q < 4; q++) {
+		node->child[q] = -1;
+	}
+
+	return tree->len++;
+}
+
+static int
+qt_quadrant(struct qnode *node, double x, double y)
+{
+	double half = node->size / 2;
+	return (x >= node->x0 + half) + 2 * (y >= node->y0 + half);
+}
 
-		for (int j = 0; j < n; j++) {
-			if (j != i) {
-				apply_vforce(&new_vertices[i], &vertices[j]);
+static int
+qt_child(struct quadtree *tree, int n, int q)
+{
+	if (tree->nodes[n].child[q] == -1) {
+		double half = tree->nodes[n].size / 2;
+		int c = qt_new_node(tree,
+				    tree->nodes[n].x0 + half * (q & 1),
+				    tree->nodes[n].y0 + half * (q >> 1),
+				    half);
+		if (c < 0) {
+			return -1;
+		}
+		// qt_new_node may have moved the node array
+		tree->nodes[n].child[q] = c;
+	}
+	return tree->nodes[n].child[q];
+}
+
+/* Returns -1 if memory runs out, 0 otherwise */
+static int
+qt_insert(struct quadtree *tree, const double *xs, const double *ys, int i)
+{
+	double x = xs[i];
+	double y = ys[i];
+	int n = 0;
+
+	for (int depth = 0; ; depth++) {
+		struct qnode *node = &tree->nodes[n];
+
+		if (node->mass == 0) {
+			node->point = i;
+			node->cx = x;
+			node->cy = y;
+			node->mass = 1;
+			return 0;
+		}
+
+		node->cx = (node->cx * node->mass + x) / (node->mass + 1);
+		node->cy = (node->cy * node->mass + y) / (node->mass + 1);
+		node->mass++;
+
+		if (node->point != QT_INTERNAL) {
+			if (depth >= QT_MAX_DEPTH) {
+				node->point = QT_BUCKET;
+				return 0;
 			}
+
+			// Push the vertex stored in this leaf down a level
+			int old = node->point;
+			node->point = QT_INTERNAL;
+
+			int c = qt_child(tree, n, qt_quadrant(node, xs[old], ys[old]));
+			if (c < 0) {
+				return -1;
+			}
+			tree->nodes[c].point = old;
+			tree->nodes[c].cx = xs[old];
+			tree->nodes[c].cy = ys[old];
+			tree->nodes[c].mass = 1;
+		}
+
+		n = qt_child(tree, n, qt_quadrant(&tree->nodes[n], x, y));
+		if (n < 0) {
+			return -1;
 		}
 	}
+}
+
+/*
+ * Build the quadtree over the layout's current positions, reusing the
+ * node array left over from the previous iteration. Returns -1 if memory
+ * runs out.
+ */
+int
+qt_build(struct layout *layout)
+{
+	struct quadtree *tree = &layout->tree;
+	const double *x = layout->x;
+	const double *y = layout->y;
+	int n = layout->n;
+
+	double min_x = n ? x[0] : 0.0, max_x = min_x;
+	double min_y = n ? y[0] : 0.0, max_y = min_y;
+
+	for (int i = 1; i < n; i++) {
+		min_x = fmin(min_x, x[i]);
+		max_x = fmax(max_x, x[i]);
+		min_y = fmin(min_y, y[i]);
+		max_y = fmax(max_y, y[i]);
+	}
+
+	double size = fmax(max_x - min_x, max_y - min_y);
+
+	tree->len = 0;
+
+	// Pad the square so the largest coordinates fall inside it
+	if (qt_new_node(tree, min_x, min_y, size * 1.001 + 1e-9) < 0) {
+		return -1;
+	}
 
 	for (int i = 0; i < n; i++) {
-		vertices[i] = new_vertices[i];
+		if (qt_insert(tree, x, y, i) < 0) {
+			return -1;
+		}
 	}
-};
 
-struct apply_vforces_args {
-	struct vec2 *vertices;
-	struct vec2 *new_vertices;
-	int begin;
-	int end;
-	int n;
-};
+	return 0;
+}
 
-void *
-apply_vforces_thread(void *args)
+/*
+ * Approximate the repulsion on vertex i from every other vertex with
+ * Barnes-Hut and store it in fx[i], fy[i].
+ */
+void
+qt_repulse(struct layout *layout, int i)
 {
-	/*
-	 * Update vertices[begin] through vertices[end]
-	 */
+	struct quadtree *tree = &layout->tree;
+	int stack[3 * QT_MAX_DEPTH + 4];
+	int top = 0;
+	double x = layout->x[i];
+	double y = layout->y[i];
+	double fx = 0.0;
+	double fy = 0.0;
 
-	int result;
+	stack[top++] = 0;
 
-	// Unpack args
-	struct vec2 *new_vertices = ((struct apply_vforces_args *)args)->new_vertices;
-	struct vec2 *vertices = ((struct apply_vforces_args *)args)->vertices;
-	int begin = ((struct apply_vforces_args *)args)->begin;
-	int end = ((struct apply_vforces_args *)args)->end;
-	int n = ((struct apply_vforces_args *)args)->n;
+	while (top > 0) {
+		struct qnode *node = &tree->nodes[stack[--top]];
 
-	// Apply vforces
-	for (int i = begin; i <= end; i++) {
-		for (int j = 0; j < n; j++) {
-			if (i != j) { // Don't apply force to yourself
-				apply_vforce(&new_vertices[i], &vertices[j]);
+		if (node->mass == 0 || node->point == i) {
+			continue;
+		}
+
+		double dx = x - node->cx;
+		double dy = y - node->cy;
+		double d = sqrt(dx * dx + dy * dy);
+
+		bool inside = x >= node->x0 && x < node->x0 + node->size &&
+			      y >= node->y0 && y < node->y0 + node->size;
+
+		if (node->point != QT_INTERNAL || (!inside && node->size < THETA * d)) {
+			if (d > 0.0) {
+				double f = node->mass * repulsion(d) * C4 / d;
+				fx += dx * f;
+				fy += dy * f;
+			}
+		}
+		else {
+			for (int q = 0; q < 4; q++) {
+				if (node->child[q] != -1) {
+					stack[top++] = node->child[q];
+				}
 			}
 		}
 	}
 
-	pthread_exit(0);
+	layout->fx[i] = fx;
+	layout->fy[i] = fy;
+}
 
+/* Vertices per block of the exact repulsion loop, sized to stay in L1 */
+#define TILE 256
+
+/*
+ * Add the repulsion from the vertex at (xj, yj) to vertices [begin, end).
+ * Every lane of a vector register accumulates its own vertex so gcc can
+ * vectorize this without reordering any sums.
+ */
+static inline void
+repulse_from(const double *restrict x, const double *restrict y,
+	     double *restrict fx, double *restrict fy, int begin, int end,
+	     double xj, double yj, double k, double c2_sq)
+{
+	for (int i = begin; i < end; i++) {
+		double dx = x[i] - xj;
+		double dy = y[i] - yj;
+		double d_sq = dx * dx + dy * dy;
+		double denom = d_sq > c2_sq ? d_sq : c2_sq;
+
+		// repulsion(d) * C4 along the unit vector, 0 for itself
+		double f = k / (denom * sqrt(d_sq));
+		f = d_sq > 0.0 ? f : 0.0;
+
+		fx[i] += dx * f;
+		fy[i] += dy * f;
+	}
 }
 
-void apply_vertforces_threaded(struct vec2 *vertices, int n)
+/*
+ * Store the repulsion on vertices [begin, end) from every vertex in fx, fy.
+ */
+void
+repulse(struct layout *layout, int begin, int end)
 {
-	int result;
-	struct vec2 new_vertices[n];
-	struct apply_vforces_args args[NUM_THREADS];
-	pthread_t threads[NUM_THREADS];
+	const double c2_sq = C2 * C2;
+	const double k = C3 * C4;
 
-	int chunk_size = n / NUM_THREADS;
+	for (int tile = begin; tile < end; tile += TILE) {
+		int tile_end = tile + TILE < end ? tile + TILE : end;
 
-	// Copy vertices into new_vertices
-	for (int i = 0; i < n; i++) {
-		new_vertices[i] = vertices[i];
+		for (int i = tile; i < tile_end; i++) {
+			layout->fx[i] = 0.0;
+			layout->fy[i] = 0.0;
+		}
+
+		for (int j = 0; j < layout->n; j++) {
+			repulse_from(layout->x, layout->y, layout->fx, layout->fy,
+				     tile, tile_end, layout->x[j], layout->y[j], k, c2_sq);
+		}
+	}
+}
+
+static void
+repulse_job(void *ctx, int begin, int end)
+{
+	struct layout *layout = (struct layout *)ctx;
+
+	if (THETA > 0.0) {
+		for (int i = begin; i < end; i++) {
+			qt_repulse(layout, i);
+		}
 	}
+	else {
+		repulse(layout, begin, end);
+	}
+}
+
+/*
+ * A pool of worker threads that lives between calls. config() creates it and
+ * it is torn down when the module is freed. A job is a function applied to
+ * the range [0, n); workers take chunks of it from a shared counter until
+ * it runs out, so faster threads end up doing more of the work.
+ */
+typedef void (*job_func)(void *ctx, int begin, int end);
+
+struct pool {
+	pthread_t *threads;
+	unsigned size;
+
+	pthread_mutex_t submit;   // Held for the whole of pool_run
+	pthread_mutex_t lock;
+	pthread_cond_t work_ready;
+	pthread_cond_t work_done;
+	unsigned long generation; // Bumped for every job
+	unsigned busy;            // Workers still on the current job
+	bool shutdown;
+
+	job_func func;
+	void *ctx;
+	int n;
+	int chunk;
+	int next;                 // Start of the next chunk to hand out
+};
 
-	for (int i = 0; i < NUM_THREADS; i++) {
-		args[i].vertices = vertices;
-		args[i].new_vertices = &new_vertices[0];
-		args[i].n = n;
-		args[i].begin = i * chunk_size;
-		args[i].end = (i < (NUM_THREADS - 1)) ? (((i + 1) * chunk_size) - 1) : n - 1;
+struct pool *POOL = NULL;
 
-		result = pthread_create(&(threads[i]), NULL, apply_vforces_thread, (void *)&(args[i]));
-		assert (!result);
+static void
+pool_work(struct pool *pool)
+{
+	int begin;
+
+	while ((begin = __atomic_fetch_add(&pool->next, pool->chunk, __ATOMIC_RELAXED)) < pool->n) {
+		int end = begin + pool->chunk < pool->n ? begin + pool->chunk : pool->n;
+		pool->func(pool->ctx, begin, end);
 	}
+}
+
+static void *
+pool_worker(void *arg)
+{
+	struct pool *pool = (struct pool *)arg;
+	unsigned long seen = 0;
+
+	pthread_mutex_lock(&pool->lock);
+
+	while (true) {
+		while (pool->generation == seen && !pool->shutdown) {
+			pthread_cond_wait(&pool->work_ready, &pool->lock);
+		}
+
+		if (pool->shutdown) {
+			break;
+		}
 
-	for (int i = 0; i < NUM_THREADS; i++) {
-		result = pthread_join(threads[i], NULL);
-		assert (!result);
+		seen = pool->generation;
+		pthread_mutex_unlock(&pool->lock);
+
+		pool_work(pool);
+
+		pthread_mutex_lock(&pool->lock);
+		if (--pool->busy == 0) {
+			pthread_cond_signal(&pool->work_done);
+		}
 	}
 
-	for (int i = 0; i < n; i++) {
-		vertices[i] = new_vertices[i];
+	pthread_mutex_unlock(&pool->lock);
+	return NULL;
+}
+
+struct pool *
+pool_create(unsigned size)
+{
+	struct pool *pool = calloc(1, sizeof(struct pool));
+	if (!pool) {
+		return NULL;
+	}
+
+	pool->threads = calloc(size ? size : 1, sizeof(pthread_t));
+	if (!pool->threads) {
+		free(pool);
+		return NULL;
 	}
+
+	pthread_mutex_init(&pool->submit, NULL);
+	pthread_mutex_init(&pool->lock, NULL);
+	pthread_cond_init(&pool->work_ready, NULL);
+	pthread_cond_init(&pool->work_done, NULL);
+
+	for (pool->size = 0; pool->size < size; pool->size++) {
+		if (pthread_create(&pool->threads[pool->size], NULL, pool_worker, pool)) {
+			break;
+		}
+	}
+
+	return pool;
 }
 
 void
-apply_edgeforces(struct vec2 *vertices, int num_vertices, struct edge *edges, int num_edges)
+pool_destroy(struct pool *pool)
 {
-	struct vec2 vert_delta[num_vertices];
-	for (int i = 0; i < num_vertices; i++) {
-		vert_delta[i].x = 0.0;
-		vert_delta[i].y = 0.0;
+	if (!pool) {
+		return;
+	}
+
+	pthread_mutex_lock(&pool->lock);
+	pool->shutdown = true;
+	pthread_cond_broadcast(&pool->work_ready);
+	pthread_mutex_unlock(&pool->lock);
+
+	for (unsigned i = 0; i < pool->size; i++) {
+		pthread_join(pool->threads[i], NULL);
+	}
+
+	pthread_mutex_destroy(&pool->submit);
+	pthread_mutex_destroy(&pool->lock);
+	pthread_cond_destroy(&pool->work_ready);
+	pthread_cond_destroy(&pool->work_done);
+	free(pool->threads);
+	free(pool);
+}
+
+/*
+ * Apply func to [0, n) across the pool and return once it is all done. The
+ * calling thread works on the job too.
+ */
+void
+pool_run(struct pool *pool, job_func func, void *ctx, int n)
+{
+	pthread_mutex_lock(&pool->submit);
+
+	// Several chunks per thread so the work can be balanced
+	int chunk = n / ((pool->size + 1) * 8);
+
+	pthread_mutex_lock(&pool->lock);
+	pool->func = func;
+	pool->ctx = ctx;
+	pool->n = n;
+	pool->chunk = chunk > 16 ? chunk : 16;
+	pool->next = 0;
+	pool->busy = pool->size;
+	pool->generation++;
+	pthread_cond_broadcast(&pool->work_ready);
+	pthread_mutex_unlock(&pool->lock);
+
+	pool_work(pool);
+
+	pthread_mutex_lock(&pool->lock);
+	while (pool->busy > 0) {
+		pthread_cond_wait(&pool->work_done, &pool->lock);
+	}
+	pthread_mutex_unlock(&pool->lock);
+
+	pthread_mutex_unlock(&pool->submit);
+}
+
+
+/*
+ * Compute one iteration of the layout. Repulsion is computed from the
+ * positions at the start of the iteration, attraction from the positions
+ * after repulsion has been applied. Returns the largest squared distance
+ * moved by a vertex and adds the sum of them to *energy, or returns -1
+ * without moving anything if memory runs out.
+ */
+double
+layout_step(struct layout *layout, struct edge *edges, int num_edges, double *energy)
+{
+	double *restrict x = layout->x;
+	double *restrict y = layout->y;
+	double *restrict ax = layout->ax;
+	double *restrict ay = layout->ay;
+	int n = layout->n;
+	double max_move = 0.0;
+
+	if (n == 0) {
+		return 0.0;
+	}
+
+	if (THETA > 0.0 && qt_build(layout) < 0) {
+		return -1.0;
+	}
+
+	if (THREADED && POOL) {
+		pool_run(POOL, repulse_job, layout, n);
+	}
+	else {
+		repulse_job(layout, 0, n);
+	}
+
+	for (int i = 0; i < n; i++) {
+		x[i] += layout->fx[i];
+		y[i] += layout->fy[i];
+		ax[i] = 0.0;
+		ay[i] = 0.0;
 	}
 
 	for (int i = 0; i < num_edges; i++) {
 		int v = edges[i].v;
 		int w = edges[i].w;
 
-		double d = distance(&(vertices[v]), &(vertices[w]));
-		double f = attraction(d) * C4;
+		double dx = x[w] - x[v];
+		double dy = y[w] - y[v];
+		double d = sqrt(dx * dx + dy * dy);
 
-		if (!isnormal(f)) {
-			continue;
+		if (d > 0.0) {
+			double f = attraction(d) * C4 / d;
+
+			ax[v] += dx * f;
+			ay[v] += dy * f;
+			ax[w] -= dx * f;
+			ay[w] -= dy * f;
 		}
+	}
 
-		struct vec2 unit = unit_vec(&(vertices[v]), &(vertices[w]));
-		struct vec2 delta;
+	for (int i = 0; i < n; i++) {
+		x[i] += ax[i];
+		y[i] += ay[i];
 
-		delta.x = unit.x * f;
-		delta.y = unit.y * f;
+		double mx = layout->fx[i] + ax[i];
+		double my = layout->fy[i] + ay[i];
+		double move = mx * mx + my * my;
 
-		if (!isnormal(delta.x) || !isnormal(delta.y)) {
-			continue;
-		}
+		*energy += move;
+		max_move = fmax(max_move, move);
+	}
+
+	return max_move;
+}
 
-		vert_delta[v].x += delta.x;
-		vert_delta[v].y += delta.y;
+/*
+ * Run up to max_iters iterations on vertices in place, stopping once no
+ * vertex moves further than tol. Returns the number of iterations run, or
+ * -1 if memory runs out, in which case vertices are left as they were.
+ * *energy is set to the sum of the squared distances moved by every vertex
+ * in the last iteration.
+ */
+int
+layout_run(struct vec2 *vertices, int num_vertices, struct edge *edges, int num_edges,
+	   int max_iters, double tol, double *energy)
+{
+	struct layout *layout = &SCRATCH;
+	int iters = 0;
+
+	pthread_mutex_lock(&RUN_LOCK);
 
-		vert_delta[w].x -= delta.x;
-		vert_delta[w].y -= delta.y;
+	if (layout_reserve(layout, num_vertices) < 0) {
+		pthread_mutex_unlock(&RUN_LOCK);
+		return -1;
+	}
+
+	layout_load(layout, vertices);
+
+	while (iters < max_iters) {
+		*energy = 0.0;
+		double max_move = layout_step(layout, edges, num_edges, energy);
+		if (max_move < 0.0) {
+			iters = -1;
+			break;
+		}
+		iters++;
+
+		if (sqrt(max_move) < tol) {
+			break;
+		}
 	}
 
-	for (int i = 0; i < num_vertices; i++) {
-		vertices[i].x += vert_delta[i].x;
-		vertices[i].y += vert_delta[i].y;
+	if (iters >= 0) {
+		layout_store(layout, vertices);
 	}
+
+	pthread_mutex_unlock(&RUN_LOCK);
+
+	return iters;
 }
 
 static PyObject *
@@ -310,20 +807,17 @@ fdag(PyObject *self, PyObject *args)
 
 
 	// Should do this on failure as well...
+	// vert_obj and edge_obj are borrowed references so they are left alone
 	Py_DECREF(vert_iter);
 	Py_DECREF(edge_iter);
-	Py_DECREF(vert_obj);
-	Py_DECREF(edge_obj);
 
 	// Do what we came here for
-	if (THREADED) {
-		apply_vertforces_threaded(vertices, num_verts);
+	double energy = 0.0;
+	if (layout_run(vertices, num_verts, edges, num_edges, 1, 0.0, &energy) < 0) {
+		free(vertices);
+		free(edges);
+		return PyErr_NoMemory();
 	}
-	else {
-		apply_vertforces(vertices, num_verts);
-	}
-
-	apply_edgeforces(vertices, num_verts, edges, num_edges);
 
 	// Create and populate a python list to return
 	PyObject *ret_list = PyList_New(num_verts);
@@ -354,6 +848,167 @@ fdag(PyObject *self, PyObject *args)
 	return ret_list;
 }
 
+static bool
+buffer_has_format(Py_buffer *view, char format, Py_ssize_t itemsize)
+{
+	// Accept byte order prefixes such as numpy's "<d"
+	const char *fmt = view->format ? view->format : "B";
+	size_t len = strlen(fmt);
+
+	return view->itemsize == itemsize && len > 0 && fmt[len - 1] == format &&
+		(len == 1 || (len == 2 && strchr("@=<>!", fmt[0])));
+}
+
+/*
+ * Get the positions (writable doubles, x0 y0 x1 y1 ...) and edges (ints,
+ * v0 w0 v1 w1 ...) buffers from their objects and check they describe a
+ * valid graph. On failure an exception is set, nothing is held and -1 is
+ * returned.
+ */
+static int
+get_layout_buffers(PyObject *pos_obj, PyObject *edge_obj,
+		   Py_buffer *positions, Py_buffer *edges)
+{
+	int flags = PyBUF_C_CONTIGUOUS | PyBUF_FORMAT;
+
+	if (PyObject_GetBuffer(pos_obj, positions, flags | PyBUF_WRITABLE) < 0) {
+		return -1;
+	}
+
+	if (PyObject_GetBuffer(edge_obj, edges, flags) < 0) {
+		PyBuffer_Release(positions);
+		return -1;
+	}
+
+	if (!buffer_has_format(positions, 'd', sizeof(double)) ||
+	    positions->len % sizeof(struct vec2) != 0) {
+		PyErr_SetString(PyExc_TypeError,
+				"positions must be a contiguous buffer of x, y doubles");
+		goto fail;
+	}
+
+	if (!buffer_has_format(edges, 'i', sizeof(int)) ||
+	    edges->len % sizeof(struct edge) != 0) {
+		PyErr_SetString(PyExc_TypeError,
+				"edges must be a contiguous buffer of v, w ints");
+		goto fail;
+	}
+
+	Py_ssize_t num_vertices = positions->len / sizeof(struct vec2);
+	Py_ssize_t num_edges = edges->len / sizeof(struct edge);
+	int *ends = (int *)edges->buf;
+
+	if (num_vertices > INT_MAX || num_edges > INT_MAX) {
+		PyErr_SetString(PyExc_OverflowError, "graph is too large");
+		goto fail;
+	}
+
+	for (Py_ssize_t i = 0; i < 2 * num_edges; i++) {
+		if (ends[i] < 0 || ends[i] >= num_vertices) {
+			PyErr_Format(PyExc_IndexError,
+				     "edge references vertex %d of %zd", ends[i], num_vertices);
+			goto fail;
+		}
+	}
+
+	return 0;
+
+fail:
+	PyBuffer_Release(positions);
+	PyBuffer_Release(edges);
+	return -1;
+}
+
+static PyObject *
+step(PyObject *self, PyObject *args)
+{
+	/*
+	 * Compute one iteration of the layout in place. The arguments are
+	 * 	1) A writable buffer of doubles holding the x,y coords of every
+	 * 	   vertex one after the other (array.array('d'), numpy float64...)
+	 * 	2) A buffer of ints holding the two vertex indices of every edge
+	 * 	   one after the other (array.array('i'), numpy int32...)
+	 *
+	 * Nothing is copied; the positions buffer is updated in place.
+	 */
+
+	PyObject *pos_obj;
+	PyObject *edge_obj;
+	Py_buffer positions;
+	Py_buffer edges;
+
+	if (!PyArg_ParseTuple(args, "OO", &pos_obj, &edge_obj)) {
+		return NULL;
+	}
+
+	if (get_layout_buffers(pos_obj, edge_obj, &positions, &edges) < 0) {
+		return NULL;
+	}
+
+	int iters;
+	double energy = 0.0;
+
+	Py_BEGIN_ALLOW_THREADS
+	iters = layout_run((struct vec2 *)positions.buf, positions.len / sizeof(struct vec2),
+			   (struct edge *)edges.buf, edges.len / sizeof(struct edge),
+			   1, 0.0, &energy);
+	Py_END_ALLOW_THREADS
+
+	PyBuffer_Release(&positions);
+	PyBuffer_Release(&edges);
+
+	if (iters < 0) {
+		return PyErr_NoMemory();
+	}
+
+	Py_RETURN_NONE;
+}
+
+static PyObject *
+run(PyObject *self, PyObject *args)
+{
+	/*
+	 * Compute up to max_iters iterations of the layout in place on the same
+	 * buffers step() takes, without holding the GIL. Stops early once no
+	 * vertex moves further than tol in an iteration.
+	 *
+	 * Returns a tuple of the number of iterations run and the energy of the
+	 * last one, the sum of the squared distances moved by every vertex.
+	 */
+
+	PyObject *pos_obj;
+	PyObject *edge_obj;
+	Py_buffer positions;
+	Py_buffer edges;
+	int max_iters = 300;
+	double tol = 0.0;
+	int iters = 0;
+	double energy = 0.0;
+
+	if (!PyArg_ParseTuple(args, "OO|id", &pos_obj, &edge_obj, &max_iters, &tol)) {
+		return NULL;
+	}
+
+	if (get_layout_buffers(pos_obj, edge_obj, &positions, &edges) < 0) {
+		return NULL;
+	}
+
+	Py_BEGIN_ALLOW_THREADS
+	iters = layout_run((struct vec2 *)positions.buf, positions.len / sizeof(struct vec2),
+			   (struct edge *)edges.buf, edges.len / sizeof(struct edge),
+			   max_iters, tol, &energy);
+	Py_END_ALLOW_THREADS
+
+	PyBuffer_Release(&positions);
+	PyBuffer_Release(&edges);
+
+	if (iters < 0) {
+		return PyErr_NoMemory();
+	}
+
+	return Py_BuildValue("id", iters, energy);
+}
+
 static PyObject *
 config(PyObject *self, PyObject *args)
 {
@@ -361,45 +1016,372 @@ config(PyObject *self, PyObject *args)
 	double c2;
 	double c3;
 	double c4;
-	bool threaded;
+	int threaded;
 	int num_threads;
+	double theta = 0.0;
+
+	if (!PyArg_ParseTuple(args, "ddddpi|d", &c1, &c2, &c3, &c4, &threaded, &num_threads, &theta)) {
+		return NULL;
+	}
+
+	if (isnan(c1) || isnan(c2) || isnan(c3) || isnan(c4)) {
+		fprintf(stderr, "NaN in config!\n"
+				"C1: %f, C2: %f, C3 %f, C4: %f\n",
+				c1, c2, c3, c4);
+		exit(-1);
+	}
 
-	if (!PyArg_ParseTuple(args, "ddddpi", &c1, &c2, &c3, &c4, &threaded, &num_threads)) {
+	if (threaded && num_threads < 1) {
+		PyErr_SetString(PyExc_ValueError, "num_threads must be at least 1");
 		return NULL;
 	}
 
+	bool failed = false;
+
+	// Wait for any run on another thread to finish with the pool
+	Py_BEGIN_ALLOW_THREADS
+	pthread_mutex_lock(&RUN_LOCK);
+
 	C1 = c1;
 	C2 = c2;
 	C3 = c3;
 	C4 = c4;
+	THETA = theta;
 
-	if (isnan(C1) || isnan(C2) || isnan(C3) || isnan(C4)) {
-		fprintf(stderr, "NaN in config!\n"
-				"C1: %f, C2: %f, C3 %f, C4: %f\n",
-				C1, C2, C3, C4);
-		exit(-1);
+	// Only start new workers when the number of threads changes
+	if (!threaded || (unsigned)num_threads != NUM_THREADS) {
+		pool_destroy(POOL);
+		POOL = NULL;
+	}
+
+	if (threaded && !POOL) {
+		// The calling thread does its share of the work as well
+		POOL = pool_create(num_threads - 1);
+		failed = !POOL;
+	}
+
+	if (!failed) {
+		THREADED = threaded;
+		NUM_THREADS = num_threads;
+	}
+
+	pthread_mutex_unlock(&RUN_LOCK);
+	Py_END_ALLOW_THREADS
+
+	if (failed) {
+		return PyErr_NoMemory();
+	}
+
+	Py_INCREF(Py_None);
+	return Py_None;
+
+}
+
+/*
+ * Gauss-Seidel passes over distance constraints. Each edge is pulled back
+ * towards its rest length, moving each end in proportion to its weight
+ * (0 pins it in place).
+ */
+static void
+relax_edges(struct vec2 *p, const struct edge *e, const double *lengths,
+	    const double *weights, Py_ssize_t num_edges, int passes)
+{
+	for (int pass = 0; pass < passes; pass++) {
+		for (Py_ssize_t k = 0; k < num_edges; k++) {
+			struct vec2 *a = &p[e[k].v];
+			struct vec2 *b = &p[e[k].w];
+			double wa = weights[2 * k];
+			double wb = weights[2 * k + 1];
+			double dx = b->x - a->x;
+			double dy = b->y - a->y;
+			double d = sqrt(dx * dx + dy * dy);
+
+			if (d == 0.0 || wa + wb == 0.0) {
+				continue;
+			}
+
+			double diff = (d - lengths[k]) / (d * (wa + wb));
+			a->x += dx * wa * diff;
+			a->y += dy * wa * diff;
+			b->x -= dx * wb * diff;
+			b->y -= dy * wb * diff;
+		}
+	}
+}
+
+static PyObject *
+relax(PyObject *self, PyObject *args)
+{
+	/*
+	 * Relax edges towards their rest lengths in place. The arguments are
+	 * 	1) The positions buffer, as for step()
+	 * 	2) The edges to relax, as for step()
+	 * 	3) A buffer of doubles with the rest length of every edge
+	 * 	4) A buffer of doubles with the weight of both ends of every edge
+	 * 	5) Optionally the number of passes, default 1
+	 */
+
+	PyObject *pos_obj;
+	PyObject *edge_obj;
+	PyObject *length_obj;
+	PyObject *weight_obj;
+	int passes = 1;
+	Py_buffer positions;
+	Py_buffer edges;
+	Py_buffer lengths;
+	Py_buffer weights;
+
+	if (!PyArg_ParseTuple(args, "OOOO|i", &pos_obj, &edge_obj, &length_obj,
+			      &weight_obj, &passes)) {
+		return NULL;
+	}
+
+	if (get_layout_buffers(pos_obj, edge_obj, &positions, &edges) < 0) {
+		return NULL;
 	}
 
-	THREADED = threaded;
-	NUM_THREADS = num_threads;
+	Py_ssize_t num_edges = edges.len / sizeof(struct edge);
+	int flags = PyBUF_C_CONTIGUOUS | PyBUF_FORMAT;
+
+	if (PyObject_GetBuffer(length_obj, &lengths, flags) < 0) {
+		goto fail;
+	}
+
+	if (PyObject_GetBuffer(weight_obj, &weights, flags) < 0) {
+		PyBuffer_Release(&lengths);
+		goto fail;
+	}
+
+	if (!buffer_has_format(&lengths, 'd', sizeof(double)) ||
+	    lengths.len != num_edges * (Py_ssize_t)sizeof(double) ||
+	    !buffer_has_format(&weights, 'd', sizeof(double)) ||
+	    weights.len != 2 * num_edges * (Py_ssize_t)sizeof(double)) {
+		PyErr_SetString(PyExc_TypeError,
+				"lengths and weights must be buffers of one and two doubles per edge");
+		PyBuffer_Release(&lengths);
+		PyBuffer_Release(&weights);
+		goto fail;
+	}
+
+	Py_BEGIN_ALLOW_THREADS
+	relax_edges((struct vec2 *)positions.buf, (struct edge *)edges.buf,
+		    (double *)lengths.buf, (double *)weights.buf, num_edges, passes);
+	Py_END_ALLOW_THREADS
+
+	PyBuffer_Release(&lengths);
+	PyBuffer_Release(&weights);
+	PyBuffer_Release(&positions);
+	PyBuffer_Release(&edges);
 
 	Py_INCREF(Py_None);
 	return Py_None;
 
+fail:
+	PyBuffer_Release(&positions);
+	PyBuffer_Release(&edges);
+	return NULL;
+}
+
+/*
+ * Draw the line from (x1, y1) to (x2, y2), in the centered, y up coordinates
+ * of Viewer.translate, into a width x height image of pitch pixels per row.
+ * It is stepped a pixel at a time along its longer axis and thickened to
+ * weight pixels across it. Only the part near the image is stepped, so lines
+ * running far off screen cost no more than those on it.
+ */
+static void
+raster_line(uint32_t *pixels, Py_ssize_t pitch, int width, int height,
+	    double x1, double y1, double x2, double y2, uint32_t color, int weight)
+{
+	// Screen pixels, truncated as translate() does
+	x1 = trunc(x1 + width / 2.0);
+	x2 = trunc(x2 + width / 2.0);
+	y1 = trunc(height - (y1 + height / 2.0));
+	y2 = trunc(height - (y2 + height / 2.0));
+
+	double dx = x2 - x1;
+	double dy = y2 - y1;
+	double steps = fmax(fabs(dx), fabs(dy));
+	// pygame thickens a single point sideways, like a steep line
+	bool steep = fabs(dy) > fabs(dx) || steps == 0.0;
+
+	if (!isfinite(x1 + y1 + x2 + y2)) {
+		return;
+	}
+
+	// Clip to the image, padded by the weight, with Liang-Barsky
+	double t0 = 0.0, t1 = 1.0;
+	double p[4] = {-dx, dx, -dy, dy};
+	double q[4] = {x1 + weight, width - 1 + weight - x1,
+		       y1 + weight, height - 1 + weight - y1};
+
+	for (int i = 0; i < 4; i++) {
+		if (p[i] == 0.0) {
+			if (q[i] < 0.0) {
+				return;
+			}
+		}
+		else {
+			double t = q[i] / p[i];
+			if (p[i] < 0.0) {
+				t0 = fmax(t0, t);
+			}
+			else {
+				t1 = fmin(t1, t);
+			}
+		}
+	}
+	if (t0 > t1) {
+		return;
+	}
+
+	int lo = -((weight - 1) / 2);
+	int hi = weight / 2;
+	double first = ceil(t0 * steps);
+	double last = floor(t1 * steps);
+
+	for (double s = first; s <= last; s++) {
+		double t = steps > 0.0 ? s / steps : 0.0;
+		long x = lround(x1 + dx * t);
+		long y = lround(y1 + dy * t);
+
+		for (int o = lo; o <= hi; o++) {
+			long px = steep ? x + o : x;
+			long py = steep ? y : y + o;
+			if (px >= 0 && px < width && py >= 0 && py < height) {
+				pixels[py * pitch + px] = color;
+			}
+		}
+	}
+}
+
+static PyObject *
+draw_lines(PyObject *self, PyObject *args)
+{
+	/*
+	 * Draw many lines into an image in one call. The arguments are
+	 * 	1) A writable buffer of 32 bit pixels, such as
+	 * 	   pygame.Surface.get_buffer()
+	 * 	2) The number of pixels per row of the buffer
+	 * 	3) The width and 4) height of the image
+	 * 	5) A buffer of doubles holding x1, y1, x2, y2 for every line, in
+	 * 	   the coordinates of Viewer.translate
+	 * 	6) A buffer of 32 bit pixel values, the color of every line
+	 * 	7) The width of the lines in pixels
+	 */
+
+	PyObject *pixel_obj;
+	PyObject *segment_obj;
+	PyObject *color_obj;
+	Py_ssize_t pitch;
+	int width;
+	int height;
+	int weight;
+	Py_buffer pixels;
+	Py_buffer segments;
+	Py_buffer colors;
+
+	if (!PyArg_ParseTuple(args, "OniiOOi", &pixel_obj, &pitch, &width, &height,
+			      &segment_obj, &color_obj, &weight)) {
+		return NULL;
+	}
+
+	if (width < 0 || height < 0 || pitch < width || weight < 1) {
+		PyErr_SetString(PyExc_ValueError, "bad image size or line width");
+		return NULL;
+	}
+
+	if (PyObject_GetBuffer(pixel_obj, &pixels, PyBUF_C_CONTIGUOUS | PyBUF_WRITABLE) < 0) {
+		return NULL;
+	}
+
+	int flags = PyBUF_C_CONTIGUOUS | PyBUF_FORMAT;
+
+	if (PyObject_GetBuffer(segment_obj, &segments, flags) < 0) {
+		PyBuffer_Release(&pixels);
+		return NULL;
+	}
+
+	if (PyObject_GetBuffer(color_obj, &colors, flags) < 0) {
+		PyBuffer_Release(&pixels);
+		PyBuffer_Release(&segments);
+		return NULL;
+	}
+
+	Py_ssize_t num_lines = segments.len / (4 * sizeof(double));
+
+	if (pixels.len < (Py_ssize_t)sizeof(uint32_t) * pitch * height) {
+		PyErr_SetString(PyExc_ValueError, "pixel buffer is smaller than the image");
+		goto fail;
+	}
+
+	if (!buffer_has_format(&segments, 'd', sizeof(double)) ||
+	    segments.len % (4 * sizeof(double)) != 0) {
+		PyErr_SetString(PyExc_TypeError,
+				"segments must be a contiguous buffer of x1, y1, x2, y2 doubles");
+		goto fail;
+	}
+
+	if (!buffer_has_format(&colors, 'I', sizeof(uint32_t)) ||
+	    colors.len != num_lines * (Py_ssize_t)sizeof(uint32_t)) {
+		PyErr_SetString(PyExc_TypeError,
+				"colors must be a buffer of one 32 bit pixel value per line");
+		goto fail;
+	}
+
+	uint32_t *image = (uint32_t *)pixels.buf;
+	double *s = (double *)segments.buf;
+	uint32_t *c = (uint32_t *)colors.buf;
+
+	Py_BEGIN_ALLOW_THREADS
+	for (Py_ssize_t k = 0; k < num_lines; k++) {
+		raster_line(image, pitch, width, height, s[4 * k], s[4 * k + 1],
+			    s[4 * k + 2], s[4 * k + 3], c[k], weight);
+	}
+	Py_END_ALLOW_THREADS
+
+	PyBuffer_Release(&pixels);
+	PyBuffer_Release(&segments);
+	PyBuffer_Release(&colors);
+
+	Py_INCREF(Py_None);
+	return Py_None;
+
+fail:
+	PyBuffer_Release(&pixels);
+	PyBuffer_Release(&segments);
+	PyBuffer_Release(&colors);
+	return NULL;
 }
 
 static PyMethodDef FdagMethods[] = {
 	{"fdag", fdag, METH_VARARGS, "Compute one iteration of the force-directed graph layout algorithm."},
+	{"step", step, METH_VARARGS, "Compute one iteration of the layout in place on buffers of positions and edges."},
+	{"run", run, METH_VARARGS, "Compute up to max_iters iterations of the layout in place, stopping once no vertex moves further than tol."},
 	{"config", config, METH_VARARGS, "Set constants for computing the force-directed graphing algorithm."},
+	{"relax", relax, METH_VARARGS, "Relax edges towards their rest lengths in place, for dragging vertices."},
+	{"draw_lines", draw_lines, METH_VARARGS, "Draw many lines into a buffer of 32 bit pixels in one call."},
 	{NULL, NULL, 0, NULL}
 };
 
+static void
+fdag_free(void *module)
+{
+	pool_destroy(POOL);
+	POOL = NULL;
+	layout_free(&SCRATCH);
+}
+
 static struct PyModuleDef fdagmodule = {
 	PyModuleDef_HEAD_INIT,
 	"fdag",
 	NULL,
 	-1,
-	FdagMethods
+	FdagMethods,
+	NULL,
+	NULL,
+	NULL,
+	fdag_free
 };
 
 PyMODINIT_FUNC
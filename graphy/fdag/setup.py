@@ -3,6 +3,10 @@ from distutils.core import setup, Extension
 
 module = Extension("fdag",
                    sources = ["fdag.c"],
+                   # Lets gcc vectorize the sqrt and compares in the
+                   # repulsion loop
+                   extra_compile_args = ["-O3", "-fno-math-errno",
+                                         "-fno-trapping-math"],
                    )
 
 setup(name="ForceDirectedGraph",
@@ -0,0 +1,274 @@
+"""Seeded random graph generators that produce edges as a stream of
+array('i') chunks, each holding v, w, v, w, ... for up to `chunk` edges.
+None of them build Vertex objects, so they scale to millions of edges.
+The result can go straight into a CompactGraph or to a file."""
+
+from array import array
+import math
+import random
+import struct
+
+from graphy import np
+from graphy.compactgraph import CompactGraph
+
+
+CHUNK = 2**16  # Edges per chunk
+
+MAGIC = b'GEDG'
+VERSION = 1
+HEADER = struct.Struct('=4sIQQI')  # magic, version, V, E, has coordinates
+
+
+class EdgeStream(object):
+    """Edges of a graph with n vertices, as an iterable of array('i')
+    chunks of v, w pairs. Generators that place their vertices also set xs
+    and ys. The chunks can only be iterated once."""
+
+    def __init__(self, n, chunks, xs=None, ys=None):
+        self.n = n
+        self.chunks = chunks
+        self.xs = xs
+        self.ys = ys
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def to_compact(self):
+        """Consume the stream into a CompactGraph. The edges must already be
+        free of duplicates and self loops, as all of these generators are."""
+        n = self.n
+        chunks = list(self)
+
+        if np is not None:
+            return self._to_compact_numpy(chunks)
+
+        # Count degrees then place every edge at both of its ends
+        offsets = array('q', [0]) * (n + 1)
+        for chunk in chunks:
+            for v in chunk:
+                offsets[v + 1] += 1
+        for v in range(n):
+            offsets[v + 1] += offsets[v]
+
+        targets = array('i', [0]) * offsets[n]
+        fill = offsets[:-1]
+        for chunk in chunks:
+            it = iter(chunk)
+            for v, w in zip(it, it):
+                targets[fill[v]] = w
+                fill[v] += 1
+                targets[fill[w]] = v
+                fill[w] += 1
+
+        for v in range(n):
+            begin, end = offsets[v], offsets[v + 1]
+            if end - begin > 1:
+                targets[begin:end] = array('i', sorted(targets[begin:end]))
+
+        return CompactGraph(offsets, targets, self.xs, self.ys)
+
+    def _to_compact_numpy(self, chunks):
+        n = self.n
+        if chunks:
+            edges = np.concatenate([np.frombuffer(c, dtype=np.intc)
+                                    for c in chunks])
+        else:
+            edges = np.zeros(0, dtype=np.intc)
+
+        # Both directions of every edge, sorted by source then target
+        source = np.concatenate((edges[0::2], edges[1::2]))
+        target = np.concatenate((edges[1::2], edges[0::2]))
+        order = np.lexsort((target, source))
+
+        offsets = array('q', [0])
+        offsets.frombytes(np.cumsum(np.bincount(source, minlength=n),
+                                    dtype=np.int64).tobytes())
+        targets = array('i')
+        targets.frombytes(target[order].astype(np.intc).tobytes())
+
+        return CompactGraph(offsets, targets, self.xs, self.ys)
+
+    def save(self, path):
+        """Write the stream to path without holding it all in memory"""
+        has_coordinates = self.xs is not None
+        E = 0
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.n, 0, has_coordinates))
+            if has_coordinates:
+                self.xs.tofile(f)
+                self.ys.tofile(f)
+            for chunk in self:
+                chunk.tofile(f)
+                E += len(chunk) // 2
+
+            # The edge count is only known at the end
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, self.n, E, has_coordinates))
+
+    @classmethod
+    def load(cls, path, chunk=CHUNK):
+        """Returns an EdgeStream that reads the edges written by save() from
+        path a chunk at a time"""
+        with open(path, 'rb') as f:
+            magic, version, n, E, has_coordinates = \
+                HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("{0} is not an edge stream".format(path))
+
+            xs = ys = None
+            if has_coordinates:
+                xs, ys = array('d'), array('d')
+                xs.fromfile(f, n)
+                ys.fromfile(f, n)
+            start = f.tell()
+
+        def chunks():
+            with open(path, 'rb') as f:
+                f.seek(start)
+                for begin in range(0, E, chunk):
+                    edges = array('i')
+                    edges.fromfile(f, 2 * min(chunk, E - begin))
+                    yield edges
+
+        return cls(n, chunks(), xs, ys)
+
+
+def _chunked(pairs, chunk):
+    """Group an iterable of (v, w) pairs into array('i') chunks"""
+    edges = array('i')
+    for v, w in pairs:
+        edges.append(v)
+        edges.append(w)
+        if len(edges) >= 2 * chunk:
+            yield edges
+            edges = array('i')
+    if edges:
+        yield edges
+
+
+def gnp(n, p, seed=None, chunk=CHUNK):
+    """Erdős–Rényi G(n, p): every pair of vertices is an edge with
+    probability p. Instead of a coin flip per pair, draws the geometric
+    length of the gap to the next edge (Batagelj and Brandes), so the time
+    taken is proportional to the number of edges rather than n^2."""
+    rng = random.Random(seed)
+
+    def pairs():
+        if p <= 0:
+            return
+        if p >= 1:
+            for v in range(1, n):
+                for w in range(v):
+                    yield v, w
+            return
+
+        log_q = math.log(1.0 - p)
+        v, w = 1, -1
+        while v < n:
+            w += 1 + int(math.log(1.0 - rng.random()) / log_q)
+            while w >= v and v < n:
+                w -= v
+                v += 1
+            if v < n:
+                yield v, w
+
+    return EdgeStream(n, _chunked(pairs(), chunk))
+
+
+def gnm(n, m, seed=None, chunk=CHUNK):
+    """Erdős–Rényi G(n, m): m edges chosen uniformly from all the n(n-1)/2
+    possible ones"""
+    rng = random.Random(seed)
+    N = n * (n - 1) // 2
+    if m > N:
+        raise ValueError("a graph with {0} vertices has at most {1} edges"
+                         .format(n, N))
+
+    def pairs():
+        # Index k stands for the pair v > w with k = v(v-1)/2 + w
+        for k in rng.sample(range(N), m):
+            v = int((1 + math.sqrt(1 + 8 * k)) / 2)
+            while v * (v - 1) // 2 > k:
+                v -= 1
+            while (v + 1) * v // 2 <= k:
+                v += 1
+            yield v, k - v * (v - 1) // 2
+
+    return EdgeStream(n, _chunked(pairs(), chunk))
+
+
+def geometric(n, radius, seed=None, chunk=CHUNK):
+    """Random geometric graph: n points uniform in the unit square, joined
+    when they are closer than radius. Points are bucketed into a grid of
+    radius sized cells so only neighboring cells are compared."""
+    rng = random.Random(seed)
+    xs = array('d', [rng.random() for _ in range(n)])
+    ys = array('d', [rng.random() for _ in range(n)])
+
+    def pairs():
+        cells = {}
+        for i in range(n):
+            x, y = xs[i], ys[i]
+            cells.setdefault((int(x / radius), int(y / radius)),
+                             []).append((i, x, y))
+
+        r2 = radius * radius
+        for (cx, cy), points in cells.items():
+            # Half the neighboring cells, so each pair of cells is seen once
+            for dx, dy in ((0, 0), (1, 0), (-1, 1), (0, 1), (1, 1)):
+                other = cells.get((cx + dx, cy + dy))
+                if other is None:
+                    continue
+                same = dx == 0 and dy == 0
+                for a, (v, x, y) in enumerate(points):
+                    for w, wx, wy in (points[a + 1:] if same else other):
+                        if (x - wx)**2 + (y - wy)**2 < r2:
+                            yield v, w
+
+    return EdgeStream(n, _chunked(pairs(), chunk), xs, ys)
+
+
+def barabasi_albert(n, m, seed=None, chunk=CHUNK):
+    """Barabási–Albert preferential attachment: each new vertex attaches to
+    m distinct existing vertices, chosen with probability proportional to
+    their degree"""
+    rng = random.Random(seed)
+    if not 1 <= m < n:
+        raise ValueError("m must be at least 1 and less than n")
+
+    def pairs():
+        # Every vertex appears here once per edge it has, so a uniform pick
+        # from it is a pick weighted by degree
+        repeated = array('i')
+        targets = range(m)
+        for v in range(m, n):
+            for w in targets:
+                yield v, w
+            repeated.extend(targets)
+            repeated.extend([v] * m)
+
+            chosen = set()
+            while len(chosen) < m:
+                chosen.add(repeated[int(rng.random() * len(repeated))])
+            targets = chosen
+
+    return EdgeStream(n, _chunked(pairs(), chunk))
+
+
+def grid(rows, cols, chunk=CHUNK):
+    """rows x cols lattice with unit spacing. Vertex r * cols + c sits at
+    (c, r) and is joined to its right and upper neighbors."""
+    n = rows * cols
+    xs = array('d', [float(i % cols) for i in range(n)])
+    ys = array('d', [float(i // cols) for i in range(n)])
+
+    def pairs():
+        for r in range(rows):
+            for c in range(cols):
+                v = r * cols + c
+                if c + 1 < cols:
+                    yield v, v + 1
+                if r + 1 < rows:
+                    yield v, v + cols
+
+    return EdgeStream(n, _chunked(pairs(), chunk), xs, ys)
@@ -1,8 +1,13 @@
-from collections import namedtuple
-from random import randrange, choice
-from queue import Queue, PriorityQueue
+from collections import deque
+from random import Random, randrange, choice
 import math
 
+from graphy.search import shortest_path, bidirectional_shortest_path
+from graphy.distances import distances
+from graphy.landmarks import LandmarkIndex
+from graphy.hierarchy import ContractionHierarchy
+from graphy.unionfind import UnionFind
+
 
 class Edge(object):
 
@@ -58,145 +63,177 @@ class Graph(object):
 
     def __init__(self, V=50):
         self.vertices = [Vertex(None, None) for x in range(V)]
+        self._weights = {}
+        self.landmarks = None
+        self.hierarchy = None
+        self._components = None
 
     def __repr__(self):
         return '\n'.join([str(v) for v in self.vertices])
 
     def add_edge(self, v, w):
         """Add edge v-w to the graph"""
-        if v not in self.vertices[w] and w not in self.vertices[v] and v is not w:
+        if v not in self.vertices[w] and w not in self.vertices[v] and v != w:
             self.vertices[w].add(v)
             self.vertices[v].add(w)
+            self._weights.pop(v, None)
+            self._weights.pop(w, None)
+            self.landmarks = None
+            self.hierarchy = None
+            if self._components is not None:
+                self._components.union(v, w)
+
+    def add_vertex(self, x=None, y=None):
+        """Add a vertex without edges and return its index"""
+        self.vertices.append(Vertex(x, y))
+        self.landmarks = None
+        self.hierarchy = None
+        if self._components is not None:
+            self._components.add()
+        return len(self.vertices) - 1
+
+    @property
+    def components(self):
+        """UnionFind of the connected components, built on first use and then
+        kept up to date by add_edge"""
+        if self._components is None or \
+           len(self._components) != len(self.vertices):
+            self._components = UnionFind(len(self.vertices))
+            for v, vertex in enumerate(self.vertices):
+                for w in vertex:
+                    if w > v:
+                        self._components.union(v, w)
+        return self._components
+
+    def connected(self, v, w):
+        """Returns True if there is a path between v and w"""
+        return self.components.connected(v, w)
 
     def connected_component(self, v):
         """Returns the set of vertices reachable by v"""
         marked = set()
-        q = Queue()
-        q.put(v)
-        while not q.empty():
-            v = q.get()
+        q = deque([v])
+        while q:
+            v = q.popleft()
             for w in self.vertices[v]:
                 if w not in marked:
                     marked.add(w)
-                    q.put(w)
+                    q.append(w)
         return marked
 
-    def dijkstra(self, start, finish):
+    def edges(self, v):
+        """Returns a list of (w, cost) pairs for every neighbor w of v. The
+        costs are cached until clear_weights() is called."""
+        edges = self._weights.get(v)
+        if edges is None:
+            vertex = self.vertices[v]
+            edges = [(w, vertex.cost_to(self.vertices[w])) for w in vertex]
+            self._weights[v] = edges
+        return edges
+
+    def clear_weights(self):
+        """Forget the cached edge costs. Call this after moving vertices."""
+        self._weights.clear()
+        self.landmarks = None
+        self.hierarchy = None
+
+    def build_landmarks(self, k=8, processes=None):
+        """Build a LandmarkIndex with k landmarks for a_star to use until
+        the graph changes. See LandmarkIndex.build."""
+        self.landmarks = LandmarkIndex.build(self, k, processes)
+        return self.landmarks
+
+    def load_landmarks(self, path):
+        """Use a LandmarkIndex saved with LandmarkIndex.save"""
+        self.landmarks = LandmarkIndex.load(path, self)
+        return self.landmarks
+
+    def build_hierarchy(self):
+        """Build a ContractionHierarchy for dijkstra to use until the graph
+        changes. Slow to build but makes each query touch only a few hundred
+        vertices, so it pays off when running many queries."""
+        self.hierarchy = ContractionHierarchy.build(self)
+        return self.hierarchy
+
+    def load_hierarchy(self, path):
+        """Use a ContractionHierarchy saved with ContractionHierarchy.save"""
+        self.hierarchy = ContractionHierarchy.load(path, self)
+        return self.hierarchy
+
+    def _heuristic(self, target):
+        """Lower bound on the cost from a vertex to target: the straight line
+        distance, or the landmark bound if that is larger"""
+        vertex = self.vertices[target]
+        if self.landmarks is None:
+            return lambda v: self.vertices[v].cost_to(vertex)
+
+        bound = self.landmarks.heuristic(target)
+        return lambda v: max(self.vertices[v].cost_to(vertex), bound(v))
+
+    def _mark(self, v):
+        self.vertices[v].marked = True
+
+    def dijkstra(self, start, finish, mark=True):
         """Returns the shortest path from start to finish as a list of indices.
-        Also sets marked = True on every vertex it looks at."""
-
-        def build_path():
-            path = []
-            node = finish
-            total_cost = 0
-
-            while node != start:
-                path.append(node)
-                next_node = seen.get(node).prev
-                total_cost += self.vertices[node].cost_to(self.vertices[next_node])
-                node = next_node
-
-            path.append(start)
-
-            print("{0:10} -> path cost: {1:10}".format("Dijkstra", total_cost))
-            return reversed(path)
-
-        Data = namedtuple('Data', ['cost', 'prev'])
-
-        seen = {start : Data(0, start)}
-        done = set()
-
-        pq = PriorityQueue()
-        pq.put((0, start))
-
-        while not pq.empty():
-            cost, v = pq.get()
-
-            self.vertices[v].marked = True
-
-            # Check if finished
-            if v == finish:
-                return build_path()
-
-            # There may be duplicates in the pq so check if v has been done already
-            if v in done:
-                continue
-
-            # Check every neighbor of v
-            for w in self.vertices[v]:
-                assert w is not None
-                if w not in done:
-
-                    self.vertices[w].marked = True
-
-                    w_cost = seen.get(v).cost + self.vertices[v].cost_to(self.vertices[w])
-
-                    if w not in seen or seen.get(w).cost > w_cost:
-                        # Add to pq and update seen
-                        seen[w] = Data(w_cost, v)
-                        pq.put((w_cost, w))
-
-            done.add(v)
-
-
-    def a_star(self, start, finish):
-        """Literally identical to the dijkstra implementation except this adds
-        the distance to the finishing node when w_cost is calculated."""
-
-        def build_path():
-            path = []
-            node = finish
-            total_cost = 0
-
-            while node != start:
-                path.append(node)
-                next_node = seen.get(node).prev
-                total_cost += self.vertices[node].cost_to(self.vertices[next_node])
-                node = next_node
-
-            path.append(start)
-
-            print("{0:10} -> path cost: {1}".format("A*", total_cost))
-            return reversed(path)
-
-        Data = namedtuple('Data', ['cost', 'prev'])
-
-        seen = {start : Data(0, start)}
-        done = set()
-
-        pq = PriorityQueue()
-        pq.put((0, start))
-
-        while not pq.empty():
-            cost, v = pq.get()
-
-            self.vertices[v].marked = True
-
-            # Check if finished
-            if v == finish:
-                return build_path()
-
-            # There may be duplicates in the pq so check if v has been done already
-            if v in done:
-                continue
-
-            # Check every neighbor of v
-            for w in self.vertices[v]:
-                assert w is not None
-                if w not in done:
-
-                    self.vertices[w].marked = True
-
-                    w_cost = seen.get(v).cost + \
-                             self.vertices[v].cost_to(self.vertices[w]) + \
-                             self.vertices[w].cost_to(self.vertices[finish])
-
-                    if w not in seen or seen.get(w).cost > w_cost:
-                        # Add to pq and update seen
-                        seen[w] = Data(w_cost, v)
-                        pq.put((w_cost, w))
-
-            done.add(v)
+        Also sets marked = True on every vertex it looks at unless mark is
+        False. Uses the contraction hierarchy after build_hierarchy()."""
+        mark = self._mark if mark else None
+        if self.hierarchy is not None:
+            result = self.hierarchy.shortest_path(start, finish, mark)
+        else:
+            result = shortest_path(start, finish, self.edges, mark=mark)
+        if result is None:
+            return None
+
+        total_cost, path = result
+        print("{0:10} -> path cost: {1:10}".format("Dijkstra", total_cost))
+        return iter(path)
+
+    def a_star(self, start, finish, mark=True):
+        """Like dijkstra but orders the search by the straight line distance
+        to finish as well, or by the landmark bound after build_landmarks()."""
+        heuristic = self._heuristic(finish)
+
+        result = shortest_path(start, finish, self.edges, heuristic,
+                               mark=self._mark if mark else None)
+        if result is None:
+            return None
+
+        total_cost, path = result
+        print("{0:10} -> path cost: {1}".format("A*", total_cost))
+        return iter(path)
+
+    def bidirectional_dijkstra(self, start, finish, mark=True):
+        """Like dijkstra but searches from both ends at once, which usually
+        looks at fewer vertices on long paths."""
+        result = bidirectional_shortest_path(start, finish, self.edges,
+                                             mark=self._mark if mark else None)
+        if result is None:
+            return None
+
+        total_cost, path = result
+        print("{0:10} -> path cost: {1:10}".format("Bi-Dijkstra", total_cost))
+        return iter(path)
+
+    def bidirectional_a_star(self, start, finish, mark=True):
+        """Like a_star but searches from both ends at once"""
+        bounds = {start: self._heuristic(start), finish: self._heuristic(finish)}
+        heuristic = lambda v, target: bounds[target](v)
+
+        result = bidirectional_shortest_path(start, finish, self.edges, heuristic,
+                                             mark=self._mark if mark else None)
+        if result is None:
+            return None
+
+        total_cost, path = result
+        print("{0:10} -> path cost: {1}".format("Bi-A*", total_cost))
+        return iter(path)
+
+    def distances(self, sources, targets=None, workers=None, predecessors=False):
+        """Returns a DistanceMatrix of shortest path costs from every vertex
+        in sources to every vertex in targets (default all of them), run
+        over a pool of processes. See graphy.distances.distances."""
+        return distances(self, sources, targets, workers, predecessors)
 
     def copy(self):
 
@@ -205,27 +242,41 @@ class Graph(object):
         for v in self.vertices:
             new_graph.vertices.append(v.copy())
 
+        # The indexes don't change so the copy can share them
+        new_graph.landmarks = self.landmarks
+        new_graph.hierarchy = self.hierarchy
+        if self._components is not None:
+            new_graph._components = self._components.copy()
+
         return new_graph
 
 
-def random_graph(V=80, E=50, connected=False):
-    """Generates a random graph with V vertices and E edges"""
+def random_graph(V=80, E=50, connected=False, seed=None):
+    """Generates a random graph with V vertices and E edges. If connected,
+    every other component is then joined to the largest one by an edge
+    from its lowest vertex to a random vertex already connected. Uses the
+    global random state unless seed is given. See graphy.generators for
+    other models and much larger graphs."""
+    rng = Random(seed) if seed is not None else None
+    rand = rng.randrange if rng else randrange
+    pick = rng.choice if rng else choice
+
     graph = Graph(V)
     for _ in range(E):
-        graph.add_edge(randrange(0, V), randrange(0, V))
-    if not connected:
+        graph.add_edge(rand(0, V), rand(0, V))
+    if not connected or V == 0:
         return graph
 
-    component = max([graph.connected_component(x) for x in range(len(graph.vertices))])
-    while len(component) < len(graph.vertices):
-        for x in range(len(graph.vertices)):
-            if x not in component:
-                graph.add_edge(x, choice(list(component)))
-                break
-
-        component = graph.connected_component(component.pop())
-
-    return graph
+    components = graph.components
+    groups = {}
+    for v in range(V):
+        groups.setdefault(components.find(v), []).append(v)
 
+    largest = max(groups, key=lambda root: len(groups[root]))
+    members = groups.pop(largest)
 
+    for group in sorted(groups.values(), key=lambda group: group[0]):
+        graph.add_edge(group[0], pick(members))
+        members.extend(group)
 
+    return graph
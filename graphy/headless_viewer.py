@@ -0,0 +1,206 @@
+import math
+import struct
+import time
+import zlib
+
+from graphy.viewer import Viewer, COLORS
+
+
+def _png(width, height, pixels):
+    """Encode RGB pixels, a bytearray of rows from the top, as a PNG"""
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + \
+            struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    stride = 3 * width
+    raw = b''.join(b'\x00' + pixels[y * stride:(y + 1) * stride]
+                   for y in range(height))
+
+    return b'\x89PNG\r\n\x1a\n' + \
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) + \
+        chunk(b'IDAT', zlib.compress(bytes(raw), 6)) + \
+        chunk(b'IEND', b'')
+
+
+class HeadlessViewer(Viewer):
+    """Viewer without a window, for laying out and exporting graphs on
+    machines without a display. Drawing only records the batches of lines
+    and circles of the current frame. save() rasterizes them into an RGB
+    buffer for a PNG or writes them out as an SVG.
+
+    Intermediate frames are skipped unless frame_interval is set, in which
+    case every frame_interval-th one is drawn, and also saved if frame_path
+    is a pattern such as 'frames/{0:04d}.png'."""
+
+    def __init__(self, *args, frame_interval=0, frame_path=None, **kwargs):
+        super(HeadlessViewer, self).__init__(*args, **kwargs)
+        self.colors = dict(COLORS)
+        self.fill_col = 'blue'
+        self.stroke_col = 'gray'
+        self.clear_col = 'white'
+        self.stroke = 2
+
+        self.frame_interval = frame_interval
+        self.frame_path = frame_path
+        self.frames = 0   # Number of update() calls
+        self._skipped = 0
+
+        self._batches = []
+
+    # skip_frame() alone decides which frames are drawn
+    throttle = False
+
+    def _rgb(self, color):
+        return self.colors.get(color) or self.colors[self.fill_col]
+
+    def skip_frame(self):
+        self._skipped += 1
+        if not self.frame_interval:
+            return True
+        return self._skipped % self.frame_interval != 0
+
+    # Drawing records batches: ('lines', segments, colors, weight) and
+    # ('circles', centers, radii, fills, strokes, stroke width)
+
+    def circle(self, x, y, radius, **config):
+        self.circles([x, y], radius, config.get('color'),
+                     config.get('stroke_color'), weight=config.get('stroke'))
+
+    def line(self, x1, y1, x2, y2, **config):
+        self.lines([x1, y1, x2, y2], config.get('color') or self.stroke_col,
+                   weight=config.get('weight'))
+
+    def lines(self, segments, colors, **config):
+        n = len(segments) // 4
+        if isinstance(colors, str):
+            colors = [colors] * n
+        self._batches.append(('lines', [float(c) for c in segments],
+                              list(colors), config.get('weight') or self.stroke))
+
+    def circles(self, centers, radius, fill, stroke=None, **config):
+        radii, fills, strokes = self._circle_styles(len(centers) // 2, radius,
+                                                    fill, stroke)
+        self._batches.append(('circles', [float(c) for c in centers], radii,
+                              fills, strokes, config.get('weight') or self.stroke))
+
+    def clear(self):
+        self._batches = []
+
+    def update(self, **kwargs):
+        self.frames += 1
+        if self.frame_path is not None:
+            self.save(self.frame_path.format(self.frames))
+
+    def run(self):
+        """There are no events, so this only calls the timer callback until
+        it returns False"""
+        if self._timer is not None:
+            interval, callback = self._timer
+            while callback():
+                time.sleep(interval)
+
+    def add_button(self, button):
+        self._buttons.append(button)
+
+    def render(self):
+        """Rasterize the current frame. Returns a bytearray of RGB pixels,
+        rows from the top."""
+        w, h = self.width, self.height
+        pixels = bytearray(self._rgb(self.clear_col)) * (w * h)
+        half_w, half_h = w / 2, h / 2
+
+        def span(y, x0, x1, rgb):
+            if 0 <= y < h:
+                x0, x1 = max(x0, 0), min(x1, w - 1)
+                if x0 <= x1:
+                    i = 3 * (y * w + x0)
+                    pixels[i:i + 3 * (x1 - x0 + 1)] = rgb * (x1 - x0 + 1)
+
+        def disk(cx, cy, r, rgb):
+            for dy in range(-r, r + 1):
+                half = int(math.sqrt(r * r - dy * dy))
+                span(cy + dy, cx - half, cx + half, rgb)
+
+        for batch in self._batches:
+            if batch[0] == 'lines':
+                _, segments, colors, weight = batch
+                for k, color in enumerate(colors):
+                    rgb = bytes(self._rgb(color))
+                    x1, y1, x2, y2 = segments[4*k:4*k + 4]
+                    x1, x2 = int(x1 + half_w), int(x2 + half_w)
+                    y1, y2 = int(h - (y1 + half_h)), int(h - (y2 + half_h))
+                    steps = max(abs(x2 - x1), abs(y2 - y1), 1)
+                    steep = abs(y2 - y1) > abs(x2 - x1)
+                    dx, dy = (x2 - x1) / steps, (y2 - y1) / steps
+                    for s in range(steps + 1):
+                        x, y = int(x1 + dx * s + 0.5), int(y1 + dy * s + 0.5)
+                        # Thicken across the line
+                        if steep:
+                            span(y, x - (weight - 1) // 2, x + weight // 2, rgb)
+                        else:
+                            for t in range(-((weight - 1) // 2), weight // 2 + 1):
+                                span(y + t, x, x, rgb)
+            else:
+                _, centers, radii, fills, strokes, width = batch
+                for i, r in enumerate(radii):
+                    cx = int(centers[2*i] + half_w)
+                    cy = int(h - (centers[2*i + 1] + half_h))
+                    if strokes[i]:
+                        disk(cx, cy, r, bytes(self._rgb(strokes[i])))
+                        disk(cx, cy, r - width, bytes(self._rgb(fills[i])))
+                    else:
+                        disk(cx, cy, r, bytes(self._rgb(fills[i])))
+
+        return pixels
+
+    def svg(self):
+        """Returns the current frame as an SVG document"""
+        w, h = self.width, self.height
+        half_w, half_h = w / 2, h / 2
+
+        def rgb(color):
+            return 'rgb({0},{1},{2})'.format(*self._rgb(color))
+
+        out = ['<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}" '
+               'viewBox="0 0 {0} {1}">'.format(w, h),
+               '<rect width="100%" height="100%" fill="{0}"/>'
+               .format(rgb(self.clear_col))]
+
+        for batch in self._batches:
+            if batch[0] == 'lines':
+                # One path per color
+                _, segments, colors, weight = batch
+                paths = {}
+                for k, color in enumerate(colors):
+                    x1, y1, x2, y2 = segments[4*k:4*k + 4]
+                    paths.setdefault(color, []).append(
+                        'M{0:.1f} {1:.1f}L{2:.1f} {3:.1f}'.format(
+                            x1 + half_w, half_h - y1, x2 + half_w, half_h - y2))
+                for color, d in paths.items():
+                    out.append('<path d="{0}" stroke="{1}" stroke-width="{2}" '
+                               'fill="none"/>'.format(''.join(d), rgb(color), weight))
+            else:
+                _, centers, radii, fills, strokes, width = batch
+                for i, r in enumerate(radii):
+                    stroke = ' stroke="{0}" stroke-width="{1}"'.format(
+                        rgb(strokes[i]), width) if strokes[i] else ''
+                    out.append('<circle cx="{0:.1f}" cy="{1:.1f}" r="{2}" '
+                               'fill="{3}"{4}/>'.format(
+                                   centers[2*i] + half_w, half_h - centers[2*i + 1],
+                                   r - width / 2 if strokes[i] else r,
+                                   rgb(fills[i]), stroke))
+
+        out.append('</svg>')
+        return '\n'.join(out)
+
+    def save(self, path):
+        """Write the current frame to path as a PNG or SVG, chosen by its
+        extension"""
+        if path.lower().endswith('.svg'):
+            with open(path, 'w') as f:
+                f.write(self.svg())
+        elif path.lower().endswith('.png'):
+            with open(path, 'wb') as f:
+                f.write(_png(self.width, self.height, self.render()))
+        else:
+            raise ValueError("Can only save .png or .svg files")
@@ -0,0 +1,280 @@
+from array import array
+import heapq
+import struct
+
+from graphy.landmarks import fingerprint
+
+
+MAGIC = b'GCHX'
+VERSION = 1
+HEADER = struct.Struct('=4sIIQI')  # magic, version, V, up edges, fingerprint
+
+INF = float('inf')
+
+
+def _witness_search(adj, source, skip, targets, max_cost, settle_limit):
+    """Dijkstra from source that avoids skip and stops once every vertex in
+    targets is settled, the search passes max_cost, or settle_limit
+    vertices are settled. Every cost returned is the cost of a real path,
+    so it is safe to use as a witness."""
+    dist = {source: 0}
+    pq = [(0, source)]
+    settled = 0
+    remaining = len(targets)
+
+    heappush, heappop = heapq.heappush, heapq.heappop
+
+    while pq:
+        d, x = heappop(pq)
+        if d > dist[x]:
+            continue
+        if d > max_cost or settled >= settle_limit:
+            break
+        settled += 1
+
+        if x in targets:
+            remaining -= 1
+            if not remaining:
+                break
+
+        for y, cost in adj[x].items():
+            if y != skip:
+                y_cost = d + cost
+                if y_cost < dist.get(y, INF):
+                    dist[y] = y_cost
+                    heappush(pq, (y_cost, y))
+
+    return dist
+
+
+class ContractionHierarchy(object):
+    """Contraction hierarchy over an undirected graph. Vertices are removed
+    (contracted) one at a time, least important first, and a shortcut edge
+    is added between two neighbors whenever the path through the removed
+    vertex was the only shortest one. Each vertex then keeps only its edges
+    to vertices contracted after it, the upward graph. A query searches
+    upward from both ends and the two searches meet at the most important
+    vertex of the shortest path, so it only looks at a few hundred vertices
+    even on large graphs.
+
+    The upward graph is stored in compressed sparse row form: the upward
+    edges of v are targets[offsets[v]:offsets[v + 1]] with matching costs,
+    and middles holds the vertex a shortcut bypasses, or -1 for an original
+    edge. Since the graph is undirected the downward graph is the same."""
+
+    settle_limit = 50  # Max vertices settled by one witness search
+
+    def __init__(self, rank, offsets, targets, costs, middles, fingerprint=0):
+        self.rank = rank
+        self.offsets = offsets
+        self.targets = targets
+        self.costs = costs
+        self.middles = middles
+        self.fingerprint = fingerprint
+        self._up = None
+
+    def __len__(self):
+        return len(self.rank)
+
+    @classmethod
+    def build(cls, graph):
+        """Contract every vertex of graph, ordered by edge difference (the
+        shortcuts a contraction adds minus the edges it removes) plus the
+        number of neighbors already contracted, to spread contractions
+        evenly over the graph."""
+        V = len(graph.vertices)
+        adj = [dict((w, cost) for w, cost in graph.edges(v) if w != v)
+               for v in range(V)]
+        middle = {}
+        contracted_neighbors = [0] * V
+        level = [0] * V
+        up = [None] * V
+        rank = array('i', [0]) * V
+
+        def shortcuts(v):
+            neighbors = list(adj[v].items())
+            found = []
+            for i, (u, u_cost) in enumerate(neighbors[:-1]):
+                targets = neighbors[i + 1:]
+                max_cost = u_cost + max(c for _, c in targets)
+                dist = _witness_search(adj, u, v, {w for w, _ in targets},
+                                       max_cost, cls.settle_limit)
+                for w, w_cost in targets:
+                    if dist.get(w, INF) > u_cost + w_cost:
+                        found.append((u, w, u_cost + w_cost))
+            return found
+
+        def priority(found, v):
+            return 2 * (len(found) - len(adj[v])) + contracted_neighbors[v] + \
+                level[v]
+
+        pq = [(priority(shortcuts(v), v), v) for v in range(V)]
+        heapq.heapify(pq)
+
+        order = 0
+        while pq:
+            _, v = heapq.heappop(pq)
+
+            # Priorities go stale as the graph changes, so recompute this
+            # one and only contract v if it is still the smallest
+            found = shortcuts(v)
+            p = priority(found, v)
+            if pq and p > pq[0][0]:
+                heapq.heappush(pq, (p, v))
+                continue
+
+            for u, w, cost in found:
+                if cost < adj[u].get(w, INF):
+                    adj[u][w] = adj[w][u] = cost
+                    middle[u, w] = middle[w, u] = v
+
+            up[v] = [(u, cost, middle.get((v, u), -1))
+                     for u, cost in adj[v].items()]
+            for u in adj[v]:
+                del adj[u][v]
+                contracted_neighbors[u] += 1
+                level[u] = max(level[u], level[v] + 1)
+            adj[v] = None
+
+            rank[v] = order
+            order += 1
+
+        offsets = array('q', [0])
+        targets = array('i')
+        costs = array('d')
+        middles = array('i')
+        for edges in up:
+            for u, cost, m in edges:
+                targets.append(u)
+                costs.append(cost)
+                middles.append(m)
+            offsets.append(len(targets))
+
+        return cls(rank, offsets, targets, costs, middles, fingerprint(graph))
+
+    def _upward(self):
+        """Upward edges as a list of (w, cost) lists, built on first use"""
+        if self._up is None:
+            offsets, targets, costs = self.offsets, self.targets, self.costs
+            self._up = [list(zip(targets[offsets[v]:offsets[v + 1]],
+                                 costs[offsets[v]:offsets[v + 1]]))
+                        for v in range(len(self))]
+        return self._up
+
+    def _middle(self, v, w):
+        # The edge is stored with whichever end was contracted first
+        if self.rank[v] > self.rank[w]:
+            v, w = w, v
+        begin, end = self.offsets[v], self.offsets[v + 1]
+        i = self.targets[begin:end].index(w)
+        return self.middles[begin + i]
+
+    def _unpack(self, path):
+        """Replace every shortcut in path by the edges it stands for"""
+        result = [path[0]]
+        stack = [(v, w) for v, w in zip(path, path[1:])]
+        stack.reverse()
+        while stack:
+            v, w = stack.pop()
+            m = self._middle(v, w)
+            if m == -1:
+                result.append(w)
+            else:
+                stack.append((m, w))
+                stack.append((v, m))
+        return result
+
+    def shortest_path(self, start, finish, mark=None):
+        """Same interface and result as graphy.search.shortest_path: returns
+        (cost, path) with the original vertices of the path, or None if
+        finish can't be reached. mark(v) is called on every vertex settled."""
+        if start == finish:
+            if mark is not None:
+                mark(start)
+            return 0, [start]
+
+        dist = ({start: 0}, {finish: 0})
+        prev = ({start: start}, {finish: finish})
+        pqs = ([(0, start)], [(0, finish)])
+
+        best = INF
+        meet = None
+
+        up = self._upward()
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        while pqs[0] or pqs[1]:
+            if not pqs[1] or (pqs[0] and pqs[0][0][0] <= pqs[1][0][0]):
+                side = 0
+            else:
+                side = 1
+
+            v_cost, v = heappop(pqs[side])
+            if v_cost >= best:
+                # The other side's smallest key is at least as large
+                break
+
+            this, other = dist[side], dist[1 - side]
+            if v_cost > this[v]:
+                continue
+
+            if mark is not None:
+                mark(v)
+
+            if v in other and v_cost + other[v] < best:
+                best = v_cost + other[v]
+                meet = v
+
+            # Stall on demand: if a higher vertex already reached gives a
+            # shorter way to v, no shortest path goes up through v
+            edges = up[v]
+            if any(this.get(w, INF) + cost < v_cost for w, cost in edges):
+                continue
+
+            for w, cost in edges:
+                w_cost = v_cost + cost
+                if w_cost < this.get(w, INF):
+                    this[w] = w_cost
+                    prev[side][w] = v
+                    heappush(pqs[side], (w_cost, w))
+
+        if meet is None:
+            return None
+
+        path = [meet]
+        while path[-1] != start:
+            path.append(prev[0][path[-1]])
+        path.reverse()
+        while path[-1] != finish:
+            path.append(prev[1][path[-1]])
+
+        return best, self._unpack(path)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self), len(self.targets),
+                                self.fingerprint))
+            for values in (self.rank, self.offsets, self.targets,
+                           self.costs, self.middles):
+                values.tofile(f)
+
+    @classmethod
+    def load(cls, path, graph=None):
+        """Read a hierarchy written by save(). If graph is given, raises
+        ValueError unless it was built for the same edges and costs."""
+        with open(path, 'rb') as f:
+            magic, version, V, E, crc = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("{0} is not a contraction hierarchy".format(path))
+            if graph is not None and \
+               (V != len(graph.vertices) or crc != fingerprint(graph)):
+                raise ValueError("{0} was built for a different graph".format(path))
+
+            arrays = []
+            for typecode, n in (('i', V), ('q', V + 1), ('i', E),
+                                ('d', E), ('i', E)):
+                values = array(typecode)
+                values.fromfile(f, n)
+                arrays.append(values)
+
+        return cls(*arrays, fingerprint=crc)
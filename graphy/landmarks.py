@@ -0,0 +1,172 @@
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import struct
+import zlib
+
+from graphy.search import shortest_distances
+
+
+MAGIC = b'GLMK'
+VERSION = 1
+HEADER = struct.Struct('=4sIIII')  # magic, version, V, k, fingerprint
+
+INF = float('inf')
+
+# Graph being indexed in a worker process, set once by _init_worker
+_graph = None
+
+
+def _init_worker(graph):
+    global _graph
+    _graph = graph
+
+
+def _distance_row(graph, landmark):
+    """Returns an array of the cost from landmark to every vertex, inf for
+    vertices it can't reach"""
+    row = array('d', [INF]) * len(graph.vertices)
+    for v, cost in shortest_distances(landmark, graph.edges).items():
+        row[v] = cost
+    return row
+
+
+def _worker_row(landmark):
+    return _distance_row(_graph, landmark)
+
+
+def fingerprint(graph):
+    """Checksum of the edges and their costs, used to tell whether a saved
+    index still belongs to graph"""
+    crc = 0
+    for v in range(len(graph.vertices)):
+        edges = sorted(graph.edges(v))
+        crc = zlib.crc32(array('i', [w for w, _ in edges]).tobytes(), crc)
+        crc = zlib.crc32(array('d', [c for _, c in edges]).tobytes(), crc)
+    return crc
+
+
+def choose_landmarks(graph, k):
+    """Pick k vertices spread over the graph: each one is the vertex with
+    the most hops to the landmarks picked so far. Vertices in other
+    components count as infinitely far so every component gets one before
+    any gets a second."""
+    V = len(graph.vertices)
+    k = min(k, V)
+    hops = [INF] * V
+
+    def bfs(source):
+        seen = {source: 0}
+        q = deque([source])
+        while q:
+            v = q.popleft()
+            for w in graph.vertices[v]:
+                if w not in seen:
+                    seen[w] = seen[v] + 1
+                    q.append(w)
+        return seen
+
+    # Start from the far end of vertex 0's component rather than vertex 0
+    far = bfs(0) if V else {}
+    landmarks = [max(far, key=lambda v: (far[v], -v))] if far else []
+
+    while len(landmarks) < k:
+        for v, h in bfs(landmarks[-1]).items():
+            if h < hops[v]:
+                hops[v] = h
+        for v in landmarks:
+            hops[v] = -1
+        landmarks.append(max(range(V), key=lambda v: (hops[v], -v)))
+
+    return landmarks
+
+
+class LandmarkIndex(object):
+    """ALT (A*, landmarks, triangle inequality) index. Stores the cost from
+    each of k landmarks to every vertex. For any landmark L the triangle
+    inequality gives |d(L, t) - d(L, v)| <= d(v, t), so the largest of
+    those differences is a lower bound for A* that is usually much tighter
+    than the straight line distance on sparse graphs."""
+
+    def __init__(self, landmarks, rows, fingerprint=0):
+        self.landmarks = landmarks
+        self.rows = rows
+        self.fingerprint = fingerprint
+
+    def __len__(self):
+        return len(self.rows[0]) if self.rows else 0
+
+    @classmethod
+    def build(cls, graph, k=8, processes=None):
+        """Index graph with k landmarks. The Dijkstra for each landmark runs
+        in a pool of processes (default one per CPU), or in this process
+        when processes is 1."""
+        landmarks = choose_landmarks(graph, k)
+
+        if processes == 1 or len(landmarks) <= 1:
+            rows = [_distance_row(graph, l) for l in landmarks]
+        else:
+            with ProcessPoolExecutor(max_workers=processes,
+                                     initializer=_init_worker,
+                                     initargs=(graph,)) as pool:
+                rows = list(pool.map(_worker_row, landmarks))
+
+        return cls(landmarks, rows, fingerprint(graph))
+
+    def lower_bound(self, v, w):
+        """Returns a lower bound on the cost of the shortest path v-w"""
+        bound = 0.0
+        for row in self.rows:
+            a, b = row[v], row[w]
+            # Landmarks that can't reach one of them say nothing useful
+            if a != INF and b != INF:
+                d = abs(a - b)
+                if d > bound:
+                    bound = d
+        return bound
+
+    def heuristic(self, target):
+        """Returns h(v), the lower bound from v to target, for shortest_path"""
+        pairs = [(row, row[target]) for row in self.rows if row[target] != INF]
+
+        def h(v):
+            bound = 0.0
+            for row, t in pairs:
+                a = row[v]
+                if a != INF:
+                    d = abs(t - a)
+                    if d > bound:
+                        bound = d
+            return bound
+
+        return h
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self), len(self.rows),
+                                self.fingerprint))
+            array('i', self.landmarks).tofile(f)
+            for row in self.rows:
+                row.tofile(f)
+
+    @classmethod
+    def load(cls, path, graph=None):
+        """Read an index written by save(). If graph is given, raises
+        ValueError unless the index was built for the same edges and costs."""
+        with open(path, 'rb') as f:
+            magic, version, V, k, crc = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("{0} is not a landmark index".format(path))
+            if graph is not None and \
+               (V != len(graph.vertices) or crc != fingerprint(graph)):
+                raise ValueError("{0} was built for a different graph".format(path))
+
+            landmarks = array('i')
+            landmarks.fromfile(f, k)
+            rows = []
+            for _ in range(k):
+                row = array('d')
+                row.fromfile(f, V)
+                rows.append(row)
+
+        return cls(list(landmarks), rows, crc)
@@ -0,0 +1,126 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+import struct
+
+
+MAGIC = b'GLAY'
+VERSION = 1
+HEADER = struct.Struct('=4sII')  # magic, version, V
+
+SUFFIX = '.glay'
+
+
+def layout_key(display_graph, iterations, tol):
+    """Hex digest identifying a layout: the graph's edges, independent of
+    the order they were added in, the starting positions and every setting
+    that changes where the layout ends up. iterations and tol are when the
+    layout stops, tol None for one that runs every iteration."""
+    dg = display_graph
+    ends = dg.edge_buffer
+    edges = sorted((min(ends[k], ends[k + 1]), max(ends[k], ends[k + 1]))
+                   for k in range(0, len(ends), 2))
+
+    h = hashlib.sha256()
+    h.update(struct.pack('=QQ', len(dg.vertices), len(edges)))
+    h.update(array('i', [v for edge in edges for v in edge]).tobytes())
+    h.update(dg.positions.tobytes())
+    h.update(repr((dg.c1, dg.c2, dg.c3, dg.c4, dg.M, dg.tol, dg.theta,
+                   dg.update_algo, dg.update.__name__, dg.multilevel,
+                   dg.refine, iterations, tol)).encode())
+    return h.hexdigest()
+
+
+class LayoutCache(object):
+    """Directory of finished layouts, one file of positions per layout_key.
+    Reading a layout marks it as used, and once the files add up to more
+    than max_bytes the least recently used ones are deleted."""
+
+    def __init__(self, path, max_bytes=256 * 2**20):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + SUFFIX)
+
+    def get(self, key, V=None):
+        """Returns the positions stored for key as an array('d'), or None.
+        If V is given, layouts for a different number of vertices are
+        treated as missing."""
+        path = self._file(key)
+        try:
+            with open(path, 'rb') as f:
+                magic, version, n = HEADER.unpack(f.read(HEADER.size))
+                positions = array('d')
+                positions.fromfile(f, 2 * n)
+        except (OSError, EOFError, struct.error):
+            return None
+
+        if magic != MAGIC or version != VERSION or (V is not None and n != V):
+            return None
+
+        os.utime(path)
+        return positions
+
+    def put(self, key, positions):
+        """Store positions, a flat array of x, y doubles, under key"""
+        path = self._file(key)
+        tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(positions) // 2))
+            array('d', positions).tofile(f)
+        os.replace(tmp, path)
+
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used layouts until the rest fit in
+        max_bytes"""
+        files = []
+        for name in os.listdir(self.path):
+            if name.endswith(SUFFIX):
+                try:
+                    stat = os.stat(os.path.join(self.path, name))
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+            total -= size
+
+    def __contains__(self, key):
+        return os.path.exists(self._file(key))
+
+
+def _warm_one(args):
+    # Imported here because displaygraph uses this module
+    from graphy.displaygraph import DisplayGraph
+    from graphy.headless_viewer import HeadlessViewer
+
+    cache, graph, display_args = args
+    dg = DisplayGraph(graph, viewer=HeadlessViewer, cache=cache, **display_args)
+    return dg.layout()[0]
+
+
+def warm(cache, graphs, processes=None, **display_args):
+    """Lay out every graph in graphs and store the results in cache, for
+    batch jobs that prepare layouts ahead of time. display_args are passed
+    to DisplayGraph and need to match the ones the layouts will be looked
+    up with. Graphs already cached are skipped. Runs in a pool of
+    processes (default one per CPU), or in this process when processes is
+    1. Returns the number of iterations run for each graph."""
+    jobs = [(cache, graph, display_args) for graph in graphs]
+    if processes == 1 or len(jobs) <= 1:
+        return [_warm_one(job) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(_warm_one, jobs))
@@ -0,0 +1,79 @@
+import math
+import threading
+
+
+class LayoutRunner(object):
+    """Runs the layout of a DisplayGraph on a background thread so the event
+    loop keeps running while it converges. Each iteration holds the
+    DisplayGraph's lock, which the UI thread also takes to draw or move
+    vertices, so it always sees whole iterations. The C update releases
+    the GIL while it computes, the Python and numpy ones share it with the
+    UI thread.
+
+    version counts the iterations run so far, so the UI can tell when there
+    is something new to draw."""
+
+    def __init__(self, display_graph):
+        self.dg = display_graph
+        self.version = 0
+        self.energy = 0.0
+        self.completed = False  # Whether the last layout ran to the end
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, iterations=None, tol=None, multilevel=False):
+        """Cancel any layout in progress and start a new one from the current
+        positions. Stops after iterations or once no vertex moves further
+        than tol, as in DisplayGraph.layout. With multilevel it begins with
+        DisplayGraph.place_multilevel(), which can't be cancelled and is
+        dropped if the graph is edited while it runs, and iterations
+        defaults to refine instead of M."""
+        self.cancel()
+
+        if iterations is None:
+            iterations = self.dg.refine if multilevel else self.dg.M
+        tol = self.dg.tol if tol is None else tol
+
+        self._stop.clear()
+        self.completed = False
+        self._thread = threading.Thread(target=self._run,
+                                        args=(iterations, tol, multilevel),
+                                        daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """Stop the layout after the current iteration and wait for it"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def wait(self, timeout=None):
+        """Block until the layout finishes. Returns False on timeout."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.running
+
+    def _run(self, iterations, tol, multilevel):
+        dg = self.dg
+        if multilevel:
+            dg.place_multilevel()
+            with dg.lock:
+                self.version += 1
+
+        for _ in range(iterations):
+            if self._stop.is_set():
+                return
+
+            with dg.lock:
+                largest, self.energy = dg.step_layout()
+                self.version += 1
+
+            if math.sqrt(largest) < tol:
+                break
+
+        self.completed = True
@@ -0,0 +1,131 @@
+from array import array
+from random import Random
+import math
+
+
+def coarsen(V, edges):
+    """Merge the V vertices of a graph, given as a flat array of edge
+    endpoints, into about half as many. Vertices are matched with their
+    lowest degree unmatched neighbor, lowest degree first, and any left
+    over join the smallest group next to them, so stars shrink as fast as
+    paths. Vertices without edges are paired up with each other.
+
+    Returns (parent, n, coarse_edges) where parent[v] is the vertex of the
+    coarse graph that v was merged into, n is the number of them and
+    coarse_edges are the edges between them."""
+    adj = [[] for _ in range(V)]
+    for k in range(0, len(edges), 2):
+        v, w = edges[k], edges[k + 1]
+        if v != w:
+            adj[v].append(w)
+            adj[w].append(v)
+
+    parent = [-1] * V
+    order = sorted(range(V), key=lambda v: len(adj[v]))
+
+    n = 0
+    for v in order:
+        if parent[v] >= 0 or not adj[v]:
+            continue
+        best = None
+        for w in adj[v]:
+            if parent[w] < 0 and (best is None or len(adj[w]) < len(adj[best])):
+                best = w
+        if best is not None:
+            parent[v] = parent[best] = n
+            n += 1
+
+    # Every neighbor of a vertex still unmatched is matched by now
+    size = [2] * n
+    lone = None
+    for v in order:
+        if parent[v] >= 0:
+            continue
+        if adj[v]:
+            group = min((parent[w] for w in adj[v]), key=size.__getitem__)
+            parent[v] = group
+            size[group] += 1
+        elif lone is None:
+            parent[v] = lone = n
+            size.append(1)
+            n += 1
+        else:
+            parent[v] = lone
+            lone = None
+
+    seen = set()
+    coarse_edges = array('i')
+    for k in range(0, len(edges), 2):
+        a, b = parent[edges[k]], parent[edges[k + 1]]
+        if a != b:
+            key = (a, b) if a < b else (b, a)
+            if key not in seen:
+                seen.add(key)
+                coarse_edges.extend(key)
+
+    return parent, n, coarse_edges
+
+
+def multilevel_positions(positions, edges, step, iterations=300, refine=30,
+                         min_size=50, seed=0):
+    """Starting positions for a force-directed layout, found by laying out
+    ever smaller coarsenings of the graph and working back up. The graph
+    is coarsened until it has at most min_size vertices or stops
+    shrinking, the coarsest level gets iterations of step(positions, edges)
+    and every level above it gets refine. positions and edges are flat
+    arrays of the x, y of every vertex and the endpoints of every edge.
+
+    Returns an array('d') of positions for the original graph, projected
+    from the first level up but not refined; the caller finishes with a
+    few iterations of its own. Most of the work happens on the small
+    levels, so far fewer iterations are needed on the full graph."""
+    V = len(positions) // 2
+    levels = []
+    while V > min_size:
+        parent, n, coarse_edges = coarsen(V, edges)
+        if n > 0.9 * V:
+            break
+        levels.append((parent, V, edges))
+        V, edges = n, coarse_edges
+
+    # Start each coarse vertex at the middle of the vertices it merges
+    pos = positions
+    for parent, fine_V, _ in levels:
+        n = max(parent) + 1
+        sums = array('d', [0.0]) * (2 * n)
+        counts = [0] * n
+        for v in range(fine_V):
+            p = parent[v]
+            sums[2*p] += pos[2*v]
+            sums[2*p + 1] += pos[2*v + 1]
+            counts[p] += 1
+        for p in range(n):
+            sums[2*p] /= counts[p]
+            sums[2*p + 1] /= counts[p]
+        pos = sums
+
+    pos = array('d', pos)
+    for _ in range(iterations):
+        step(pos, edges)
+
+    rng = Random(seed)
+    for depth, (parent, fine_V, fine_edges) in enumerate(reversed(levels)):
+        # Spread out around the middle to make room for the extra vertices,
+        # which start a little apart from the others in their group
+        n = len(pos) // 2
+        scale = math.sqrt(fine_V / n)
+        cx = sum(pos[0::2]) / n
+        cy = sum(pos[1::2]) / n
+
+        fine = array('d', [0.0]) * (2 * fine_V)
+        for v in range(fine_V):
+            p = parent[v]
+            fine[2*v] = cx + (pos[2*p] - cx) * scale + rng.uniform(-1.0, 1.0)
+            fine[2*v + 1] = cy + (pos[2*p + 1] - cy) * scale + rng.uniform(-1.0, 1.0)
+        pos = fine
+
+        if depth < len(levels) - 1:
+            for _ in range(refine):
+                step(pos, fine_edges)
+
+    return pos
@@ -1,9 +1,22 @@
+from array import array
 from functools import partial
 
 import pygame
-from pygame.locals import MOUSEBUTTONDOWN, MOUSEBUTTONUP, MOUSEMOTION, QUIT, Rect
+from pygame.locals import MOUSEBUTTONDOWN, MOUSEBUTTONUP, MOUSEMOTION, QUIT, \
+    USEREVENT, Rect
 
-from graphy.viewer import Viewer
+from graphy.viewer import Viewer, COLORS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Imported here rather than from graphy, which imports this module first
+try:
+    from fdag import draw_lines
+except ImportError:
+    draw_lines = None
 
 
 class PygameViewer(Viewer):
@@ -13,11 +26,15 @@ class PygameViewer(Viewer):
         pygame.init()
         self.window = pygame.display.set_mode((self.width, self.height))
 
+        # Surface drawn on, the window except while redrawing a region
+        self.canvas = self.window
+        self._scratch = None
+
         # Dict for translating colors from strings to RGB tuples
-        self.colors = {'blue': (0, 0, 255), 'red': (255, 0, 0),
-                       'yellow': (255, 255, 0), 'gray': (100, 100, 100),
-                       'black': (0, 0, 0), 'white': (255, 255, 255),
-                       'orange': (255, 165, 0)}
+        self.colors = dict(COLORS)
+
+        # Circles drawn by circles(), keyed by radius, colors and stroke
+        self._sprites = {}
 
         # Default values
         self.fill_col = self.colors.get('blue')
@@ -40,13 +57,13 @@ class PygameViewer(Viewer):
         x, y = self.translate(x, y)
 
         # Draw the circle fill
-        pygame.draw.circle(self.window, color, (x, y), radius)
+        pygame.draw.circle(self.canvas, color, (x, y), radius)
 
         # Draw a stroke if necessary
         if config.get('stroke_color'):
             stroke = config.get('stroke') or self.stroke
             stroke_color = self._get_color(config, 'stroke_color')
-            pygame.draw.circle(self.window, stroke_color, (x, y), radius, stroke)
+            pygame.draw.circle(self.canvas, stroke_color, (x, y), radius, stroke)
 
     def line(self, x1, y1, x2, y2, **config):
         color = self._get_color(config, 'color')
@@ -55,28 +72,150 @@ class PygameViewer(Viewer):
         x1, y1 = self.translate(x1, y1)
         x2, y2 = self.translate(x2, y2)
 
-        pygame.draw.line(self.window, color, (x1, y1), (x2, y2), stroke)
+        pygame.draw.line(self.canvas, color, (x1, y1), (x2, y2), stroke)
 
     def rect(self, x, y, width, height, **config):
         x, y = self.translate(x, y)
         color = self._get_color(config, 'color')
 
-        pygame.draw.rect(self.window, color, Rect((x, y - height), (width, height)))
+        pygame.draw.rect(self.canvas, color, Rect((x, y - height), (width, height)))
+
+    def _rgb(self, color):
+        if color:
+            return self.colors.get(color) or self.fill_col
+        return self.fill_col
+
+    def _translate_all(self, coords):
+        """translate() every x, y pair of a flat sequence, returning a flat
+        list of ints"""
+        half_w, half_h = self.width / 2, self.height / 2
+        if np is not None:
+            a = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+            out = np.empty(a.shape, dtype=np.int64)
+            out[:, 0] = a[:, 0] + half_w
+            out[:, 1] = self.height - (a[:, 1] + half_h)
+            return out.ravel().tolist()
+
+        out = [0] * len(coords)
+        for i in range(0, len(coords), 2):
+            out[i] = int(coords[i] + half_w)
+            out[i + 1] = int(self.height - (coords[i + 1] + half_h))
+        return out
+
+    def lines(self, segments, colors, **config):
+        """With the C extension every line is drawn in one call, straight
+        into the pixels of the surface. Otherwise each is a pygame call."""
+        stroke = config.get('weight') or self.stroke
+
+        canvas = self.canvas
+        if draw_lines is not None and canvas.get_bytesize() == 4:
+            n = len(segments) // 4
+            if isinstance(colors, str):
+                colors = [colors] * n
+            pixel = {c: canvas.map_rgb(self._rgb(c)) for c in set(colors)}
+            if np is not None:
+                segments = np.ascontiguousarray(segments, dtype=np.float64)
+            elif not isinstance(segments, array) or segments.typecode != 'd':
+                segments = array('d', segments)
+
+            draw_lines(canvas.get_buffer(), canvas.get_pitch() // 4,
+                       self.width, self.height, segments,
+                       array('I', map(pixel.__getitem__, colors)), stroke)
+            return
+
+        p = self._translate_all(segments)
+        n = len(p) // 4
+
+        # Look up each color once and draw its lines together
+        if isinstance(colors, str):
+            groups = {colors: range(n)}
+        else:
+            groups = {}
+            for k, color in enumerate(colors):
+                groups.setdefault(color, []).append(k)
+
+        draw_line, canvas = pygame.draw.line, self.canvas
+        for color, group in groups.items():
+            rgb = self._rgb(color)
+            for k in group:
+                k *= 4
+                draw_line(canvas, rgb, (p[k], p[k+1]), (p[k+2], p[k+3]), stroke)
+
+    def _sprite(self, radius, fill, stroke, width):
+        # Drawn around (radius + 2, radius + 2) on a transparent surface so
+        # blitting it gives the same pixels as circle()
+        c = radius + 2
+        sprite = pygame.Surface((2 * c + 1, 2 * c + 1), pygame.SRCALPHA)
+        pygame.draw.circle(sprite, self._rgb(fill), (c, c), radius)
+        if stroke:
+            pygame.draw.circle(sprite, self._rgb(stroke), (c, c), radius, width)
+        self._sprites[radius, fill, stroke, width] = sprite
+        return sprite
+
+    def circles(self, centers, radius, fill, stroke=None, **config):
+        width = config.get('weight') or self.stroke
+        p = self._translate_all(centers)
+        n = len(p) // 2
+        radii, fills, strokes = self._circle_styles(n, radius, fill, stroke)
+
+        sprites = self._sprites
+        blits = []
+        for i in range(n):
+            r = radii[i]
+            key = (r, fills[i], strokes[i], width)
+            sprite = sprites.get(key) or self._sprite(*key)
+            blits.append((sprite, (p[2*i] - r - 2, p[2*i + 1] - r - 2)))
+        self.canvas.blits(blits, doreturn=False)
+
+    regions = True
+
+    def _screen_rect(self, x, y, width, height):
+        # Pad by a pixel for the rounding in translate
+        left, top = self.translate(x, y + height)
+        return Rect(left - 1, top - 1, int(width) + 3, int(height) + 3)
+
+    def begin_region(self, x, y, width, height):
+        # Clipping a line shifts its pixels a little, so everything is drawn
+        # whole on a scratch surface and only the region copied across
+        if self._scratch is None:
+            self._scratch = self.window.copy()
+        self._region = self._screen_rect(x, y, width, height)
+        self.canvas = self._scratch
+        self.canvas.fill(self.clear_col, self._region)
+
+    def end_region(self):
+        self.window.blit(self._scratch, self._region, self._region)
+        self.canvas = self.window
 
     def clear(self):
-        self.window.fill(self.clear_col)
+        self.canvas.fill(self.clear_col)
 
-    def update(self, **kwargs):
+    def update(self, rects=None, **kwargs):
+        """Draw the buttons and show what was drawn. If rects is given, a
+        list of (x, y, width, height), only those parts of the screen are
+        updated."""
         for button in self._buttons:
             button.draw()
-        pygame.display.update()
+        if rects is None:
+            pygame.display.update()
+        else:
+            pygame.display.update([self._screen_rect(*r) for r in rects])
+
+    def set_timer(self, interval, callback):
+        super(PygameViewer, self).set_timer(interval, callback)
+        pygame.time.set_timer(USEREVENT, max(1, int(interval * 1000)))
 
     def run(self):
         while True:
             # Block until there is an event
             event = pygame.event.wait()
 
-            if event.type == MOUSEBUTTONDOWN:
+            if event.type == USEREVENT:
+                if self._timer is None or not self._timer[1]():
+                    self._timer = None
+                    pygame.time.set_timer(USEREVENT, 0)
+
+            elif event.type == MOUSEBUTTONDOWN:
                 if self._on_mouse_down is not None:
                     # Translate to -x,-y,+x,+y coordinate grid
                     x, y = self.translate_back(event.pos[0], event.pos[1])
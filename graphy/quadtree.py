@@ -0,0 +1,121 @@
+import math
+
+
+# Points closer together than the smallest cell at this depth share a leaf
+MAX_DEPTH = 32
+
+
+class QuadNode(object):
+
+    __slots__ = ('x0', 'y0', 'size', 'mass', 'cx', 'cy', 'point', 'children')
+
+    def __init__(self, x0, y0, size):
+        self.x0 = x0
+        self.y0 = y0
+        self.size = size
+        self.mass = 0
+        self.cx = 0.0
+        self.cy = 0.0
+        self.point = None     # Index of the point stored in a leaf
+        self.children = None  # [sw, se, nw, ne] once the node is split
+
+    def contains(self, x, y):
+        return self.x0 <= x < self.x0 + self.size and \
+               self.y0 <= y < self.y0 + self.size
+
+    def quadrant(self, x, y):
+        half = self.size / 2
+        return int(x >= self.x0 + half) + 2 * int(y >= self.y0 + half)
+
+    def child(self, q):
+        if self.children is None:
+            self.children = [None, None, None, None]
+        if self.children[q] is None:
+            half = self.size / 2
+            self.children[q] = QuadNode(self.x0 + half * (q & 1),
+                                        self.y0 + half * (q >> 1), half)
+        return self.children[q]
+
+
+class QuadTree(object):
+    """Barnes-Hut quadtree over a list of (x, y) points. Every node keeps
+    the number of points below it and their center of mass so that distant
+    groups of points can be treated as a single body."""
+
+    def __init__(self, points):
+        self.points = points
+
+        if points:
+            xs = [p[0] for p in points]
+            ys = [p[1] for p in points]
+            x0, y0 = min(xs), min(ys)
+            size = max(max(xs) - x0, max(ys) - y0)
+        else:
+            x0, y0, size = 0.0, 0.0, 0.0
+
+        # Pad the square so the largest coordinates fall inside it
+        self.root = QuadNode(x0, y0, size * 1.001 + 1e-9)
+
+        for i, (x, y) in enumerate(points):
+            self.insert(i, x, y)
+
+    def insert(self, i, x, y):
+        node = self.root
+        depth = 0
+        while True:
+            if node.mass == 0:
+                node.point = i
+                node.cx, node.cy = x, y
+                node.mass = 1
+                return
+
+            node.cx = (node.cx * node.mass + x) / (node.mass + 1)
+            node.cy = (node.cy * node.mass + y) / (node.mass + 1)
+            node.mass += 1
+
+            if node.children is None:
+                if depth >= MAX_DEPTH:
+                    # Coincident points stay together in one leaf
+                    node.point = None
+                    return
+                if node.point is not None:
+                    # Push the point stored here down a level
+                    old = node.point
+                    ox, oy = self.points[old]
+                    child = node.child(node.quadrant(ox, oy))
+                    child.point = old
+                    child.cx, child.cy = ox, oy
+                    child.mass = 1
+                    node.point = None
+
+            node = node.child(node.quadrant(x, y))
+            depth += 1
+
+    def force_on(self, i, theta, force):
+        """Returns the (x, y) sum of the forces acting on point i. force is a
+        function of distance giving the magnitude of the force between two
+        points. Cells whose size is less than theta times their distance
+        from the point are approximated by their center of mass."""
+        x, y = self.points[i]
+        fx = fy = 0.0
+
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.mass == 0 or node.point == i:
+                continue
+
+            dx = x - node.cx
+            dy = y - node.cy
+            d = math.sqrt(dx*dx + dy*dy)
+
+            if node.children is None or \
+               (node.size < theta * d and not node.contains(x, y)):
+                if d > 0:
+                    f = node.mass * force(d) / d
+                    fx += dx * f
+                    fy += dy * f
+            else:
+                stack.extend(c for c in node.children if c is not None)
+
+        return fx, fy
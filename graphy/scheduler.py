@@ -0,0 +1,101 @@
+import time
+
+
+class RenderScheduler(object):
+    """Decides when to draw so that drawing doesn't slow down the work it
+    shows. Frames are drawn at most fps times a second, and less often
+    when they take longer than budget of the time between them, leaving
+    the rest to the layout. Requests for a frame made before the next one
+    is due are coalesced, so only the latest is drawn.
+
+    frame_rate and iteration_rate are the frames drawn and layout
+    iterations run per second over the last second or so."""
+
+    def __init__(self, fps=30, budget=0.5, clock=time.perf_counter):
+        self.fps = fps
+        self.budget = budget
+        self.clock = clock
+
+        self.cost = 0.0     # Smoothed time taken by a frame
+
+        self._last = None
+        self._pending = None
+        self.reset()
+
+    def reset(self):
+        """Start measuring the rates again"""
+        self.frame_rate = 0.0
+        self.iteration_rate = 0.0
+        self._window = (self.clock(), 0, 0)
+
+    @property
+    def interval(self):
+        """Seconds between frames"""
+        return max(1.0 / self.fps, self.cost / self.budget)
+
+    @property
+    def pending(self):
+        return self._pending is not None
+
+    def due(self):
+        return self._last is None or self.clock() - self._last >= self.interval
+
+    def frame(self, draw, *args):
+        """Call draw(*args) if a frame is due. Returns True if it was."""
+        if not self.due():
+            return False
+
+        start = self.clock()
+        draw(*args)
+        end = self.clock()
+
+        self._last = start
+        if self.cost:
+            self.cost = 0.8 * self.cost + 0.2 * (end - start)
+        else:
+            self.cost = end - start
+        self._count(1, 0)
+        return True
+
+    def request(self, draw, *args):
+        """Call draw(*args) now if a frame is due, otherwise when flush()
+        finds one is. A later request replaces it."""
+        self._pending = (draw, args)
+        self.flush()
+
+    def flush(self, force=False):
+        """Draw the pending request if a frame is due, or now with force"""
+        if self._pending is None:
+            return
+        draw, args = self._pending
+        if force:
+            self._last = None
+        if self.frame(draw, *args):
+            self._pending = None
+
+    def computed(self, iterations=1):
+        """Count layout iterations for iteration_rate"""
+        self._count(0, iterations)
+
+    def _count(self, frames, iterations):
+        start, f, i = self._window
+        f, i = f + frames, i + iterations
+        now = self.clock()
+        if now - start >= 1.0:
+            self.frame_rate = f / (now - start)
+            self.iteration_rate = i / (now - start)
+            self._window = (now, 0, 0)
+        else:
+            self._window = (start, f, i)
+
+    def report(self):
+        """Returns the rates as text, measured over less than a second if
+        that's all there has been since reset()"""
+        frame_rate, iteration_rate = self.frame_rate, self.iteration_rate
+        start, frames, iterations = self._window
+        elapsed = self.clock() - start
+        if not frame_rate and not iteration_rate and elapsed > 0:
+            frame_rate, iteration_rate = frames / elapsed, iterations / elapsed
+
+        return "{0:.1f} fps, {1:.1f} iterations/s".format(frame_rate,
+                                                          iteration_rate)
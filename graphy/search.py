@@ -0,0 +1,178 @@
+import heapq
+
+
+def shortest_path(start, finish, edges, heuristic=None, mark=None):
+    """Dijkstra's algorithm, or A* when heuristic is given, from start to
+    finish. Returns (cost, path) with path as a list of indices from start
+    to finish, or None if finish can't be reached.
+
+    edges(v) returns an iterable of (w, cost) pairs for the neighbors of v.
+    heuristic(v) is a lower bound on the cost from v to finish; it is only
+    evaluated once per vertex. mark(v) is called on every vertex looked at.
+
+    Instead of decreasing keys, vertices are pushed again with their new
+    cost and the stale entries are skipped when they are popped."""
+
+    dist = {start: 0}
+    prev = {start: start}
+    done = set()
+
+    if heuristic is None:
+        estimate = None
+        pq = [(0, start)]
+    else:
+        estimate = {start: heuristic(start)}
+        pq = [(estimate[start], start)]
+
+    heappush, heappop = heapq.heappush, heapq.heappop
+
+    while pq:
+        _, v = heappop(pq)
+
+        if mark is not None:
+            mark(v)
+
+        if v == finish:
+            path = [finish]
+            while path[-1] != start:
+                path.append(prev[path[-1]])
+            path.reverse()
+            return dist[finish], path
+
+        # There may be duplicates in the pq so check if v has been done already
+        if v in done:
+            continue
+        done.add(v)
+
+        v_cost = dist[v]
+        for w, cost in edges(v):
+            if w in done:
+                continue
+
+            if mark is not None:
+                mark(w)
+
+            w_cost = v_cost + cost
+            if w not in dist or dist[w] > w_cost:
+                dist[w] = w_cost
+                prev[w] = v
+
+                if estimate is None:
+                    heappush(pq, (w_cost, w))
+                else:
+                    if w not in estimate:
+                        estimate[w] = heuristic(w)
+                    heappush(pq, (w_cost + estimate[w], w))
+
+    return None
+
+
+def bidirectional_shortest_path(start, finish, edges, heuristic=None, mark=None):
+    """Bidirectional version of shortest_path for undirected graphs. One
+    search grows from start and one from finish, always advancing the one
+    with the smaller key, until no path through the unsettled vertices can
+    beat the best one found where they meet. Returns (cost, path) or None.
+
+    With heuristic(v, target), a lower bound on the cost between v and
+    target, this is bidirectional A*. Both searches use the average
+    potential p(v) = (heuristic(v, finish) - heuristic(v, start)) / 2,
+    forwards and negated backwards, which keeps the reduced edge costs the
+    same in both directions so the stopping test stays correct."""
+
+    if start == finish:
+        if mark is not None:
+            mark(start)
+        return 0, [start]
+
+    potential = {}
+
+    def p(v):
+        if heuristic is None:
+            return 0
+        if v not in potential:
+            potential[v] = (heuristic(v, finish) - heuristic(v, start)) / 2
+        return potential[v]
+
+    sign = (1, -1)
+    dist = ({start: 0}, {finish: 0})
+    prev = ({start: start}, {finish: finish})
+    done = (set(), set())
+    pqs = ([(p(start), start)], [(-p(finish), finish)])
+
+    best = float('inf')
+    meet = None
+
+    heappush, heappop = heapq.heappush, heapq.heappop
+
+    while pqs[0] and pqs[1]:
+        forward_key, backward_key = pqs[0][0][0], pqs[1][0][0]
+
+        # Stale entries only make the keys smaller, so this never stops early
+        if forward_key + backward_key >= best:
+            break
+
+        side = 0 if forward_key <= backward_key else 1
+        _, v = heappop(pqs[side])
+
+        if v in done[side]:
+            continue
+        done[side].add(v)
+
+        if mark is not None:
+            mark(v)
+
+        this, other = dist[side], dist[1 - side]
+        v_cost = this[v]
+
+        for w, cost in edges(v):
+            if w in done[side]:
+                continue
+
+            if mark is not None:
+                mark(w)
+
+            w_cost = v_cost + cost
+            if w not in this or this[w] > w_cost:
+                this[w] = w_cost
+                prev[side][w] = v
+                heappush(pqs[side], (w_cost + sign[side] * p(w), w))
+
+            if w in other and this[w] + other[w] < best:
+                best = this[w] + other[w]
+                meet = w
+
+    if meet is None:
+        return None
+
+    path = [meet]
+    while path[-1] != start:
+        path.append(prev[0][path[-1]])
+    path.reverse()
+    while path[-1] != finish:
+        path.append(prev[1][path[-1]])
+
+    return best, path
+
+
+def shortest_distances(start, edges):
+    """Dijkstra's algorithm from start without a target. Returns a dict
+    mapping every vertex reachable from start to its cost."""
+    dist = {start: 0}
+    done = set()
+    pq = [(0, start)]
+
+    heappush, heappop = heapq.heappush, heapq.heappop
+
+    while pq:
+        v_cost, v = heappop(pq)
+        if v in done:
+            continue
+        done.add(v)
+
+        for w, cost in edges(v):
+            w_cost = v_cost + cost
+            if w not in dist or dist[w] > w_cost:
+                dist[w] = w_cost
+                heappush(pq, (w_cost, w))
+
+    return dist
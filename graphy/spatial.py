@@ -0,0 +1,144 @@
+import math
+
+
+def point_in_polygon(x, y, polygon):
+    """Returns True if (x, y) is inside polygon, a list of (x, y) corners,
+    by counting the edges crossed by a ray going right from the point"""
+    inside = False
+    n = len(polygon)
+    for k in range(n):
+        x1, y1 = polygon[k - 1]
+        x2, y2 = polygon[k]
+        if (y1 > y) != (y2 > y) and \
+           x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+
+def merge_rects(rects):
+    """Merge overlapping (x0, y0, x1, y1) rectangles into their bounding
+    rectangles until none of the results overlap"""
+    merged = []
+    for rect in rects:
+        x0, y0, x1, y1 = rect
+        i = 0
+        while i < len(merged):
+            a0, b0, a1, b1 = merged[i]
+            if a0 <= x1 and x0 <= a1 and b0 <= y1 and y0 <= b1:
+                # Take it out and try the grown rectangle against the rest
+                x0, y0 = min(x0, a0), min(y0, b0)
+                x1, y1 = max(x1, a1), max(y1, b1)
+                merged.pop(i)
+                i = 0
+            else:
+                i += 1
+        merged.append((x0, y0, x1, y1))
+    return merged
+
+
+class SpatialGrid(object):
+    """Uniform grid over points stored as x, y pairs in a flat sequence,
+    like DisplayGraph.positions. Each cell holds the indices of the points
+    inside it so nearby points are found without a scan of all of them."""
+
+    def __init__(self, positions=None, cell_size=None):
+        self.positions = positions
+        self.cell_size = 1.0
+        self.cells = {}
+        self.keys = []  # Cell of every point, for move()
+
+        if positions is not None:
+            self.rebuild(positions, cell_size)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _key(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def rebuild(self, positions, cell_size=None):
+        """Index every point in positions. Without a cell_size, cells are
+        sized for a few points each on average."""
+        n = len(positions) // 2
+        self.positions = positions
+
+        if cell_size is None:
+            cell_size = 1.0
+            if n:
+                xs, ys = positions[0::2], positions[1::2]
+                span = max(max(xs) - min(xs), max(ys) - min(ys))
+                cell_size = max(2 * span / math.sqrt(n), 1.0)
+        self.cell_size = cell_size
+
+        self.cells = {}
+        self.keys = []
+        for i in range(n):
+            key = self._key(positions[2 * i], positions[2 * i + 1])
+            self.cells.setdefault(key, []).append(i)
+            self.keys.append(key)
+
+    def add(self):
+        """Index the point just appended to positions"""
+        i = len(self.keys)
+        key = self._key(self.positions[2 * i], self.positions[2 * i + 1])
+        self.cells.setdefault(key, []).append(i)
+        self.keys.append(key)
+
+    def move(self, i):
+        """Update the cell of point i after its position changed"""
+        key = self._key(self.positions[2 * i], self.positions[2 * i + 1])
+        old = self.keys[i]
+        if key != old:
+            cell = self.cells[old]
+            cell.remove(i)
+            if not cell:
+                del self.cells[old]
+            self.cells.setdefault(key, []).append(i)
+            self.keys[i] = key
+
+    def _candidates(self, x0, y0, x1, y1):
+        """Indices of the points in every cell overlapping the rectangle"""
+        cx0, cy0 = self._key(x0, y0)
+        cx1, cy1 = self._key(x1, y1)
+
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self.cells):
+            # Cheaper to look at the cells that exist
+            for (cx, cy), cell in self.cells.items():
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+                    yield from cell
+            return
+
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                cell = self.cells.get((cx, cy))
+                if cell is not None:
+                    yield from cell
+
+    def within(self, x, y, radius):
+        """Returns the sorted indices of the points at most radius from (x, y)"""
+        pos = self.positions
+        r2 = radius * radius
+        return sorted(i for i in self._candidates(x - radius, y - radius,
+                                                  x + radius, y + radius)
+                      if (pos[2 * i] - x)**2 + (pos[2 * i + 1] - y)**2 <= r2)
+
+    def in_rect(self, x0, y0, x1, y1):
+        """Returns the sorted indices of the points inside the rectangle with
+        corners (x0, y0) and (x1, y1)"""
+        x0, x1 = min(x0, x1), max(x0, x1)
+        y0, y1 = min(y0, y1), max(y0, y1)
+        pos = self.positions
+        return sorted(i for i in self._candidates(x0, y0, x1, y1)
+                      if x0 <= pos[2 * i] <= x1 and y0 <= pos[2 * i + 1] <= y1)
+
+    def in_polygon(self, polygon):
+        """Returns the sorted indices of the points inside polygon, a list of
+        (x, y) corners such as the path of a lasso"""
+        if len(polygon) < 3:
+            return []
+        xs = [p[0] for p in polygon]
+        ys = [p[1] for p in polygon]
+        pos = self.positions
+        return sorted(i for i in self._candidates(min(xs), min(ys),
+                                                  max(xs), max(ys))
+                      if point_in_polygon(pos[2 * i], pos[2 * i + 1], polygon))
@@ -20,6 +20,10 @@ class TurtleViewer(Viewer):
         c.bind("<B1-Motion>", self.on_mouse_drag)
         c.bind("<ButtonRelease-1>", self.on_mouse_up)
 
+        # lines() and circles() draw on the canvas directly, which is much
+        # faster than moving the turtle, and tag what they draw for clear()
+        self.canvas = c
+
         # Default values
         self.fill_col = 'blue'
         self.stroke_col = 'black'
@@ -52,8 +56,33 @@ class TurtleViewer(Viewer):
         self.t.down()
         self.t.setpos(x2, y2)
 
+    def lines(self, segments, colors, **config):
+        weight = config.get('weight') or self.stroke
+        if isinstance(colors, str):
+            colors = [colors] * (len(segments) // 4)
+
+        create_line = self.canvas.create_line
+        for k, color in enumerate(colors):
+            x1, y1, x2, y2 = segments[4*k:4*k + 4]
+            # Canvas y points down
+            create_line(x1, -y1, x2, -y2, fill=color or self.stroke_col,
+                        width=weight, tags='batch')
+
+    def circles(self, centers, radius, fill, stroke=None, **config):
+        width = config.get('weight') or self.stroke
+        n = len(centers) // 2
+        radii, fills, strokes = self._circle_styles(n, radius, fill, stroke)
+
+        create_oval = self.canvas.create_oval
+        for i in range(n):
+            x, y, r = centers[2*i], -centers[2*i + 1], radii[i]
+            create_oval(x - r, y - r, x + r, y + r,
+                        fill=fills[i] or self.fill_col,
+                        outline=strokes[i] or '', width=width, tags='batch')
+
     def clear(self):
         self.t.clear()
+        self.canvas.delete('batch')
 
     def update(self, draw_buttons=True):
         if draw_buttons:
@@ -61,6 +90,17 @@ class TurtleViewer(Viewer):
                 button.draw()
         self.window.update()
 
+    def set_timer(self, interval, callback):
+        super(TurtleViewer, self).set_timer(interval, callback)
+        timer = self._timer
+        ms = max(1, int(interval * 1000))
+
+        def tick():
+            # Stop if set_timer was called again
+            if self._timer is timer and callback():
+                self.window.ontimer(tick, ms)
+        self.window.ontimer(tick, ms)
+
     def run(self):
         self.t.getscreen()._root.mainloop()
 
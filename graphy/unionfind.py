@@ -0,0 +1,54 @@
+class UnionFind(object):
+    """Disjoint sets over the integers 0..n-1, with union by size and path
+    halving so any sequence of operations runs in near linear time."""
+
+    def __init__(self, n=0):
+        self.parent = list(range(n))
+        self.size = [1] * n
+        self.count = n  # Number of separate sets
+
+    def __len__(self):
+        return len(self.parent)
+
+    def add(self):
+        """Add a new singleton set and return its element"""
+        i = len(self.parent)
+        self.parent.append(i)
+        self.size.append(1)
+        self.count += 1
+        return i
+
+    def find(self, i):
+        """Returns the representative of the set containing i"""
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        """Merge the sets containing i and j. Returns False if they were
+        already the same set."""
+        i, j = self.find(i), self.find(j)
+        if i == j:
+            return False
+        if self.size[i] < self.size[j]:
+            i, j = j, i
+        self.parent[j] = i
+        self.size[i] += self.size[j]
+        self.count -= 1
+        return True
+
+    def connected(self, i, j):
+        return self.find(i) == self.find(j)
+
+    def set_size(self, i):
+        """Returns the number of elements in the set containing i"""
+        return self.size[self.find(i)]
+
+    def copy(self):
+        new = UnionFind()
+        new.parent = self.parent[:]
+        new.size = self.size[:]
+        new.count = self.count
+        return new
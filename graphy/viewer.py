@@ -1,6 +1,13 @@
 from abc import ABCMeta, abstractmethod
 
 
+# RGB values of the color names used by DisplayGraph
+COLORS = {'blue': (0, 0, 255), 'red': (255, 0, 0),
+          'yellow': (255, 255, 0), 'gray': (100, 100, 100),
+          'black': (0, 0, 0), 'white': (255, 255, 255),
+          'orange': (255, 165, 0)}
+
+
 class Viewer(object, metaclass=ABCMeta):
     """Abstract base class for drawing primitives, managing buttons,
     and handling mouse events."""
@@ -16,6 +23,7 @@ class Viewer(object, metaclass=ABCMeta):
         self._on_mouse_drag = on_mouse_drag
 
         self._buttons = []
+        self._timer = None
 
     @abstractmethod
     def circle(self, x, y, radius, **config):
@@ -27,6 +35,43 @@ class Viewer(object, metaclass=ABCMeta):
         """Draw a line from (x1, y1) to (x2, y2)"""
         pass
 
+    def lines(self, segments, colors, **config):
+        """Draw many lines at once. segments holds x1, y1, x2, y2 for each
+        line one after the other, and colors is either one color for all
+        of them or a sequence with a color for each line."""
+        if isinstance(colors, str):
+            colors = [colors] * (len(segments) // 4)
+        for k, color in enumerate(colors):
+            x1, y1, x2, y2 = segments[4*k:4*k + 4]
+            self.line(x1, y1, x2, y2, color=color, **config)
+
+    def circles(self, centers, radius, fill, stroke=None, **config):
+        """Draw many circles at once. centers holds x, y for each circle one
+        after the other. radius, fill and stroke (the stroke color, None for
+        no stroke) are each either one value for all of them or a sequence
+        with a value for each circle. The stroke width is passed as weight,
+        like the width of lines(), since stroke is taken."""
+        n = len(centers) // 2
+        radii, fills, strokes = self._circle_styles(n, radius, fill, stroke)
+        weight = config.pop('weight', None)
+        if weight:
+            config['stroke'] = weight
+        for i in range(n):
+            self.circle(centers[2*i], centers[2*i + 1], radii[i], color=fills[i],
+                        stroke_color=strokes[i], **config)
+
+    @staticmethod
+    def _circle_styles(n, radius, fill, stroke):
+        """The radius, fill and stroke arguments of circles() as lists of n
+        values each"""
+        radii = [radius] * n if isinstance(radius, (int, float)) \
+            else list(radius)
+        fills = [fill] * n if isinstance(fill, str) or fill is None \
+            else list(fill)
+        strokes = [stroke] * n if isinstance(stroke, str) or stroke is None \
+            else list(stroke)
+        return radii, fills, strokes
+
     @abstractmethod
     def clear(self):
         """Clear the window"""
@@ -37,6 +82,33 @@ class Viewer(object, metaclass=ABCMeta):
         """Update the window"""
         pass
 
+    # Whether begin_region, end_region and update(rects=...) can redraw part
+    # of the window. If not, only full redraws work.
+    regions = False
+
+    # Whether frames shown while animating should be limited to what the
+    # frame rate allows. Viewers that pick their own frames turn it off.
+    throttle = True
+
+    def skip_frame(self):
+        """Returns True if the next frame of an animation, such as the layout
+        in DisplayGraph.display(), can be left undrawn"""
+        return False
+
+    def set_timer(self, interval, callback):
+        """Have the event loop call callback every interval seconds, between
+        events, until it returns False. Replaces any earlier timer."""
+        self._timer = (interval, callback)
+
+    def begin_region(self, x, y, width, height):
+        """Start redrawing the rectangle with bottom left corner (x, y). It is
+        cleared, and drawing until end_region() only changes pixels inside
+        it."""
+        pass
+
+    def end_region(self):
+        pass
+
     @abstractmethod
     def run():
         """Start the event loop"""
@@ -0,0 +1,97 @@
+import argparse
+from collections import namedtuple
+from contextlib import redirect_stdout
+from io import StringIO
+from queue import PriorityQueue
+from random import random, randrange, seed
+from timeit import timeit
+
+from graphy.graph import random_graph
+
+
+def priority_queue_dijkstra(graph, start, finish):
+    """The queue.PriorityQueue based search Graph.dijkstra used to run, kept
+    here as a baseline."""
+    Data = namedtuple('Data', ['cost', 'prev'])
+
+    seen = {start: Data(0, start)}
+    done = set()
+
+    pq = PriorityQueue()
+    pq.put((0, start))
+
+    while not pq.empty():
+        cost, v = pq.get()
+
+        graph.vertices[v].marked = True
+
+        if v == finish:
+            return seen[finish].cost
+
+        if v in done:
+            continue
+
+        for w in graph.vertices[v]:
+            if w not in done:
+
+                graph.vertices[w].marked = True
+
+                w_cost = seen.get(v).cost + graph.vertices[v].cost_to(graph.vertices[w])
+
+                if w not in seen or seen.get(w).cost > w_cost:
+                    seen[w] = Data(w_cost, v)
+                    pq.put((w_cost, w))
+
+        done.add(v)
+
+
+def heapq_dijkstra(graph, start, finish):
+    """Graph.dijkstra marking the vertices it visits, like the baseline"""
+    return graph.dijkstra(start, finish)
+
+
+def heapq_dijkstra_unmarked(graph, start, finish):
+    return graph.dijkstra(start, finish, mark=False)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Shortest path benchmarks")
+
+    parser.add_argument("-v", "--vertices", type=int, default=20000, help="Number of vertices in graph")
+    parser.add_argument("-e", "--edges", type=int, default=60000, help="Number of edges in graph")
+    parser.add_argument("-q", "--queries", type=int, default=20, help="Number of random queries to time")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Seed for the graph and queries")
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+
+    seed(args.seed)
+    graph = random_graph(V=args.vertices, E=args.edges, connected=True)
+    for v in graph.vertices:
+        v.x, v.y = random() * 1000, random() * 1000
+
+    queries = [(randrange(args.vertices), randrange(args.vertices))
+               for _ in range(args.queries)]
+
+    results = {}
+    for name, search in [('queue.PriorityQueue', priority_queue_dijkstra),
+                         ('heapq', heapq_dijkstra),
+                         ('heapq, mark=False', heapq_dijkstra_unmarked)]:
+        # Start every search without the edge costs an earlier one cached
+        graph.clear_weights()
+
+        # Graph.dijkstra prints every path cost
+        with redirect_stdout(StringIO()):
+            time = timeit(lambda: [search(graph, a, b) for a, b in queries], number=1)
+        results[name] = time
+
+    for name, time in results.items():
+        print("{0:20} {1:8.3f}s {2:8.1f} queries/s".format(name, time, len(queries) / time))
+
+    baseline = results['queue.PriorityQueue']
+    print("Speedup: {0:.2f}x, {1:.2f}x with mark=False".format(
+        baseline / results['heapq'], baseline / results['heapq, mark=False']))
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from graphy import generators
+from graphy.graph import random_graph
+
+
+def placed(graph, seed):
+    """Give every vertex of graph seeded random coordinates"""
+    rng = random.Random(seed)
+    for v in graph.vertices:
+        v.x, v.y = rng.random() * 1000, rng.random() * 1000
+    return graph
+
+
+GRAPHS = {
+    'random': lambda: placed(random_graph(V=200, E=400, connected=True,
+                                          seed=1), 1),
+    # A large component and some small ones
+    'disconnected': lambda: placed(random_graph(V=200, E=240, seed=2), 2),
+    # Every edge costs 1, so there are lots of ties
+    'grid': lambda: generators.grid(12, 15).to_compact().to_graph(),
+}
+
+
+@pytest.fixture(params=sorted(GRAPHS))
+def graph(request):
+    return GRAPHS[request.param]()
+
+
+@pytest.fixture
+def queries(graph):
+    """Seeded (start, finish) pairs, with one start == finish and, if the
+    graph has more than one component, one pair that can't be joined"""
+    rng = random.Random(0)
+    V = len(graph.vertices)
+    pairs = [(rng.randrange(V), rng.randrange(V)) for _ in range(40)]
+    pairs.append((pairs[0][0], pairs[0][0]))
+
+    component = graph.connected_component(0) | {0}
+    outside = [v for v in range(V) if v not in component]
+    if outside:
+        pairs.append((0, outside[0]))
+    return pairs
+
+
+def check_path(graph, result, expected):
+    """Assert result, a (cost, path) pair from a search, is a real path of
+    the same cost as expected, or None like it"""
+    if expected is None:
+        assert result is None
+        return
+
+    cost, path = result
+    assert cost == pytest.approx(expected[0])
+    assert path[0] == expected[1][0] and path[-1] == expected[1][-1]
+
+    total = 0
+    for v, w in zip(path, path[1:]):
+        assert w in graph.vertices[v]
+        total += graph.vertices[v].cost_to(graph.vertices[w])
+    assert total == pytest.approx(cost)
@@ -0,0 +1,47 @@
+import pytest
+
+from graphy.hierarchy import ContractionHierarchy
+from graphy.search import shortest_path
+
+from conftest import check_path
+
+
+def test_shortest_path(graph, queries):
+    hierarchy = ContractionHierarchy.build(graph)
+    for start, finish in queries:
+        expected = shortest_path(start, finish, graph.edges)
+        check_path(graph, hierarchy.shortest_path(start, finish), expected)
+
+
+def test_dijkstra_uses_hierarchy(graph, queries):
+    expected = [shortest_path(start, finish, graph.edges)
+                for start, finish in queries]
+
+    graph.build_hierarchy()
+    for (start, finish), cost_path in zip(queries, expected):
+        path = graph.dijkstra(start, finish, mark=False)
+        if cost_path is None:
+            assert path is None
+            continue
+
+        path = list(path)
+        vertices = graph.vertices
+        cost = sum(vertices[v].cost_to(vertices[w])
+                   for v, w in zip(path, path[1:]))
+        check_path(graph, (cost, path), cost_path)
+
+
+def test_save_load(graph, queries, tmp_path):
+    hierarchy = ContractionHierarchy.build(graph)
+    path = str(tmp_path / 'hierarchy')
+    hierarchy.save(path)
+
+    loaded = ContractionHierarchy.load(path, graph)
+    for start, finish in queries:
+        assert loaded.shortest_path(start, finish) == \
+            hierarchy.shortest_path(start, finish)
+
+    graph.vertices[0].x += 1
+    graph.clear_weights()
+    with pytest.raises(ValueError):
+        ContractionHierarchy.load(path, graph)
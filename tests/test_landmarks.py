@@ -0,0 +1,53 @@
+import pytest
+
+from graphy.landmarks import LandmarkIndex
+from graphy.search import shortest_path, bidirectional_shortest_path
+
+from conftest import check_path
+
+
+def test_lower_bound(graph, queries):
+    index = LandmarkIndex.build(graph, k=4, processes=1)
+    for start, finish in queries:
+        expected = shortest_path(start, finish, graph.edges)
+        bound = index.lower_bound(start, finish)
+        if expected is not None:
+            assert bound <= expected[0] + 1e-9
+        assert index.heuristic(finish)(start) == bound
+
+
+def test_a_star(graph, queries):
+    graph.build_landmarks(k=4, processes=1)
+    for start, finish in queries:
+        expected = shortest_path(start, finish, graph.edges)
+        result = shortest_path(start, finish, graph.edges,
+                               graph._heuristic(finish))
+        check_path(graph, result, expected)
+
+
+def test_bidirectional_a_star(graph, queries):
+    graph.build_landmarks(k=4, processes=1)
+    for start, finish in queries:
+        bounds = {start: graph._heuristic(start),
+                  finish: graph._heuristic(finish)}
+        heuristic = lambda v, target: bounds[target](v)
+
+        expected = shortest_path(start, finish, graph.edges)
+        result = bidirectional_shortest_path(start, finish, graph.edges,
+                                             heuristic)
+        check_path(graph, result, expected)
+
+
+def test_save_load(graph, tmp_path):
+    index = LandmarkIndex.build(graph, k=4, processes=1)
+    path = str(tmp_path / 'landmarks')
+    index.save(path)
+
+    loaded = LandmarkIndex.load(path, graph)
+    assert loaded.landmarks == index.landmarks
+    assert loaded.rows == index.rows
+
+    graph.vertices[0].x += 1
+    graph.clear_weights()
+    with pytest.raises(ValueError):
+        LandmarkIndex.load(path, graph)
@@ -0,0 +1,47 @@
+import pytest
+
+from graphy import np, step
+from graphy.displaygraph import DisplayGraph
+from graphy.graph import random_graph
+from graphy.headless_viewer import HeadlessViewer
+
+
+# Largest difference allowed between backends after ITERATIONS, in pixels.
+# They only differ by the order floating point sums are done in
+TOLERANCE = 1e-6
+ITERATIONS = 5
+
+
+def positions(update_algo):
+    graph = random_graph(V=40, E=70, connected=True, seed=5)
+    dg = DisplayGraph(graph, viewer=HeadlessViewer, update_algo=update_algo)
+    for _ in range(ITERATIONS):
+        dg.update()
+    return list(dg.positions)
+
+
+def assert_close(a, b):
+    assert max(abs(x - y) for x, y in zip(a, b)) < TOLERANCE
+
+
+@pytest.mark.skipif(np is None, reason="needs numpy")
+def test_numpy_matches_python():
+    assert_close(positions('numpy_update'), positions('python_update'))
+
+
+@pytest.mark.skipif(step is None, reason="needs the fdag C extension")
+def test_c_matches_python():
+    assert_close(positions('c_update'), positions('python_update'))
+
+
+@pytest.mark.skipif(step is None, reason="needs the fdag C extension")
+def test_c_bh_matches_python_bh():
+    assert_close(positions('c_bh_update'), positions('python_bh_update'))
+
+
+def test_layout_moves_vertices():
+    graph = random_graph(V=40, E=70, connected=True, seed=5)
+    dg = DisplayGraph(graph, viewer=HeadlessViewer)
+    start = list(dg.positions)
+    dg.update()
+    assert list(dg.positions) != start
@@ -0,0 +1,46 @@
+from graphy.search import shortest_path, bidirectional_shortest_path
+
+from conftest import check_path
+
+
+def test_bidirectional_dijkstra(graph, queries):
+    for start, finish in queries:
+        expected = shortest_path(start, finish, graph.edges)
+        result = bidirectional_shortest_path(start, finish, graph.edges)
+        check_path(graph, result, expected)
+
+
+def test_bidirectional_a_star(graph, queries):
+    vertices = graph.vertices
+    heuristic = lambda v, target: vertices[v].cost_to(vertices[target])
+
+    for start, finish in queries:
+        expected = shortest_path(start, finish, graph.edges)
+        result = bidirectional_shortest_path(start, finish, graph.edges,
+                                             heuristic)
+        check_path(graph, result, expected)
+
+
+def test_a_star(graph, queries):
+    vertices = graph.vertices
+    for start, finish in queries:
+        heuristic = lambda v: vertices[v].cost_to(vertices[finish])
+        expected = shortest_path(start, finish, graph.edges)
+        result = shortest_path(start, finish, graph.edges, heuristic)
+        check_path(graph, result, expected)
+
+
+def test_start_is_finish(graph):
+    assert shortest_path(5, 5, graph.edges) == (0, [5])
+    assert bidirectional_shortest_path(5, 5, graph.edges) == (0, [5])
+
+
+def test_unreachable():
+    # Two triangles
+    edges = {0: [(1, 1.0), (2, 1.0)], 1: [(0, 1.0), (2, 1.0)],
+             2: [(0, 1.0), (1, 1.0)], 3: [(4, 1.0), (5, 1.0)],
+             4: [(3, 1.0), (5, 1.0)], 5: [(3, 1.0), (4, 1.0)]}
+    assert shortest_path(0, 4, edges.get) is None
+    assert bidirectional_shortest_path(0, 4, edges.get) is None
+    assert bidirectional_shortest_path(0, 4, edges.get,
+                                       lambda v, target: 0.0) is None
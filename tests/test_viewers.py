@@ -0,0 +1,114 @@
+import pytest
+
+from graphy.headless_viewer import HeadlessViewer
+from graphy.viewer import Viewer
+
+
+@pytest.fixture
+def viewer():
+    return HeadlessViewer(100, 100)
+
+
+def test_circle_config(viewer, tmp_path):
+    # Every key the pygame and turtle viewers take
+    viewer.circle(10, 10, 5, color='red', stroke_color='black', stroke=3)
+    viewer.circle(-10, -10, 4, color='blue')
+    viewer.circle(0, 0, 6)
+
+    assert viewer._batches == [
+        ('circles', [10.0, 10.0], [5], ['red'], ['black'], 3),
+        ('circles', [-10.0, -10.0], [4], ['blue'], [None], 2),
+        ('circles', [0.0, 0.0], [6], [None], [None], 2)]
+
+    viewer.save(str(tmp_path / 'circles.png'))
+    viewer.save(str(tmp_path / 'circles.svg'))
+
+
+def test_line_config(viewer, tmp_path):
+    viewer.line(-20, 0, 20, 5, color='red', weight=4)
+    viewer.line(0, -20, 0, 20)
+
+    assert viewer._batches == [
+        ('lines', [-20.0, 0.0, 20.0, 5.0], ['red'], 4),
+        ('lines', [0.0, -20.0, 0.0, 20.0], ['gray'], 2)]
+
+    viewer.save(str(tmp_path / 'lines.png'))
+    viewer.save(str(tmp_path / 'lines.svg'))
+
+
+def test_render_pixels(viewer):
+    viewer.circle(0, 0, 5, color='red', stroke_color='black', stroke=2)
+    pixels = viewer.render()
+
+    def at(x, y):
+        i = 3 * (y * viewer.width + x)
+        return tuple(pixels[i:i + 3])
+
+    assert at(50, 50) == (255, 0, 0)
+    assert at(45, 50) == (0, 0, 0)
+    assert at(0, 0) == (255, 255, 255)
+
+
+def test_circles_weight(viewer):
+    viewer.circles([0, 0, 10, 10], 5, 'red', 'black', weight=3)
+    assert viewer._batches[-1][-1] == 3
+
+
+def test_base_circles_passes_weight_to_circle():
+    drawn = []
+
+    class Recorder(HeadlessViewer):
+        circles = Viewer.circles
+
+        def circle(self, x, y, radius, **config):
+            drawn.append(config)
+
+    Recorder(100, 100).circles([0, 0], 5, 'red', 'black', weight=3)
+    assert drawn == [{'color': 'red', 'stroke_color': 'black', 'stroke': 3}]
+
+
+def test_pygame_config(monkeypatch):
+    monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+    pygame_viewer = pytest.importorskip('graphy.pygame_viewer')
+
+    viewer = pygame_viewer.PygameViewer(100, 100)
+    viewer.circle(10, 10, 5, color='red', stroke_color='black', stroke=3)
+    viewer.line(-20, 0, 20, 5, color='red', weight=4)
+    viewer.circles([0, 0, 10, 10], 5, 'red', 'black', weight=3)
+    viewer.lines([-20, 0, 20, 5, 0, -20, 0, 20], ['red', 'gray'], weight=4)
+
+
+def test_pygame_batched_lines(monkeypatch):
+    monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+    pygame_viewer = pytest.importorskip('graphy.pygame_viewer')
+    if pygame_viewer.draw_lines is None:
+        pytest.skip("needs the fdag C extension")
+    import pygame
+
+    draw_lines = pygame_viewer.draw_lines
+    segments = [-40, -30, 45, 20, 0, -45, 0, 45, -45, 10, 45, 10,
+                40, 40, 40, 40]
+    colors = ['red', 'gray', 'blue', 'black']
+
+    def ink(viewer):
+        return pygame.surfarray.array3d(viewer.window).sum(axis=2) < 765
+
+    def draw(batched):
+        monkeypatch.setattr(pygame_viewer, 'draw_lines',
+                            draw_lines if batched else None)
+        viewer = pygame_viewer.PygameViewer(100, 100)
+        viewer.clear()
+        viewer.lines(segments, colors, weight=2)
+        return ink(viewer)
+
+    single, batched = draw(False), draw(True)
+    assert batched.sum() > 0
+    # The two only round thick lines differently at the edges
+    assert (batched ^ single).sum() < 0.1 * single.sum()
+
+    # Lines running far off screen are clipped, and bad ones skipped
+    viewer = pygame_viewer.PygameViewer(100, 100)
+    viewer.clear()
+    viewer.lines([-1e12, 0, 1e12, 0, 5e11, 5e11, 6e11, 6e11,
+                  float('nan'), 0, 10, 10], 'black', weight=1)
+    assert ink(viewer).sum() == 100